@@ -0,0 +1,155 @@
+# app/api/ai/backends.py
+import asyncio
+import hashlib
+import random
+import openai
+from openai import AsyncOpenAI
+from app.config import settings
+
+
+class LLMBackendError(Exception):
+    """Raised when a backend fails to produce a completion."""
+
+
+class LLMRateLimitError(LLMBackendError):
+    """Raised when the upstream service rejects a call because of rate limits (HTTP 429)."""
+
+
+class LLMTransientError(LLMBackendError):
+    """Raised for upstream failures that are worth retrying (timeouts, dropped connections, 5xx)."""
+
+
+class LLMBackend:
+    """Interface for chat completion backends.
+
+    ``messages`` is a list of ``{"role": ..., "content": ...}`` dicts in the OpenAI chat format.
+    """
+
+    name = "base"
+
+    async def complete(self, messages: list, model: str, max_tokens: int, temperature: float) -> str:
+        """Returns the full reply for a chat."""
+        raise NotImplementedError
+
+    def stream(self, messages: list, model: str, max_tokens: int, temperature: float):
+        """Returns an async iterator over the reply for a chat, token by token."""
+        raise NotImplementedError
+
+
+class OpenAIBackend(LLMBackend):
+    """Backend that calls the OpenAI chat completions API."""
+
+    name = "openai"
+
+    def __init__(self, api_key: str):
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY environment variable not set.")
+        # The limiter retries rate-limited calls itself; SDK retries would multiply them
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0)
+
+    async def complete(self, messages, model, max_tokens, temperature):
+        try:
+            response = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+        except openai.RateLimitError as e:
+            raise LLMRateLimitError(str(e)) from e
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            raise LLMTransientError(str(e)) from e
+        return response.choices[0].message.content.strip()
+
+    async def stream(self, messages, model, max_tokens, temperature):
+        try:
+            stream = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True
+            )
+        except openai.RateLimitError as e:
+            raise LLMRateLimitError(str(e)) from e
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            raise LLMTransientError(str(e)) from e
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                yield token
+
+
+STUB_VOCABULARY = (
+    "the", "assistant", "will", "look", "into", "that", "request", "and", "follow", "up",
+    "with", "a", "short", "summary", "of", "next", "steps", "for", "you", "today",
+)
+
+
+class StubBackend(LLMBackend):
+    """Deterministic in-process backend for offline load and regression tests.
+
+    Replies depend only on the messages, so identical chats always get the same text.
+    Latency, token rate and the share of failing or rate-limited calls are configurable.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms: int, tokens_per_second: float, failure_rate: float, reply_tokens: int,
+                 rate_limit_rate: float = 0):
+        self.latency = latency_ms / 1000
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.reply_tokens = reply_tokens
+
+    def _reply_tokens(self, messages, max_tokens):
+        digest = hashlib.sha256(repr(messages).encode()).digest()
+        rng = random.Random(digest)
+        count = min(max_tokens, self.reply_tokens)
+        return [rng.choice(STUB_VOCABULARY) + " " for _ in range(count)]
+
+    async def _start(self):
+        await asyncio.sleep(self.latency)
+        if self.rate_limit_rate and random.random() < self.rate_limit_rate:
+            raise LLMRateLimitError("Injected stub rate limit.")
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise LLMBackendError("Injected stub backend failure.")
+
+    async def complete(self, messages, model, max_tokens, temperature):
+        await self._start()
+        tokens = self._reply_tokens(messages, max_tokens)
+        if self.tokens_per_second:
+            await asyncio.sleep(len(tokens) / self.tokens_per_second)
+        return "".join(tokens).strip()
+
+    async def stream(self, messages, model, max_tokens, temperature):
+        await self._start()
+        for token in self._reply_tokens(messages, max_tokens):
+            if self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield token
+
+
+_backend = None
+
+
+def get_backend() -> LLMBackend:
+    """Returns the process-wide backend selected by LLM_BACKEND, creating it on first use."""
+    global _backend
+    if _backend is None:
+        if settings.LLM_BACKEND == "stub":
+            _backend = StubBackend(
+                latency_ms=settings.STUB_LATENCY_MS,
+                tokens_per_second=settings.STUB_TOKENS_PER_SECOND,
+                failure_rate=settings.STUB_FAILURE_RATE,
+                reply_tokens=settings.STUB_REPLY_TOKENS,
+                rate_limit_rate=settings.STUB_RATE_LIMIT_RATE,
+            )
+        elif settings.LLM_BACKEND == "openai":
+            _backend = OpenAIBackend(settings.OPENAI_API_KEY)
+        else:
+            raise ValueError(f"Unknown LLM_BACKEND: {settings.LLM_BACKEND}")
+    return _backend
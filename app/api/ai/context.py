@@ -0,0 +1,117 @@
+# app/api/ai/context.py
+import logging
+from collections import deque
+from uuid import UUID
+from cachetools import LRUCache
+from app.config import settings
+from .conversations.service import get_conversation_messages
+
+try:
+    import tiktoken
+except ImportError:  # Installed from requirements.txt; without it token counts are estimated from characters
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Tokens the chat format adds around every message (role, separators)
+MESSAGE_TOKEN_OVERHEAD = 4
+# How many of the most recent messages to consider when a conversation is first seen
+CONTEXT_SEED_LIMIT = 200
+
+_encodings = {}
+_warned_estimate = False
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Counts the tokens in a piece of text for the given model."""
+    if tiktoken is None:
+        global _warned_estimate
+        if not _warned_estimate:
+            logger.warning("tiktoken is not installed; estimating token counts from text length")
+            _warned_estimate = True
+        return len(text) // 4 + 1
+    encoding = _encodings.get(model)
+    if encoding is None:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        _encodings[model] = encoding
+    return len(encoding.encode(text))
+
+
+def get_token_budget(model: str) -> int:
+    """Returns the history token budget configured for a model."""
+    return settings.CONTEXT_TOKEN_BUDGETS.get(model, settings.CONTEXT_TOKEN_BUDGET)
+
+
+class ConversationContext:
+    """Sliding window over a conversation's messages that stays inside a token budget.
+
+    Each message is counted once when it is appended; the oldest messages are
+    dropped as soon as the window goes over budget.
+    """
+
+    def __init__(self, model: str, budget: int):
+        self.model = model
+        self.budget = budget
+        self.messages = deque()  # (message_id, role, content, tokens)
+        self.message_ids = set()
+        self.total_tokens = 0
+        self.last_message_id = None  # the message appended last, i.e. the newest one
+        self.history_length = 0  # messages of the conversation history this window has been built from
+
+    def append(self, message_id: int, role: str, content: str):
+        """Adds a message to the window, ignoring messages that are already in it."""
+        if message_id in self.message_ids:
+            return
+        tokens = count_tokens(content, self.model) + MESSAGE_TOKEN_OVERHEAD
+        self.messages.append((message_id, role, content, tokens))
+        self.message_ids.add(message_id)
+        self.total_tokens += tokens
+        self.last_message_id = message_id
+        while self.total_tokens > self.budget and self.messages:
+            dropped_id, _, _, dropped = self.messages.popleft()
+            self.message_ids.discard(dropped_id)
+            self.total_tokens -= dropped
+
+    def to_chat_messages(self) -> list:
+        """Returns the window as role-tagged chat messages.
+
+        Assistant replies are stored under the persona's name, so every role other
+        than "user" is sent as "assistant".
+        """
+        return [
+            {"role": "user" if role == "user" else "assistant", "content": content}
+            for _, role, content, _ in self.messages
+        ]
+
+
+_contexts = LRUCache(maxsize=settings.CONTEXT_CACHE_SIZE)
+
+
+def invalidate_context(conversation_id: UUID):
+    """Drops a conversation's cached windows, for every model."""
+    for key in [key for key in _contexts if str(key[0]) == str(conversation_id)]:
+        _contexts.pop(key, None)
+
+
+async def load_context(db, conversation_id: UUID, model: str) -> ConversationContext:
+    """Returns the context window for a conversation, adding only messages it has not seen yet.
+
+    A window is only extended when the history has grown at the end since it was built,
+    i.e. the message it saw last is still at the same position; any other change
+    (another worker's import, an archive restore) rebuilds it. Message ids are not
+    compared by size, since imported messages can be older than their ids suggest.
+    """
+    messages = await get_conversation_messages(db, conversation_id)
+    context = _contexts.get((conversation_id, model))
+    start = context.history_length if context is not None else 0
+    if context is None or start > len(messages) or (start and messages[start - 1]["id"] != context.last_message_id):
+        context = ConversationContext(model, get_token_budget(model))
+        _contexts[(conversation_id, model)] = context
+        start = 0
+    for message in messages[max(start, len(messages) - CONTEXT_SEED_LIMIT):]:
+        context.append(message["id"], message["role"], message["content"])
+    context.history_length = len(messages)
+    return context
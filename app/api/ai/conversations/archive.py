@@ -0,0 +1,228 @@
+# app/api/ai/conversations/archive.py
+import asyncio
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import delete, exists, func, insert, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
+from app.config import settings
+from app.database import async_session, engine
+from .cache import history_cache
+from .models import Conversation, Message, MessageArchive
+from .partitions import create_message_partitions, drop_empty_partitions, month_start, utc_now
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock keys, so only one worker at a time runs each maintenance step
+PARTITION_LOCK_ID = 7140001
+ARCHIVE_LOCK_ID = 7140002
+# Characters of the last message kept with an archive for conversation summaries
+ARCHIVE_PREVIEW_LENGTH = 200
+
+
+def pack_messages(messages: list) -> bytes:
+    return zlib.compress(json.dumps(
+        [{**message, "created_at": message["created_at"].isoformat()} for message in messages],
+        ensure_ascii=False
+    ).encode())
+
+
+def unpack_messages(payload: bytes) -> list:
+    messages = json.loads(zlib.decompress(payload))
+    for message in messages:
+        message["created_at"] = datetime.fromisoformat(message["created_at"])
+    return messages
+
+
+class MessageArchiver:
+    """Background maintenance for the partitioned messages table.
+
+    Every MESSAGE_MAINTENANCE_INTERVAL_SECONDS it creates upcoming monthly partitions
+    and drops old ones that are empty. With archiving enabled it also moves the
+    messages of conversations with no activity for MESSAGE_ARCHIVE_AFTER_DAYS into
+    ``message_archives``, one compressed row per conversation. Archived messages are
+    moved back by ``restore()`` the next time the conversation is read, and a restored
+    conversation is not archived again until MESSAGE_ARCHIVE_AFTER_DAYS after that read.
+    Inactivity is measured in UTC on the database clock, like the ``created_at`` default.
+    Archived messages are not covered by full-text search until they are restored.
+    """
+
+    def __init__(self, archive_enabled: bool, archive_after_days: int, batch_size: int,
+                 interval_seconds: int, months_ahead: int):
+        self.archive_enabled = archive_enabled
+        self.archive_after = timedelta(days=archive_after_days)
+        self.batch_size = batch_size
+        self.interval = interval_seconds
+        self.months_ahead = months_ahead
+        self._task = None
+        self.runs = 0
+        self.conversations_archived = 0
+        self.messages_archived = 0
+        self.conversations_restored = 0
+        self.partitions_dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Message maintenance failed")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        """Runs one round of partition maintenance and, if enabled, archiving."""
+        self.runs += 1
+        await self.maintain_partitions()
+        if self.archive_enabled:
+            while await self.archive_inactive() == self.batch_size:
+                pass
+
+    async def maintain_partitions(self):
+        async with engine.begin() as conn:
+            if not await conn.scalar(select(func.pg_try_advisory_xact_lock(PARTITION_LOCK_ID))):
+                return
+            # In UTC, like the created_at values the partitions are keyed on
+            cutoff = await conn.scalar(select(utc_now() - self.archive_after))
+            await conn.run_sync(create_message_partitions, self.months_ahead)
+            dropped = await conn.run_sync(drop_empty_partitions, month_start(cutoff.date()))
+        self.partitions_dropped += len(dropped)
+
+    async def archive_inactive(self) -> int:
+        """Archives up to one batch of inactive conversations and returns how many were archived."""
+        cutoff = utc_now() - self.archive_after
+        newer = aliased(Message)
+        async with async_session() as db:
+            if not await db.scalar(select(func.pg_try_advisory_xact_lock(ARCHIVE_LOCK_ID))):
+                return 0
+            # Only partitions older than the cutoff are scanned; the composite index answers the NOT EXISTS
+            result = await db.execute(
+                select(Message.conversation_id)
+                .join(Conversation, Conversation.id == Message.conversation_id)
+                .where(Message.created_at < cutoff)
+                .where(or_(Conversation.restored_at.is_(None), Conversation.restored_at < cutoff))
+                .where(~exists().where(newer.conversation_id == Message.conversation_id, newer.created_at >= cutoff))
+                .distinct()
+                .limit(self.batch_size)
+            )
+            conversation_ids = result.scalars().all()
+            if not conversation_ids:
+                return 0
+
+            # A conversation can already have an archive if it was used briefly after a restore
+            result = await db.execute(
+                delete(MessageArchive)
+                .where(MessageArchive.conversation_id.in_(conversation_ids))
+                .returning(MessageArchive.conversation_id, MessageArchive.payload)
+                .execution_options(synchronize_session=False)
+            )
+            histories = {conversation_id: unpack_messages(payload) for conversation_id, payload in result.all()}
+            result = await db.execute(
+                delete(Message)
+                .where(Message.conversation_id.in_(conversation_ids))
+                .returning(Message.id, Message.conversation_id, Message.role, Message.content, Message.created_at)
+                .execution_options(synchronize_session=False)
+            )
+            moved = 0
+            for row in result.all():
+                histories.setdefault(row.conversation_id, []).append(
+                    {"id": row.id, "role": row.role, "content": row.content, "created_at": row.created_at}
+                )
+                moved += 1
+
+            archives = []
+            for conversation_id, messages in histories.items():
+                messages.sort(key=lambda message: message["id"])
+                archives.append({
+                    "conversation_id": conversation_id,
+                    "message_count": len(messages),
+                    "last_message_at": messages[-1]["created_at"],
+                    "last_message_preview": messages[-1]["content"][:ARCHIVE_PREVIEW_LENGTH],
+                    "payload": pack_messages(messages),
+                })
+            await db.execute(insert(MessageArchive), archives)
+            await db.commit()
+
+        for conversation_id in conversation_ids:
+            history_cache.invalidate(conversation_id)
+        self.conversations_archived += len(conversation_ids)
+        self.messages_archived += moved
+        return len(conversation_ids)
+
+    async def restore(self, db: AsyncSession, conversation_ids: list) -> int:
+        """Moves any archived messages of the given conversations back into ``messages``.
+
+        Costs a single primary-key lookup when none of them are archived, which is the
+        usual case. Runs in the caller's transaction, which the caller commits; the
+        caller must also have checked that the conversations belong to its user.
+        Returns the number of conversations restored.
+        """
+        if not conversation_ids:
+            return 0
+        archived = (await db.execute(
+            select(MessageArchive.conversation_id).where(MessageArchive.conversation_id.in_(conversation_ids))
+        )).scalars().all()
+        if not archived:
+            return 0
+
+        # Deleting first locks the archive rows, so concurrent readers restore each conversation once
+        result = await db.execute(
+            delete(MessageArchive)
+            .where(MessageArchive.conversation_id.in_(archived))
+            .returning(MessageArchive.conversation_id, MessageArchive.payload)
+            .execution_options(synchronize_session=False)
+        )
+        restored = result.all()
+        rows = [
+            {**message, "conversation_id": conversation_id}
+            for conversation_id, payload in restored
+            for message in unpack_messages(payload)
+        ]
+        if rows:
+            await db.execute(insert(Message), rows)
+        # Reading a conversation counts as activity, so the next run does not archive it straight back
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.id.in_([conversation_id for conversation_id, _ in restored]))
+            .values(restored_at=utc_now())
+            .execution_options(synchronize_session=False)
+        )
+        self.conversations_restored += len(restored)
+        return len(restored)
+
+    def stats(self) -> dict:
+        return {
+            "archive_enabled": self.archive_enabled,
+            "runs": self.runs,
+            "conversations_archived": self.conversations_archived,
+            "messages_archived": self.messages_archived,
+            "conversations_restored": self.conversations_restored,
+            "partitions_dropped": self.partitions_dropped,
+        }
+
+
+message_archiver = MessageArchiver(
+    archive_enabled=settings.MESSAGE_ARCHIVE_ENABLED,
+    archive_after_days=settings.MESSAGE_ARCHIVE_AFTER_DAYS,
+    batch_size=settings.MESSAGE_ARCHIVE_BATCH_SIZE,
+    interval_seconds=settings.MESSAGE_MAINTENANCE_INTERVAL_SECONDS,
+    months_ahead=settings.MESSAGE_PARTITION_MONTHS_AHEAD,
+)
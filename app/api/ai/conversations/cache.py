@@ -0,0 +1,126 @@
+# app/api/ai/conversations/cache.py
+import sys
+from uuid import UUID
+from cachetools import LRUCache
+from app.config import settings
+
+# Rough per-message bookkeeping cost (dict, datetime, ids) on top of the content itself
+MESSAGE_OVERHEAD_BYTES = 400
+
+
+def _message_size(message: dict) -> int:
+    return MESSAGE_OVERHEAD_BYTES + sys.getsizeof(message["content"])
+
+
+def message_snapshot(message) -> dict:
+    """Returns a session-independent copy of a Message row."""
+    return {
+        "id": message.id,
+        "conversation_id": message.conversation_id,
+        "role": message.role,
+        "content": message.content,
+        "created_at": message.created_at,
+    }
+
+
+class _History(list):
+    """A cached history, with its size kept up to date as messages are appended."""
+
+    def __init__(self, snapshots: list):
+        super().__init__(snapshots)
+        self.size = sum(_message_size(message) for message in snapshots)
+        self.latest = max((message["created_at"] for message in snapshots), default=None)
+
+    def extend(self, snapshots: list):
+        super().extend(snapshots)
+        self.size += sum(_message_size(message) for message in snapshots)
+        self.latest = max(filter(None, [self.latest, *(message["created_at"] for message in snapshots)]), default=None)
+
+    def fingerprint(self) -> tuple:
+        """``(message count, latest created_at)``, to compare with the database."""
+        return len(self), self.latest
+
+
+def _history_size(history: _History) -> int:
+    return history.size or 1
+
+
+class _HistoryLRU(LRUCache):
+    evictions = 0
+
+    def popitem(self):
+        self.evictions += 1
+        return super().popitem()
+
+
+class ConversationHistoryCache:
+    """Bounded, write-through cache of message history keyed by conversation_id.
+
+    Entries are filled on the first read and kept current by appending the rows the
+    app writes. The least recently used conversations are evicted once the cached
+    messages go over the memory budget.
+
+    The cache is per process, so with several workers an entry can miss messages
+    another worker wrote. Unless HISTORY_CACHE_VERIFY is off (safe only with a
+    single worker), readers compare ``fingerprint`` with the database before using
+    an entry and ``set`` it again when they differ.
+    """
+
+    def __init__(self, max_bytes: int):
+        self._entries = _HistoryLRU(maxsize=max_bytes, getsizeof=_history_size)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conversation_id: UUID):
+        """Returns the cached messages for a conversation, or None on a miss."""
+        messages = self._entries.get(str(conversation_id))
+        if messages is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return messages
+
+    def set(self, conversation_id: UUID, messages: list):
+        """Caches the full, ordered history of a conversation and returns the cached copy."""
+        snapshots = _History([message_snapshot(message) for message in messages])
+        try:
+            self._entries[str(conversation_id)] = snapshots
+        except ValueError:
+            pass  # A single history larger than the whole budget is not cached
+        return snapshots
+
+    def append(self, conversation_id: UUID, messages: list):
+        """Adds newly written messages to a cached history; uncached conversations are left alone."""
+        cached = self._entries.get(str(conversation_id))
+        if cached is None:
+            return
+        known = cached[-1]["id"] if cached else 0
+        cached.extend([message_snapshot(message) for message in messages if message.id > known])
+        try:
+            # Re-inserting picks up the entry's new size and marks it as recently used
+            self._entries[str(conversation_id)] = cached
+        except ValueError:
+            self.invalidate(conversation_id)
+
+    def fingerprint(self, conversation_id: UUID):
+        """Returns the cached entry's ``(count, latest created_at)``, or None if it is not cached."""
+        cached = self._entries.get(str(conversation_id))
+        return None if cached is None else cached.fingerprint()
+
+    def invalidate(self, conversation_id: UUID):
+        self._entries.pop(str(conversation_id), None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self._entries.evictions,
+            "conversations": len(self._entries),
+            "bytes": self._entries.currsize,
+            "max_bytes": self._entries.maxsize,
+        }
+
+
+history_cache = ConversationHistoryCache(settings.HISTORY_CACHE_MAX_BYTES)
@@ -0,0 +1,103 @@
+# app/api/ai/conversations/export.py
+import json
+import zlib
+from datetime import datetime
+from uuid import UUID
+from sqlalchemy import tuple_
+from sqlalchemy.future import select
+from app.database import async_read_session
+from app.api.google.gmail.models import EmailDraft, SentEmail
+from .models import Conversation, Message, MessageArchive
+from .archive import unpack_messages
+from .service import encode_cursor, decode_cursor
+
+# Conversations exported per round of queries; a resume cursor is emitted after each round
+EXPORT_CONVERSATION_BATCH = 100
+# Rows fetched per round trip from the server-side cursors
+EXPORT_YIELD_PER = 500
+
+EXPORTED_TABLES = (
+    ("message", Message, (Message.id, Message.conversation_id, Message.role, Message.content, Message.created_at)),
+    ("email_draft", EmailDraft, (
+        EmailDraft.id, EmailDraft.conversation_id, EmailDraft.recipient_name, EmailDraft.user_prompt,
+        EmailDraft.subject, EmailDraft.body, EmailDraft.created_at,
+    )),
+    ("sent_email", SentEmail, (
+        SentEmail.id, SentEmail.conversation_id, SentEmail.email_draft_id, SentEmail.recipient_email, SentEmail.sent_at,
+    )),
+)
+
+
+def decode_export_cursor(cursor: str) -> tuple:
+    """Decodes an export resume cursor into the ``(created_at, id)`` of the last exported conversation."""
+    return decode_cursor(cursor, datetime.fromisoformat, UUID)
+
+
+def _line(record_type: str, row: dict) -> bytes:
+    return (json.dumps({"type": record_type, **row}, default=str, ensure_ascii=False) + "\n").encode()
+
+
+async def export_conversations(user_id: UUID, after: tuple = None):
+    """Yields a user's full archive as NDJSON lines tagged with a ``type``.
+
+    Conversations are exported in batches: the batch's conversations first, then
+    their messages, email drafts and sent emails, each carrying its conversation_id.
+    Archived messages follow the live ones and are read straight from the archive.
+    Rows come from server-side cursors, so memory use does not grow with the archive,
+    and are read from the replica when one is configured.
+    After every batch a ``{"type": "cursor", ...}`` line is emitted; passing that
+    cursor back resumes the export after the batch. The caller decodes it with
+    ``decode_export_cursor`` before the response starts and passes the result as ``after``.
+    """
+
+    async with async_read_session() as db:
+        while True:
+            statement = (
+                select(Conversation.id, Conversation.persona_id, Conversation.created_at)
+                .where(Conversation.user_id == user_id)
+                .order_by(Conversation.created_at, Conversation.id)
+                .limit(EXPORT_CONVERSATION_BATCH)
+            )
+            if after is not None:
+                statement = statement.where(tuple_(Conversation.created_at, Conversation.id) > after)
+            conversations = (await db.execute(statement)).all()
+            if not conversations:
+                break
+
+            for conversation in conversations:
+                yield _line("conversation", conversation._asdict())
+            conversation_ids = [conversation.id for conversation in conversations]
+            for record_type, model, columns in EXPORTED_TABLES:
+                result = await db.stream(
+                    select(*columns)
+                    .where(model.conversation_id.in_(conversation_ids))
+                    .order_by(model.conversation_id, model.id)
+                    .execution_options(yield_per=EXPORT_YIELD_PER)
+                )
+                async for row in result:
+                    yield _line(record_type, row._asdict())
+
+            # Messages of archived conversations are exported from the archive without restoring them
+            result = await db.execute(
+                select(MessageArchive.conversation_id, MessageArchive.payload)
+                .where(MessageArchive.conversation_id.in_(conversation_ids))
+            )
+            for conversation_id, payload in result.all():
+                for message in unpack_messages(payload):
+                    yield _line("message", {**message, "conversation_id": conversation_id})
+
+            last = conversations[-1]
+            after = (last.created_at, last.id)
+            # End the read transaction between batches rather than holding one for the whole export
+            await db.commit()
+            yield _line("cursor", {"cursor": encode_cursor(last.created_at, last.id)})
+
+
+async def gzip_stream(chunks):
+    """Gzip-compresses a byte stream as it is produced."""
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,185 @@
+# app/api/ai/conversations/ingest.py
+import json
+import logging
+from uuid import UUID
+from fastapi import HTTPException, Request, status
+from pydantic import ValidationError
+from sqlalchemy import func, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.config import settings
+from .cache import history_cache
+from app.api.ai.context import invalidate_context
+from .models import Conversation, Message, MessageArchive
+from .partitions import utc_now
+from .schemas import BulkMessageItem
+
+logger = logging.getLogger(__name__)
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+class _BadLine:
+    """Placeholder for an NDJSON line that is not valid JSON."""
+
+    def __init__(self, error: str):
+        self.error = error
+
+
+async def read_bulk_rows(request: Request):
+    """Yields the rows of an import body: a JSON array, or NDJSON read as it arrives."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in NDJSON_TYPES:
+        try:
+            rows = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array.")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array.")
+        for row in rows:
+            yield row
+        return
+
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+
+def _parse_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return _BadLine(f"Invalid JSON: {e}")
+
+
+async def ingest_messages(db: AsyncSession, user_id: UUID, rows) -> dict:
+    """Saves imported messages in chunks and reports the outcome of every row.
+
+    Rows are validated one by one and written MESSAGE_IMPORT_CHUNK_SIZE at a time
+    with multi-row INSERTs, one commit per chunk. Conversation ownership is checked
+    once per conversation. A failing chunk is rolled back and reported without
+    stopping the rest of the import.
+
+    Conversations are read in id order, so imported messages may only extend a
+    conversation: each row's created_at (now, if it has none) must not be earlier
+    than the conversation's latest message, nor in the future. Out-of-order rows
+    are reported as invalid.
+    """
+    results = []
+    owned = {}  # conversation_id -> whether it belongs to the user
+    latest = {}  # conversation_id -> created_at of its latest message
+    chunk = []  # (index, BulkMessageItem)
+    index = -1
+    async for row in rows:
+        index += 1
+        if index >= settings.MESSAGE_IMPORT_MAX_ROWS:
+            results.append(_result(index, "invalid", error=f"Import is limited to {settings.MESSAGE_IMPORT_MAX_ROWS} rows."))
+            continue
+        if isinstance(row, _BadLine):
+            results.append(_result(index, "invalid", error=row.error))
+            continue
+        try:
+            item = BulkMessageItem.model_validate(row)
+        except ValidationError as e:
+            results.append(_result(index, "invalid", error=_validation_message(e)))
+            continue
+        chunk.append((index, item))
+        if len(chunk) >= settings.MESSAGE_IMPORT_CHUNK_SIZE:
+            results.extend(await _write_chunk(db, user_id, chunk, owned, latest))
+            chunk = []
+    if chunk:
+        results.extend(await _write_chunk(db, user_id, chunk, owned, latest))
+
+    results.sort(key=lambda result: result["index"])
+    inserted = sum(1 for result in results if result["status"] == "inserted")
+    return {"inserted": inserted, "failed": len(results) - inserted, "results": results}
+
+
+async def _write_chunk(db: AsyncSession, user_id: UUID, chunk: list, owned: dict, latest: dict) -> list:
+    unknown = {item.conversation_id for _, item in chunk if item.conversation_id not in owned}
+    if unknown:
+        result = await db.execute(
+            select(Conversation.id).where(Conversation.id.in_(unknown), Conversation.user_id == user_id)
+        )
+        found = set(result.scalars().all())
+        owned.update((conversation_id, conversation_id in found) for conversation_id in unknown)
+        if found:
+            latest.update(await _latest_message_times(db, found))
+    # Stamped on rows without a timestamp; the same UTC clock as the created_at default
+    now = await db.scalar(select(utc_now()))
+
+    results = []
+    accepted = []
+    chunk_latest = {}
+    for index, item in chunk:
+        if not owned[item.conversation_id]:
+            results.append(_result(index, "not_found", error="Conversation not found."))
+            continue
+        created_at = item.created_at or now
+        previous = chunk_latest.get(item.conversation_id, latest.get(item.conversation_id))
+        if created_at > now:
+            results.append(_result(index, "invalid", error="created_at: must not be in the future"))
+        elif previous is not None and created_at < previous:
+            results.append(_result(index, "invalid", error=(
+                "created_at: must not be earlier than the conversation's latest message"
+            )))
+        else:
+            chunk_latest[item.conversation_id] = created_at
+            accepted.append((index, {**item.model_dump(), "created_at": created_at}))
+    if not accepted:
+        return results
+
+    try:
+        ids = await db.execute(
+            insert(Message).returning(Message.id, sort_by_parameter_order=True),
+            [row for _, row in accepted]
+        )
+        results.extend(_result(index, "inserted", id=message_id) for (index, _), message_id in zip(accepted, ids.scalars()))
+        await db.commit()
+    except SQLAlchemyError:
+        await db.rollback()
+        logger.exception("Failed to import messages")
+        results = [result for result in results if result["status"] != "inserted"]
+        results.extend(_result(index, "failed", error="Could not save message.") for index, _ in accepted)
+        return results
+
+    latest.update(chunk_latest)
+    for conversation_id in chunk_latest:
+        history_cache.invalidate(conversation_id)
+        invalidate_context(conversation_id)
+    return results
+
+
+async def _latest_message_times(db: AsyncSession, conversation_ids: set) -> dict:
+    """Returns the created_at of each conversation's latest message, live or archived."""
+    latest = {}
+    result = await db.execute(
+        select(Message.conversation_id, func.max(Message.created_at))
+        .where(Message.conversation_id.in_(conversation_ids))
+        .group_by(Message.conversation_id)
+    )
+    for conversation_id, created_at in result.all():
+        latest[UUID(str(conversation_id))] = created_at
+    result = await db.execute(
+        select(MessageArchive.conversation_id, MessageArchive.last_message_at)
+        .where(MessageArchive.conversation_id.in_(conversation_ids))
+    )
+    for conversation_id, created_at in result.all():
+        conversation_id = UUID(str(conversation_id))
+        latest[conversation_id] = max(filter(None, (latest.get(conversation_id), created_at)))
+    return latest
+
+
+def _result(index: int, status: str, id: int = None, error: str = None) -> dict:
+    return {"index": index, "status": status, "id": id, "error": error}
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc']) or 'row'}: {e['msg']}" for e in error.errors())
@@ -1,7 +1,7 @@
 # app/api/ai/conversation/models.py
 import uuid
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime, Computed, Index, LargeBinary, event
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from fastapi_users.db import SQLAlchemyBaseUserTableUUID, SQLAlchemyUserDatabase
@@ -9,6 +9,8 @@ from app.api.google.gmail.models import EmailDraft
 from app.api.persona.models import Persona
 
 from app.database import Base
+from app.config import settings
+from .partitions import create_message_partitions, utc_now
 
 
 class Conversation(Base):
@@ -18,6 +20,8 @@ class Conversation(Base):
     user_id = Column(UUID, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     persona_id = Column(Integer, ForeignKey("personas.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
+    # When the conversation's messages were last brought back from the archive
+    restored_at = Column(DateTime, nullable=True)
 
     user = relationship("User", back_populates="conversations")
     persona = relationship("Persona", back_populates="conversations")
@@ -25,13 +29,56 @@ class Conversation(Base):
     email_drafts = relationship("EmailDraft", back_populates="conversation", cascade="all, delete-orphan")
     sent_emails = relationship("SentEmail", back_populates="conversation", cascade="all, delete-orphan")
 
+    # Serves the per-user listing, which pages on (created_at, id)
+    __table_args__ = (
+        Index("ix_conversations_user_id_created_at", "user_id", "created_at", "id"),
+    )
+
 class Message(Base):
+    """A chat message.
+
+    The table is range-partitioned by month on created_at, so the primary key is
+    (id, created_at); the ORM still identifies messages by id alone.
+    """
     __tablename__ = "messages"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     conversation_id = Column(UUID, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
     role = Column(String, nullable=False)  # "user" or "assistant"
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    # Naive UTC, whatever the session time zone, like the timestamps clients send to bulk ingest
+    created_at = Column(DateTime, primary_key=True, server_default=utc_now())
+
+    # Maintained by Postgres for full-text search; not mapped, so it is never loaded or returned
+    search_vector = Column(TSVECTOR, Computed("to_tsvector('english', content)", persisted=True))
+
+    conversation = relationship("Conversation", back_populates="messages")
+
+    __table_args__ = (
+        Index("ix_messages_conversation_id_created_at", "conversation_id", "created_at"),
+        Index("ix_messages_search_vector", "search_vector", postgresql_using="gin"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    # Return created_at from the INSERT so new rows can be cached without a refresh
+    __mapper_args__ = {"primary_key": [id], "eager_defaults": True, "exclude_properties": ["search_vector"]}
+
+
+@event.listens_for(Message.__table__, "after_create")
+def _create_partitions(target, connection, **kw):
+    create_message_partitions(connection, settings.MESSAGE_PARTITION_MONTHS_AHEAD)
+
+
+class MessageArchive(Base):
+    """Messages of a long-inactive conversation, moved out of ``messages`` and compressed.
+
+    ``payload`` is a zlib-compressed JSON list of the messages; the summary columns let
+    conversation listings show archived conversations without unpacking them.
+    """
+    __tablename__ = "message_archives"
 
-    conversation = relationship("Conversation", back_populates="messages")
\ No newline at end of file
+    conversation_id = Column(UUID, ForeignKey("conversations.id", ondelete="CASCADE"), primary_key=True)
+    message_count = Column(Integer, nullable=False)
+    last_message_at = Column(DateTime, nullable=False)
+    last_message_preview = Column(Text)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime, nullable=False, server_default=func.now())
@@ -0,0 +1,70 @@
+# app/api/ai/conversations/partitions.py
+import logging
+import re
+from datetime import date, datetime
+from sqlalchemy import func, text
+
+logger = logging.getLogger(__name__)
+
+# Catches rows outside every monthly partition (e.g. imports with old timestamps)
+DEFAULT_PARTITION = "messages_default"
+PARTITION_NAME = re.compile(r"^messages_p(\d{4})_(\d{2})$")
+
+
+def utc_now():
+    """The database clock as a naive UTC timestamp, the convention for ``messages.created_at``."""
+    return func.timezone("UTC", func.now())
+
+
+def month_start(day: date, offset: int = 0) -> date:
+    """Returns the first day of the month ``offset`` months after ``day``'s month."""
+    index = day.year * 12 + day.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"messages_p{month:%Y_%m}"
+
+
+def create_message_partitions(connection, months_ahead: int, today: date = None):
+    """Creates the default partition and the monthly partitions from this month to ``months_ahead`` months ahead.
+
+    ``connection`` is a synchronous Connection; call it through ``run_sync`` from async
+    code. Partitions that already exist are left alone.
+    """
+    today = today or datetime.utcnow().date()
+    connection.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF messages DEFAULT"))
+    for offset in range(months_ahead + 1):
+        start, end = month_start(today, offset), month_start(today, offset + 1)
+        try:
+            with connection.begin_nested():
+                connection.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF messages "
+                    f"FOR VALUES FROM ('{start}') TO ('{end}')"
+                ))
+        except Exception:
+            # Usually rows for that month already sit in the default partition
+            logger.exception("Could not create partition %s", partition_name(start))
+
+
+def drop_empty_partitions(connection, before: date) -> list:
+    """Drops monthly partitions that end on or before ``before`` and hold no rows. Returns their names."""
+    names = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'messages'"
+    )).scalars().all()
+    dropped = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if not match:
+            continue
+        start = date(int(match.group(1)), int(match.group(2)), 1)
+        if month_start(start, 1) > before:
+            continue
+        if connection.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})")).scalar():
+            continue
+        connection.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    return dropped
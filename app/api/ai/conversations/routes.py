@@ -1,37 +1,90 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload, selectinload
-from typing import List
-from app.database import get_async_session
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
+from app.database import get_async_session, get_read_session
 from app.models import User
 from .models import Conversation, Message
 from app.api.auth.manager import get_current_user
+from app.api.ai.conversations.service import (
+    add_message_to_conversation,
+    ensure_conversation_owner,
+    get_conversation_messages,
+    list_conversation_summaries,
+    list_conversation_messages
+)
+from app.api.ai.conversations.export import decode_export_cursor, export_conversations, gzip_stream
+from app.api.ai.conversations.search import search_conversations
+from app.api.ai.conversations.ingest import ingest_messages, read_bulk_rows
 from app.api.ai.conversations.schemas import (
+    BulkMessageResponse,
     ConversationHistorySchema,
+    ConversationPageSchema,
     MessageCreate,
-    MessageResponse
+    MessagePageSchema,
+    MessageResponse,
+    SearchPageSchema
 )
 from uuid import UUID
 
 router = APIRouter(tags=["AI Conversation History"])
 
-@router.get("/ai/conversations/", response_model=List[ConversationHistorySchema])
+@router.get("/ai/conversations/", response_model=ConversationPageSchema)
 async def get_conversation_history(
-    db: AsyncSession = Depends(get_async_session),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_session),
+    user: User = Depends(get_current_user),
+):
+    """Lists the user's conversations as summaries, newest first, one page at a time.
+
+    Read from the replica when one is configured, so a just-created conversation can lag briefly.
+    """
+    return await list_conversation_summaries(db, user.id, limit, cursor)
+
+
+@router.get("/ai/search", response_model=SearchPageSchema)
+async def search_conversation_history(
+    q: str = Query(..., min_length=1, max_length=256),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_session),
     user: User = Depends(get_current_user),
 ):
-    print("User details", user)
-    statements = select(Conversation).where(Conversation.user_id == user.id).options(
-        joinedload(Conversation.persona),
-        joinedload(Conversation.messages)
+    """Full-text search over the user's messages and email drafts, best matches first (replica-backed).
+
+    Messages of archived conversations are not searched until the conversation is opened
+    again, which restores them; see MESSAGE_ARCHIVE_AFTER_DAYS.
+    """
+    return await search_conversations(db, user.id, q, limit, cursor)
+
+
+@router.get("/ai/conversations/export")
+async def export_conversation_archive(
+    cursor: Optional[str] = None,
+    gzip: bool = False,
+    user: User = Depends(get_current_user),
+):
+    """Streams the user's conversations, messages, email drafts and sent emails as NDJSON.
+
+    Pass ``gzip=true`` for a compressed download and ``cursor`` to resume an interrupted export.
+    """
+    # Decoded here, so a bad cursor is a 400 rather than an error in the middle of a 200
+    after = decode_export_cursor(cursor) if cursor else None
+    body = export_conversations(user.id, after)
+    if gzip:
+        return StreamingResponse(
+            gzip_stream(body),
+            media_type="application/gzip",
+            headers={"Content-Disposition": 'attachment; filename="conversations.ndjson.gz"'}
+        )
+    return StreamingResponse(
+        body,
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="conversations.ndjson"'}
     )
-    result = await db.execute(statements)
-    conversations = result.unique().scalars().all()
-    # Ensure the relationships are loaded asynchronously
-    for conversation in conversations:
-        await db.refresh(conversation, attribute_names=["persona", "messages"])
-    return conversations
 
 
 @router.post("/ai/conversations/", response_model=ConversationHistorySchema)
@@ -67,15 +120,22 @@ async def add_message_to_conversation_endpoint(
     user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_async_session)
 ):
-    message = Message(
-        conversation_id=conversation_id,
-        role=message_data.role,
-        content=message_data.content
-    )
-    db.add(message)
-    await db.commit()
-    await db.refresh(message)
-    return message
+    return await add_message_to_conversation(db, conversation_id, message_data.role, message_data.content)
+
+@router.post("/ai/conversations/messages/bulk", response_model=BulkMessageResponse)
+async def bulk_add_messages(
+    request: Request,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """Imports many messages, for one or more of the user's conversations, in one request.
+
+    The body is a JSON array of ``{conversation_id, role, content, created_at?}`` objects,
+    or the same objects as NDJSON (``Content-Type: application/x-ndjson``), which is
+    written while it is still being uploaded. Every row gets its own status. Messages
+    can only be added after a conversation's latest one, in chronological order.
+    """
+    return await ingest_messages(db, user.id, read_bulk_rows(request))
 
 @router.get("/ai/conversations/{conversation_id}/messages", response_model=List[MessageResponse])
 async def get_messages_for_conversation(
@@ -83,6 +143,20 @@ async def get_messages_for_conversation(
     user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_async_session)
 ):
-    # Use joinedload to include persona details in the message response
-    messages = await db.execute(select(Message).where(Message.conversation_id == conversation_id).options(joinedload(Message.conversation).joinedload(Conversation.persona)))
-    return messages.scalars().all()
+    await ensure_conversation_owner(db, user.id, conversation_id)
+    messages = await get_conversation_messages(db, conversation_id)
+    await db.commit()  # Keeps any messages restored from the archive
+    return messages
+
+@router.get("/ai/conversations/{conversation_id}/messages/page", response_model=MessagePageSchema)
+async def get_message_page(
+    conversation_id: UUID,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """Returns a conversation's messages one page at a time, newest page first."""
+    page = await list_conversation_messages(db, user.id, conversation_id, limit, cursor)
+    await db.commit()  # Keeps any messages restored from the archive
+    return page
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import List
-from datetime import datetime
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional
+from datetime import datetime, timezone
 from app.api.persona.schemas import PersonaSchema  # Import the PersonaSchema
 from uuid import UUID
 
@@ -36,4 +36,58 @@ class MessageResponse(BaseModel):
     created_at: datetime
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class ConversationSummarySchema(BaseModel):
+    id: UUID
+    persona_id: int
+    persona_name: Optional[str] = None
+    created_at: datetime
+    message_count: int
+    last_message_preview: Optional[str] = None
+    last_activity_at: datetime
+
+class ConversationPageSchema(BaseModel):
+    items: List[ConversationSummarySchema]
+    next_cursor: Optional[str] = None
+
+class MessagePageSchema(BaseModel):
+    items: List[MessageResponse]
+    next_cursor: Optional[str] = None
+
+class SearchResultSchema(BaseModel):
+    source: str  # "message" or "email_draft"
+    id: int
+    conversation_id: UUID
+    created_at: datetime
+    rank: float
+    highlight: str
+
+class SearchPageSchema(BaseModel):
+    items: List[SearchResultSchema]
+    next_cursor: Optional[str] = None
+
+class BulkMessageItem(BaseModel):
+    conversation_id: UUID
+    role: str
+    content: str
+    created_at: Optional[datetime] = None  # Original timestamp of an imported message
+
+    @field_validator("created_at")
+    @classmethod
+    def to_naive_utc(cls, value):
+        # created_at columns are stored as naive UTC timestamps
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+class BulkMessageResultSchema(BaseModel):
+    index: int
+    status: str  # "inserted", "invalid", "not_found" or "failed"
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class BulkMessageResponse(BaseModel):
+    inserted: int
+    failed: int
+    results: List[BulkMessageResultSchema]
@@ -0,0 +1,98 @@
+# app/api/ai/conversations/search.py
+from uuid import UUID
+from sqlalchemy import Double, cast, func, literal_column, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.api.google.gmail.models import EmailDraft
+from .models import Conversation, Message
+from .service import encode_cursor, decode_cursor
+
+SEARCH_CONFIG = "english"
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5"
+
+message_vector = Message.__table__.c.search_vector
+draft_vector = EmailDraft.__table__.c.search_vector
+
+
+def _draft_text():
+    return EmailDraft.subject + " " + EmailDraft.body
+
+
+async def search_conversations(db: AsyncSession, user_id: UUID, q: str, limit: int, cursor: str = None):
+    """Searches a user's messages and email drafts, best matches first.
+
+    ``q`` uses web search syntax ("quoted phrases", or, -excluded). Matches come from
+    the GIN-indexed search vectors; results are ordered by rank and paginated with a
+    (rank, source, id) keyset. Highlights are only built for the returned page.
+    Messages moved to ``message_archives`` are not searched until they are restored.
+    """
+    query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+    # Ranks are compared as double precision so a cursor round-trips exactly
+    messages = (
+        select(
+            literal_column("'message'").label("source"),
+            Message.id,
+            Message.conversation_id,
+            Message.created_at,
+            cast(func.ts_rank(message_vector, query), Double).label("rank"),
+        )
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .where(Conversation.user_id == user_id, message_vector.op("@@")(query))
+    )
+    drafts = (
+        select(
+            literal_column("'email_draft'").label("source"),
+            EmailDraft.id,
+            EmailDraft.conversation_id,
+            EmailDraft.created_at,
+            cast(func.ts_rank(draft_vector, query), Double).label("rank"),
+        )
+        .join(Conversation, Conversation.id == EmailDraft.conversation_id)
+        .where(Conversation.user_id == user_id, draft_vector.op("@@")(query))
+    )
+    matches = union_all(messages, drafts).subquery()
+
+    statement = (
+        select(matches)
+        .order_by(matches.c.rank.desc(), matches.c.source.desc(), matches.c.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        after = decode_cursor(cursor, float, str, int)
+        statement = statement.where(tuple_(matches.c.rank, matches.c.source, matches.c.id) < after)
+    rows = (await db.execute(statement)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.rank, last.source, last.id)
+    rows = rows[:limit]
+
+    highlights = {}
+    message_ids = [row.id for row in rows if row.source == "message"]
+    if message_ids:
+        result = await db.execute(
+            select(Message.id, func.ts_headline(SEARCH_CONFIG, Message.content, query, HEADLINE_OPTIONS))
+            .where(Message.id.in_(message_ids))
+        )
+        highlights.update((("message", row_id), text) for row_id, text in result.all())
+    draft_ids = [row.id for row in rows if row.source == "email_draft"]
+    if draft_ids:
+        result = await db.execute(
+            select(EmailDraft.id, func.ts_headline(SEARCH_CONFIG, _draft_text(), query, HEADLINE_OPTIONS))
+            .where(EmailDraft.id.in_(draft_ids))
+        )
+        highlights.update((("email_draft", row_id), text) for row_id, text in result.all())
+
+    items = [
+        {
+            "source": row.source,
+            "id": row.id,
+            "conversation_id": row.conversation_id,
+            "created_at": row.created_at,
+            "rank": row.rank,
+            "highlight": highlights.get((row.source, row.id), ""),
+        }
+        for row in rows
+    ]
+    return {"items": items, "next_cursor": next_cursor}
@@ -1,6 +1,17 @@
 # app/api/ai/conversation/service.py
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException, status
+from sqlalchemy import func, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.api.ai.conversations.models import Conversation, Message
+from sqlalchemy.future import select
+from app.api.persona.models import Persona
+from app.api.ai.conversations.models import Conversation, Message, MessageArchive
+from app.api.ai.conversations.cache import history_cache
+from app.api.ai.conversations.writer import message_writer
+from app.api.ai.conversations.archive import message_archiver
+from app.config import settings
 from uuid import UUID
 
 async def create_conversation(db: AsyncSession, user_id: UUID, persona_id: int):
@@ -11,8 +22,197 @@ async def create_conversation(db: AsyncSession, user_id: UUID, persona_id: int):
     await db.refresh(conversation)
     return conversation
 
-async def add_message_to_conversation(db: AsyncSession, conversation_id: UUID, role: str, content: str):
-    """Adds a new message to an existing conversation."""
+async def add_message_to_conversation(db: AsyncSession, conversation_id: UUID, role: str, content: str, wait: bool = True):
+    """Adds a new message to an existing conversation.
+
+    With write-behind enabled the message is queued and saved in the next batch; pass
+    ``wait=False`` to return without waiting for it (the return value is then None).
+    """
+    if message_writer.running:
+        future = message_writer.enqueue(conversation_id, role, content)
+        return await future if wait else None
     message = Message(conversation_id=conversation_id, role=role, content=content)
     db.add(message)
-    await db.commit()
\ No newline at end of file
+    await db.commit()
+    history_cache.append(conversation_id, [message])
+    return message
+
+async def stale_histories(db: AsyncSession, conversation_ids: list) -> set:
+    """Returns the ids (as strings) of cached histories that no longer match the database.
+
+    Another worker may have written to the conversation since it was cached here. The
+    check is one grouped count over the messages index, skipped when HISTORY_CACHE_VERIFY is off.
+    """
+    if not settings.HISTORY_CACHE_VERIFY:
+        return set()
+    cached = {}
+    for conversation_id in conversation_ids:
+        fingerprint = history_cache.fingerprint(conversation_id)
+        if fingerprint is not None:
+            cached[str(conversation_id)] = fingerprint
+    if not cached:
+        return set()
+    result = await db.execute(
+        select(Message.conversation_id, func.count(), func.max(Message.created_at))
+        .where(Message.conversation_id.in_(list(cached)))
+        .group_by(Message.conversation_id)
+    )
+    current = {str(conversation_id): (count, latest) for conversation_id, count, latest in result.all()}
+    return {
+        conversation_id for conversation_id, fingerprint in cached.items()
+        if current.get(conversation_id, (0, None)) != fingerprint
+    }
+
+async def ensure_conversation_owner(db: AsyncSession, user_id: UUID, conversation_id: UUID):
+    """Raises a 404 unless the conversation exists and belongs to the user."""
+    owner = await db.scalar(select(Conversation.user_id).where(Conversation.id == conversation_id))
+    if owner is None or str(owner) != str(user_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation not found")
+
+async def get_conversation_messages(db: AsyncSession, conversation_id: UUID):
+    """Returns a conversation's messages in order, served from the history cache when possible.
+
+    Archived messages are restored in the caller's transaction; callers check ownership
+    first and commit afterwards to keep the restore.
+    """
+    await message_writer.flush(conversation_id)
+    messages = history_cache.get(conversation_id)
+    if messages is not None and await stale_histories(db, [conversation_id]):
+        messages = None
+    if messages is None:
+        await message_archiver.restore(db, [conversation_id])
+        result = await db.execute(
+            select(Message).where(Message.conversation_id == conversation_id).order_by(Message.id)
+        )
+        messages = history_cache.set(conversation_id, result.scalars().all())
+    return messages
+
+async def load_conversation_histories(db: AsyncSession, conversation_ids: list):
+    """Makes sure the histories of several conversations are cached, reading the missing ones in one query.
+
+    Like get_conversation_messages, restores archived messages in the caller's transaction.
+    """
+    await message_writer.flush()
+    stale = await stale_histories(db, conversation_ids)
+    missing = [
+        conversation_id for conversation_id in conversation_ids
+        if str(conversation_id) in stale or history_cache.get(conversation_id) is None
+    ]
+    if not missing:
+        return
+    await message_archiver.restore(db, missing)
+    result = await db.execute(
+        select(Message).where(Message.conversation_id.in_(missing)).order_by(Message.conversation_id, Message.id)
+    )
+    histories = {str(conversation_id): [] for conversation_id in missing}
+    for message in result.scalars().all():
+        histories[str(message.conversation_id)].append(message)
+    for conversation_id, messages in histories.items():
+        history_cache.set(conversation_id, messages)
+
+# Characters of the last message included in a conversation summary
+PREVIEW_LENGTH = 200
+
+def encode_cursor(*values) -> str:
+    """Encodes keyset values (datetimes, ids, ...) into an opaque pagination cursor."""
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else str(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str, *parsers) -> tuple:
+    """Decodes a cursor made by encode_cursor, parsing its values with ``parsers``.
+
+    There must be one parser per value, e.g. ``decode_cursor(cursor, datetime.fromisoformat, UUID)``.
+    Raises a 400 for anything that is not such a cursor.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError("wrong number of values")
+        return tuple(parse(value) for parse, value in zip(parsers, values))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+
+async def list_conversation_summaries(db: AsyncSession, user_id: UUID, limit: int, cursor: str = None):
+    """Returns one page of a user's conversations, newest first, as summaries.
+
+    Pages are keyed on (created_at, id), so each page costs the same however many
+    conversations come before it. Message counts, last activity and the last message
+    preview are read for the page's conversations only.
+    """
+    statement = (
+        select(Conversation.id, Conversation.persona_id, Persona.name, Conversation.created_at)
+        .join(Persona, Persona.id == Conversation.persona_id)
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.created_at.desc(), Conversation.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        statement = statement.where(
+            tuple_(Conversation.created_at, Conversation.id) < decode_cursor(cursor, datetime.fromisoformat, UUID)
+        )
+    rows = (await db.execute(statement)).all()
+    next_cursor = encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    rows = rows[:limit]
+
+    conversation_ids = [row.id for row in rows]
+    counts, previews = {}, {}
+    if conversation_ids:
+        result = await db.execute(
+            select(Message.conversation_id, func.count(Message.id), func.max(Message.created_at))
+            .where(Message.conversation_id.in_(conversation_ids))
+            .group_by(Message.conversation_id)
+        )
+        counts = {str(conversation_id): (count, last_at) for conversation_id, count, last_at in result.all()}
+        result = await db.execute(
+            select(Message.conversation_id, func.left(Message.content, PREVIEW_LENGTH))
+            .where(Message.conversation_id.in_(conversation_ids))
+            .distinct(Message.conversation_id)
+            .order_by(Message.conversation_id, Message.id.desc())
+        )
+        previews = {str(conversation_id): preview for conversation_id, preview in result.all()}
+        # Archived conversations keep their counts and last message with the archive
+        result = await db.execute(
+            select(MessageArchive.conversation_id, MessageArchive.message_count,
+                   MessageArchive.last_message_at, MessageArchive.last_message_preview)
+            .where(MessageArchive.conversation_id.in_(conversation_ids))
+        )
+        for conversation_id, archived_count, archived_last_at, archived_preview in result.all():
+            count, last_at = counts.get(str(conversation_id), (0, None))
+            counts[str(conversation_id)] = (count + archived_count, max(filter(None, (last_at, archived_last_at))))
+            previews.setdefault(str(conversation_id), archived_preview)
+
+    items = []
+    for row in rows:
+        message_count, last_activity_at = counts.get(str(row.id), (0, None))
+        items.append({
+            "id": row.id,
+            "persona_id": row.persona_id,
+            "persona_name": row.name,
+            "created_at": row.created_at,
+            "message_count": message_count,
+            "last_message_preview": previews.get(str(row.id)),
+            "last_activity_at": last_activity_at or row.created_at,
+        })
+    return {"items": items, "next_cursor": next_cursor}
+
+async def list_conversation_messages(db: AsyncSession, user_id: UUID, conversation_id: UUID, limit: int, cursor: str = None):
+    """Returns one page of a conversation's messages, newest page first.
+
+    Messages within a page are in chronological order; ``next_cursor`` points to the
+    page of older messages.
+    """
+    await ensure_conversation_owner(db, user_id, conversation_id)
+    await message_writer.flush(conversation_id)
+    await message_archiver.restore(db, [conversation_id])
+    statement = (
+        select(Message)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        (before_id,) = decode_cursor(cursor, int)
+        statement = statement.where(Message.id < before_id)
+    messages = (await db.execute(statement)).scalars().all()
+    next_cursor = encode_cursor(messages[limit - 1].id) if len(messages) > limit else None
+    return {"items": list(reversed(messages[:limit])), "next_cursor": next_cursor}
@@ -0,0 +1,185 @@
+# app/api/ai/conversations/writer.py
+import asyncio
+import logging
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+from app.config import settings
+from app.database import async_session
+from .cache import history_cache
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+# Errors caused by the rows themselves; retrying the same rows cannot succeed
+PERMANENT_ERRORS = (IntegrityError, DataError)
+RETRY_BACKOFF_BASE = 0.1
+RETRY_BACKOFF_MAX = 10.0
+# Retries of a failing batch while stopping, so shutdown is not held up forever
+STOP_RETRY_ATTEMPTS = 5
+
+
+class MessageWriter:
+    """Write-behind queue that saves Message rows in multi-row batches.
+
+    Rows are written once BATCH_SIZE of them are queued or FLUSH_INTERVAL has
+    passed, whichever comes first, in a single INSERT and commit. Every queued row
+    has a future that resolves to the saved Message, so callers that need the row
+    (or read-your-writes) can wait for it. ``stop()`` writes everything still
+    queued before returning.
+
+    A batch that fails to write stays at the head of the queue and is retried with
+    exponential backoff until it commits, so an outage delays messages instead of
+    losing them. If the rows themselves are rejected (an integrity or data error),
+    they are written one at a time so only the offending rows fail.
+    """
+
+    def __init__(self, enabled: bool, batch_size: int, flush_interval_ms: int):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._pending = []  # (row, future)
+        self._unsaved = {}  # conversation_id -> futures of rows queued or being written
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self.batches = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.retries = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.enabled and not self.running:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Writes every queued row, then stops the background task."""
+        if not self.running:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+
+    def enqueue(self, conversation_id, role: str, content: str) -> asyncio.Future:
+        """Queues a message and returns a future for the saved Message."""
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_report_failure)
+        key = str(conversation_id)
+        self._unsaved.setdefault(key, set()).add(future)
+        future.add_done_callback(lambda f: self._forget(key, f))
+        self._pending.append(({"conversation_id": conversation_id, "role": role, "content": content}, future))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return future
+
+    async def flush(self, conversation_id=None):
+        """Waits until every message queued so far (for one conversation, if given) is saved."""
+        if conversation_id is None:
+            futures = [future for futures in self._unsaved.values() for future in futures]
+        else:
+            futures = list(self._unsaved.get(str(conversation_id), ()))
+        if not futures:
+            return
+        self._wakeup.set()
+        await asyncio.gather(*futures, return_exceptions=True)
+
+    def _forget(self, key: str, future: asyncio.Future):
+        futures = self._unsaved.get(key)
+        if futures is not None:
+            futures.discard(future)
+            if not futures:
+                del self._unsaved[key]
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            failures = 0
+            while self._pending:
+                batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+                retry = await self._write(batch)
+                if not retry:
+                    failures = 0
+                    continue
+                failures += 1
+                if self._stopping and failures >= STOP_RETRY_ATTEMPTS:
+                    logger.error("Giving up on %s unsaved messages at shutdown", len(retry) + len(self._pending))
+                    self._fail(retry + self._pending, RuntimeError("The message writer stopped before saving this message"))
+                    self._pending = []
+                    break
+                self._pending[:0] = retry
+                self.retries += 1
+                await asyncio.sleep(min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (failures - 1)))
+            if self._stopping:
+                return
+
+    async def _write(self, batch: list) -> list:
+        """Writes a batch in one INSERT; returns the rows to retry after a transient failure."""
+        try:
+            async with async_session() as db:
+                result = await db.execute(
+                    insert(Message).returning(Message, sort_by_parameter_order=True),
+                    [row for row, _ in batch]
+                )
+                messages = result.scalars().all()
+                await db.commit()
+        except PERMANENT_ERRORS as e:
+            if len(batch) == 1:
+                logger.error("Message for conversation %s was rejected: %s", batch[0][0]["conversation_id"], e)
+                self._fail(batch, e)
+                return []
+            # Write the rows one at a time so the rest of the batch is still saved, in order
+            for i, item in enumerate(batch):
+                retry = await self._write([item])
+                if retry:
+                    return retry + batch[i + 1:]
+            return []
+        except Exception:
+            logger.exception("Could not save %s messages; they will be retried", len(batch))
+            return batch
+
+        self.batches += 1
+        self.rows_written += len(messages)
+        by_conversation = {}
+        for message, (_, future) in zip(messages, batch):
+            by_conversation.setdefault(message.conversation_id, []).append(message)
+            if not future.done():
+                future.set_result(message)
+        for conversation_id, conversation_messages in by_conversation.items():
+            history_cache.append(conversation_id, conversation_messages)
+        return []
+
+    def _fail(self, batch: list, error: Exception):
+        self.rows_failed += len(batch)
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "retries": self.retries,
+        }
+
+
+def _report_failure(future: asyncio.Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Failed to save message: %s", future.exception())
+
+
+message_writer = MessageWriter(
+    settings.MESSAGE_WRITE_BEHIND,
+    settings.MESSAGE_WRITE_BATCH_SIZE,
+    settings.MESSAGE_WRITE_FLUSH_MS,
+)
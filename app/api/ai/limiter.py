@@ -0,0 +1,173 @@
+# app/api/ai/limiter.py
+import asyncio
+import random
+import time
+from collections import OrderedDict, deque
+from app.config import settings
+from .backends import LLMBackendError, LLMRateLimitError, LLMTransientError
+
+
+class LLMOverloadedError(LLMBackendError):
+    """Raised when too many LLM calls are already waiting for a slot."""
+
+
+class AdaptiveLimiter:
+    """Shared concurrency limit for upstream LLM calls.
+
+    The limit grows by about one slot for every ``limit`` calls that finish under the
+    target latency, shrinks when calls get slow and halves on every 429 (AIMD). Waiting calls
+    are queued per user and served round-robin, so one busy user cannot starve the
+    rest. Rate-limited and transient failures are retried with jittered backoff.
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int, target_latency_ms: int,
+                 max_queue: int, max_retries: int, backoff_base_ms: int, backoff_max_ms: int):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency_ms / 1000
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base_ms / 1000
+        self.backoff_max = backoff_max_ms / 1000
+        self.in_flight = 0
+        self.queue_depth = 0
+        self._queues = OrderedDict()  # user key -> deque of futures waiting for a slot
+        self.rate_limited = 0
+        self.retries = 0
+        self.rejected = 0
+
+    async def _acquire(self, user_key: str):
+        if self.in_flight < int(self.limit) and not self._queues:
+            self.in_flight += 1
+            return
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise LLMOverloadedError("Too many AI requests are waiting; please retry shortly.")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_key, deque()).append(waiter)
+        self.queue_depth += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled; pass it on
+                self._release()
+            raise
+
+    def _release(self):
+        self.in_flight -= 1
+        self._grant()
+
+    def _grant(self):
+        while self.in_flight < int(self.limit) and self._queues:
+            user_key, waiters = next(iter(self._queues.items()))
+            waiter = waiters.popleft()
+            self.queue_depth -= 1
+            if waiters:
+                self._queues.move_to_end(user_key)
+            else:
+                del self._queues[user_key]
+            if waiter.cancelled():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def _record_latency(self, latency: float):
+        if latency <= self.target_latency:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        else:
+            self.limit = max(self.min_limit, self.limit * 0.9)
+        self._grant()
+
+    def _record_rate_limited(self):
+        self.rate_limited += 1
+        self.limit = max(self.min_limit, self.limit / 2)
+
+    async def _backoff(self, attempt: int):
+        self.retries += 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        await asyncio.sleep(random.uniform(0, delay))
+
+    async def run(self, user_key: str, call):
+        """Runs ``await call()`` inside a slot, retrying rate-limited and transient failures."""
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(user_key)
+            start = time.monotonic()
+            try:
+                result = await call()
+            except LLMRateLimitError:
+                self._record_rate_limited()
+                if attempt == self.max_retries:
+                    raise
+            except LLMTransientError:
+                if attempt == self.max_retries:
+                    raise
+            else:
+                self._record_latency(time.monotonic() - start)
+                return result
+            finally:
+                self._release()
+            await self._backoff(attempt)
+
+    async def stream(self, user_key: str, open_stream):
+        """Yields from ``open_stream()`` while holding a slot for the whole stream.
+
+        Failures before the first token are retried; the time to the first token is
+        what the limit adapts to.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(user_key)
+            start = time.monotonic()
+            tokens = open_stream().__aiter__()
+            try:
+                first = await tokens.__anext__()
+            except StopAsyncIteration:
+                self._release()
+                return
+            except LLMRateLimitError:
+                self._record_rate_limited()
+                self._release()
+                if attempt == self.max_retries:
+                    raise
+            except LLMTransientError:
+                self._release()
+                if attempt == self.max_retries:
+                    raise
+            except BaseException:
+                self._release()
+                raise
+            else:
+                try:
+                    self._record_latency(time.monotonic() - start)
+                    yield first
+                    async for token in tokens:
+                        yield token
+                finally:
+                    self._release()
+                return
+            await self._backoff(attempt)
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "users_waiting": len(self._queues),
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "rejected": self.rejected,
+        }
+
+
+limiter = AdaptiveLimiter(
+    initial=settings.LLM_CONCURRENCY_INITIAL,
+    min_limit=settings.LLM_CONCURRENCY_MIN,
+    max_limit=settings.LLM_CONCURRENCY_MAX,
+    target_latency_ms=settings.LLM_TARGET_LATENCY_MS,
+    max_queue=settings.LLM_MAX_QUEUE,
+    max_retries=settings.LLM_MAX_RETRIES,
+    backoff_base_ms=settings.LLM_BACKOFF_BASE_MS,
+    backoff_max_ms=settings.LLM_BACKOFF_MAX_MS,
+)
@@ -1,65 +1,208 @@
-import openai
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
+import asyncio
+import json
+import logging
+from sqlalchemy.future import select
 from app.models import User
-from app.api.persona.models import Persona
-from .conversations.models import Message, Conversation
-from app.config import settings
+from app.api.persona.registry import persona_registry
+from .conversations.models import Conversation
+from app.database import async_session
 from fastapi import HTTPException
-from sqlalchemy.future import select
-from app.api.persona.utils import get_persona_system_message
+from .backends import get_backend, LLMBackendError, LLMRateLimitError
+from .limiter import limiter, LLMOverloadedError
+from .context import load_context
+from .conversations.service import add_message_to_conversation, load_conversation_histories
+from app.config import settings
+from .responses import responses, response_key
 from uuid import UUID
-# Load environment variables from .env file
-load_dotenv() 
 
-# Get OpenAI API key from environment variables
-openai.api_key = settings.OPENAI_API_KEY
-print("OPEN AI KEY",openai.api_key)
-if not openai.api_key:
-    raise ValueError("OPENAI_API_KEY environment variable not set.")
+logger = logging.getLogger(__name__)
+
+CHAT_MODEL = "gpt-4-turbo-2024-04-09"
+CHAT_MAX_TOKENS = 400
+CHAT_TEMPERATURE = 0.8
+RETRY_AFTER_SECONDS = 5
+# Turns being saved after their batch stream ended
+_background_saves = set()
+
+def llm_http_error(error: LLMBackendError) -> HTTPException:
+    """Maps a backend failure to the HTTP error returned to the client."""
+    if isinstance(error, (LLMRateLimitError, LLMOverloadedError)):
+        return HTTPException(
+            status_code=503,
+            detail="The AI service is busy, please try again shortly.",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+        )
+    return HTTPException(status_code=502, detail=f"The AI service failed to respond: {error}")
+
+async def prepare_ai_turn(prompt: str, user: User, db, conversation_id: UUID = None):
+    """Builds the chat history for a new turn and records the user's message.
 
-# Create an OpenAI client instance
-client = OpenAI(api_key=openai.api_key)
+    Returns:
+        tuple: The selected PersonaEntry and the list of chat messages to send to the LLM backend.
+    """
+    conversation_history = []
+    persona = await persona_registry.get(user.selected_persona_id)
+    if persona:
+            conversation_history.append({"role": "system", "content": persona.system_prompt})
+    else:
+        raise HTTPException(status_code=404, detail="Persona not found")
+    conversation = await db.get(Conversation, conversation_id)
+    if not conversation or str(conversation.user_id) != str(user.id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    context = await load_context(db, conversation_id, CHAT_MODEL)
+    await db.commit()  # Keeps any messages restored from the archive
+    conversation_history.extend(context.to_chat_messages())
+    if conversation_history[-1] == {"role": "user", "content": prompt}:
+        # A retry or duplicate submit of a turn that is already recorded
+        conversation_history.pop()
+    else:
+        await add_message_to_conversation(db, conversation_id, "user", prompt, wait=False)
+    conversation_history.append({"role": "user", "content": prompt})
+    return persona, conversation_history
 
 async def get_ai_response(prompt: str, user: User, db, conversation_id: UUID = None):
     try:
-        conversation_history = []
-        persona = await db.get(Persona, user.selected_persona_id)
-        if persona:
-                system_message = get_persona_system_message(persona)
-                conversation_history.append({"role": "system", "content": system_message})
-        else:
-            raise HTTPException(status_code=404, detail="Persona not found")
-        conversation = await db.get(Conversation, conversation_id)
-        try:
-            conversation_stmt = select(Message).where(
-                Message.conversation_id == conversation_id
-            ).order_by(Message.created_at)
-            result = await db.execute(conversation_stmt)
-            messages = result.scalars().all()
-            if messages:
-                context = "\n".join([f"{message.role}: {message.content}" for message in messages])
-                context_message = f"Here is the context of the previous conversation for your reference, please keep this conversation in mind for further interactions: {context}"
-                conversation_history.append({"role": "system", "content": context_message})
-        except Exception as e:
-            print(e)
-        if not conversation:
-            raise HTTPException(status_code=404, detail="Conversation not found")
-        conversation_history.append({"role": "user", "content": prompt})
-        user_message = Message(conversation_id=conversation_id, role="user", content=prompt)
-        db.add(user_message)
-        await db.commit()
-        response = client.chat.completions.create(
-            model="gpt-4-turbo-2024-04-09",
-            messages=conversation_history,
-            max_tokens=400,
-            temperature=0.8
+        persona, conversation_history = await prepare_ai_turn(prompt, user, db, conversation_id)
+        key = response_key(
+            persona.id, conversation_history[:-1], prompt,
+            model=CHAT_MODEL, max_tokens=CHAT_MAX_TOKENS, temperature=CHAT_TEMPERATURE
         )
-        ai_response = response.choices[0].message.content.strip()
-        ai_message = Message(conversation_id=conversation_id, role=persona.name, content=ai_response)
-        db.add(ai_message)
-        await db.commit()
+
+        async def create():
+            return await limiter.run(str(user.id), lambda: get_backend().complete(
+                conversation_history, CHAT_MODEL, CHAT_MAX_TOKENS, CHAT_TEMPERATURE
+            ))
+
+        ai_response, shared = await responses.get(key, create, cacheable=CHAT_TEMPERATURE == 0)
+        if shared:
+            # The caller whose request produced this reply has already saved it
+            return ai_response
+        await add_message_to_conversation(db, conversation_id, persona.name, ai_response, wait=False)
         return ai_response
+    except HTTPException:
+        raise
+    except LLMBackendError as e:
+        raise llm_http_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
+async def stream_ai_response(conversation_history: list, persona_name: str, conversation_id: UUID, user_key: str):
+    """Streams an AI reply as NDJSON lines and saves the full reply once the stream ends.
+
+    Each token arrives as ``{"token": ...}``; the final line is ``{"done": true, "response": ...}``.
+    The request session is already closed while the body streams, so the reply is saved
+    through a session of its own.
+    """
+    parts = []
+    try:
+        stream = limiter.stream(user_key, lambda: get_backend().stream(
+            conversation_history, CHAT_MODEL, CHAT_MAX_TOKENS, CHAT_TEMPERATURE
+        ))
+        async for token in stream:
+            parts.append(token)
+            yield json.dumps({"token": token}) + "\n"
+
+        ai_response = "".join(parts).strip()
+        async with async_session() as db:
+            await add_message_to_conversation(db, conversation_id, persona_name, ai_response, wait=False)
+        yield json.dumps({"done": True, "response": ai_response}) + "\n"
     except Exception as e:
-        return f"An error occurred: {e}"
+        yield json.dumps({"error": f"An error occurred: {e}"}) + "\n"
+
+async def prepare_ai_batch(items: list, user: User, db):
+    """Builds the chat history for every item of a batch with one persona lookup and one history read.
+
+    Items are independent: two items for the same conversation do not see each other's turn.
+
+    Returns:
+        tuple: The selected PersonaEntry and one list of chat messages per item.
+    """
+    persona = await persona_registry.get(user.selected_persona_id)
+    if not persona:
+        raise HTTPException(status_code=404, detail="Persona not found")
+    system_message = persona.system_prompt
+
+    conversation_ids = list({item.conversation_id for item in items})
+    result = await db.execute(
+        select(Conversation.id).where(Conversation.id.in_(conversation_ids), Conversation.user_id == user.id)
+    )
+    missing = set(conversation_ids) - set(result.scalars().all())
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Conversation not found: {', '.join(sorted(map(str, missing)))}")
+
+    await load_conversation_histories(db, conversation_ids)
+    await db.commit()  # Keeps any messages restored from the archive
+    batch_history = []
+    for item in items:
+        context = await load_context(db, item.conversation_id, CHAT_MODEL)
+        batch_history.append(
+            [{"role": "system", "content": system_message}]
+            + context.to_chat_messages()
+            + [{"role": "user", "content": item.prompt}]
+        )
+    return persona, batch_history
+
+async def _save_turn(conversation_id: UUID, prompt: str, persona_name: str, response: str):
+    async with async_session() as db:
+        await add_message_to_conversation(db, conversation_id, "user", prompt)
+        await add_message_to_conversation(db, conversation_id, persona_name, response)
+
+def _save_turn_in_background(conversation_id: UUID, prompt: str, persona_name: str, response: str) -> asyncio.Task:
+    """Saves a finished turn in a task of its own, so it is kept even if the client disconnects."""
+    task = asyncio.create_task(_save_turn(conversation_id, prompt, persona_name, response))
+    # The event loop only holds weak references to tasks
+    _background_saves.add(task)
+    task.add_done_callback(_background_saves.discard)
+    task.add_done_callback(_report_save_failure)
+    return task
+
+def _report_save_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Failed to save batch turn: %s", task.exception())
+
+async def stream_batch_responses(items: list, batch_history: list, persona_name: str, user_key: str):
+    """Runs a batch of completions with bounded concurrency and streams each result as NDJSON.
+
+    Results arrive as ``{"index": ..., "conversation_id": ..., "response": ...}`` (or ``"error"``)
+    in completion order. Each successful item's prompt and reply are saved as soon as it
+    finishes, through the message writer, in a background task that outlives a client
+    disconnect; failed items save nothing. A final ``{"done": true, ...}`` line is sent once
+    everything is saved.
+    """
+    semaphore = asyncio.Semaphore(settings.AI_BATCH_CONCURRENCY)
+    saves = []
+
+    async def run(index):
+        async with semaphore:
+            try:
+                response = await limiter.run(user_key, lambda: get_backend().complete(
+                    batch_history[index], CHAT_MODEL, CHAT_MAX_TOKENS, CHAT_TEMPERATURE
+                ))
+            except Exception as e:
+                return index, None, str(e)
+            item = items[index]
+            saves.append(_save_turn_in_background(item.conversation_id, item.prompt, persona_name, response))
+            return index, response, None
+
+    tasks = [asyncio.ensure_future(run(index)) for index in range(len(items))]
+    completed = 0
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            index, response, error = await next_result
+            line = {"index": index, "conversation_id": str(items[index].conversation_id)}
+            if error is None:
+                completed += 1
+                line["response"] = response
+            else:
+                line["error"] = f"An error occurred: {error}"
+            yield json.dumps(line) + "\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    results = await asyncio.gather(*(asyncio.shield(save) for save in saves), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        yield json.dumps({"done": True, "error": f"Failed to save messages: {errors[0]}"}) + "\n"
+        return
+    yield json.dumps({"done": True, "completed": completed, "failed": len(items) - completed}) + "\n"
@@ -0,0 +1,83 @@
+# app/api/ai/responses.py
+import asyncio
+import hashlib
+import json
+from cachetools import TTLCache
+from app.config import settings
+
+
+def response_key(persona_id: int, context: list, prompt: str, **params) -> str:
+    """Builds the cache key for a completion from the persona, context, prompt and model parameters."""
+    context_fingerprint = hashlib.sha256(
+        json.dumps(context, sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()
+    payload = json.dumps(
+        [persona_id, context_fingerprint, prompt, sorted(params.items())],
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseLayer:
+    """Coalesces identical in-flight completions and caches deterministic ones.
+
+    Concurrent callers with the same key share a single upstream call. Results of
+    deterministic calls (temperature 0) are also kept for a short TTL.
+    """
+
+    def __init__(self, ttl: int, maxsize: int):
+        self._inflight = {}
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl) if ttl > 0 else None
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    async def get(self, key: str, create, cacheable: bool = False):
+        """Returns ``(result, shared)``; ``shared`` is True when another call produced the result."""
+        while True:
+            if cacheable and self._cache is not None and key in self._cache:
+                self.cache_hits += 1
+                return self._cache[key], True
+
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            try:
+                result = await asyncio.shield(future)
+                self.coalesced += 1
+                return result, True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The caller that owned the upstream call went away; try again ourselves
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting on this future, so retrieve its exception to keep asyncio quiet
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result = await create()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        future.set_result(result)
+        if cacheable and self._cache is not None:
+            self._cache[key] = result
+        return result, False
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "cached": len(self._cache) if self._cache is not None else 0,
+        }
+
+
+responses = ResponseLayer(settings.RESPONSE_CACHE_TTL, settings.RESPONSE_CACHE_SIZE)
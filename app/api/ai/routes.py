@@ -1,8 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_async_session
-from app.api.ai.schemas import PromptSchema, AIResponseSchema
-from app.api.ai.openai_utils import get_ai_response
+from app.api.ai.schemas import PromptSchema, AIResponseSchema, BatchPromptSchema
+from app.api.ai.openai_utils import (
+    get_ai_response,
+    prepare_ai_turn,
+    stream_ai_response,
+    prepare_ai_batch,
+    stream_batch_responses
+)
 from app.api.auth.manager import get_current_user
 from app.models import User
 
@@ -21,3 +28,39 @@ async def get_response(
         )
     ai_response = await get_ai_response(prompt.prompt, user, db, prompt.conversation_id)
     return {"response": ai_response}
+
+@router.post("/ai/respond/stream")
+async def stream_response(
+    prompt: PromptSchema,
+    db: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_user),
+):
+    """Streams the AI reply as NDJSON, one line per token as it arrives."""
+    if not user.selected_persona_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Please select a persona first."
+        )
+    persona, conversation_history = await prepare_ai_turn(prompt.prompt, user, db, prompt.conversation_id)
+    return StreamingResponse(
+        stream_ai_response(conversation_history, persona.name, prompt.conversation_id, str(user.id)),
+        media_type="application/x-ndjson"
+    )
+
+@router.post("/ai/respond/batch")
+async def batch_response(
+    batch: BatchPromptSchema,
+    db: AsyncSession = Depends(get_async_session),
+    user: User = Depends(get_current_user),
+):
+    """Answers many (conversation_id, prompt) pairs in one request, streaming NDJSON results as they finish."""
+    if not user.selected_persona_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Please select a persona first."
+        )
+    persona, batch_history = await prepare_ai_batch(batch.items, user, db)
+    return StreamingResponse(
+        stream_batch_responses(batch.items, batch_history, persona.name, str(user.id)),
+        media_type="application/x-ndjson"
+    )
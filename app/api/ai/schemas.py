@@ -1,9 +1,18 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List
 from uuid import UUID
+from app.config import settings
 
 class PromptSchema(BaseModel):
     prompt: str
     conversation_id: UUID = None
 
 class AIResponseSchema(BaseModel):
-    response: str
\ No newline at end of file
+    response: str
+
+class BatchPromptItemSchema(BaseModel):
+    conversation_id: UUID
+    prompt: str
+
+class BatchPromptSchema(BaseModel):
+    items: List[BatchPromptItemSchema] = Field(..., min_length=1, max_length=settings.AI_BATCH_MAX_ITEMS)
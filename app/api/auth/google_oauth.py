@@ -0,0 +1,90 @@
+# app/api/auth/google_oauth.py
+import json
+from datetime import datetime, timedelta
+from functools import lru_cache
+import httpx
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import Flow
+from app.config import settings
+
+CLIENT_SECRETS_FILE = "client_secret.json"
+GOOGLE_USERINFO_URI = "https://www.googleapis.com/oauth2/v3/userinfo"
+
+_http_client = None
+
+
+@lru_cache(maxsize=1)
+def load_client_config() -> dict:
+    """Reads and parses client_secret.json once per process."""
+    with open(CLIENT_SECRETS_FILE) as f:
+        return json.load(f)
+
+
+def _client_info() -> dict:
+    config = load_client_config()
+    return config.get("web") or config["installed"]
+
+
+def get_google_flow(redirect_uri: str) -> Flow:
+    return Flow.from_client_config(
+        load_client_config(),
+        scopes=settings.SCOPES.split(","),
+        redirect_uri=redirect_uri
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared HTTP/2 client for Google's OAuth endpoints; connections are kept alive between requests."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=settings.GOOGLE_HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.GOOGLE_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GOOGLE_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.GOOGLE_HTTP_KEEPALIVE_SECONDS,
+            ),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def exchange_code(code: str, redirect_uri: str) -> Credentials:
+    """Exchanges an authorization code for Google credentials without blocking the event loop."""
+    client_info = _client_info()
+    response = await get_http_client().post(client_info["token_uri"], data={
+        "grant_type": "authorization_code",
+        "code": code,
+        "redirect_uri": redirect_uri,
+        "client_id": client_info["client_id"],
+        "client_secret": client_info["client_secret"],
+    })
+    response.raise_for_status()
+    token = response.json()
+    credentials = Credentials(
+        token["access_token"],
+        refresh_token=token.get("refresh_token"),
+        id_token=token.get("id_token"),
+        token_uri=client_info["token_uri"],
+        client_id=client_info["client_id"],
+        client_secret=client_info["client_secret"],
+        scopes=settings.SCOPES.split(","),
+        granted_scopes=token.get("scope", "").split(),
+    )
+    credentials.expiry = datetime.utcnow() + timedelta(seconds=int(token.get("expires_in", 3600)))
+    return credentials
+
+
+async def fetch_user_info(access_token: str) -> dict:
+    response = await get_http_client().get(
+        GOOGLE_USERINFO_URI,
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    return response.json()
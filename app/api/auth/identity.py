@@ -0,0 +1,151 @@
+# app/api/auth/identity.py
+import hashlib
+import time
+from datetime import datetime, timezone
+from typing import Optional
+from cachetools import TLRUCache
+from fastapi import Request
+from fastapi_users.jwt import decode_jwt
+from sqlalchemy import delete, event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import async_session
+from app.models import RevokedToken, User
+
+JWT_AUDIENCE = "fastapi-users:auth"
+_UNRESOLVED = object()
+
+
+def token_from_request(request: Request) -> Optional[str]:
+    """Returns the JWT from the Authorization cookie, without the "Bearer" prefix."""
+    token = request.cookies.get("Authorization")
+    return token.split(" ")[-1] if token else None
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _decode(token: str) -> Optional[dict]:
+    try:
+        return decode_jwt(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM], audience=JWT_AUDIENCE)
+    except Exception:
+        return None
+
+
+class IdentityCache:
+    """Process-wide cache of authenticated users, keyed by a hash of their JWT.
+
+    A hit skips both the JWT decode and the user query. Entries live for
+    IDENTITY_CACHE_TTL seconds and never past the token's expiry. They are dropped
+    when the user is committed (persona selection, deactivation) and when the token
+    is logged out. Logouts are stored in ``revoked_tokens``, which every worker checks
+    before caching a token, so a token another worker still has cached stops working
+    there within IDENTITY_CACHE_TTL. Cached users are detached snapshots without relationships loaded;
+    attach them to a session with ``merge(load=False)`` before use. Google tokens
+    are read from their own table, since the refresh scheduler rewrites them often.
+    """
+
+    def __init__(self, ttl: int, maxsize: int):
+        self.ttl = ttl
+        self._users = TLRUCache(maxsize=maxsize, ttu=self._user_expiry)
+        self._revoked = TLRUCache(maxsize=maxsize, ttu=self._revoked_expiry)
+        self.hits = 0
+        self.misses = 0
+
+    def _user_expiry(self, key, entry, now):
+        _, expires_at = entry
+        if expires_at is None:
+            return now + self.ttl
+        return now + max(0, min(self.ttl, expires_at - time.time()))
+
+    def _revoked_expiry(self, key, expires_at, now):
+        return now + max(0, expires_at - time.time())
+
+    async def resolve(self, request: Request) -> Optional[User]:
+        """Returns the request's user, or None; resolved at most once per request."""
+        user = getattr(request.state, "identity", _UNRESOLVED)
+        if user is _UNRESOLVED:
+            user = request.state.identity = await self._resolve_token(token_from_request(request))
+        return user
+
+    async def _resolve_token(self, token: Optional[str]) -> Optional[User]:
+        if not token:
+            return None
+        key = _token_key(token)
+        if key in self._revoked:
+            return None
+        entry = self._users.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        payload = _decode(token)
+        if not payload or not payload.get("sub"):
+            return None
+        async with async_session() as db:
+            revoked_until = await db.scalar(select(RevokedToken.expires_at).where(RevokedToken.token_hash == key))
+            if revoked_until is not None:
+                self._revoked[key] = revoked_until.replace(tzinfo=timezone.utc).timestamp()
+                return None
+            result = await db.execute(
+                select(User).where(User.id == payload["sub"])
+            )
+            user = result.scalar_one_or_none()
+            db.expunge_all()
+        if user is None or user.is_active is False:
+            return None
+        self._users[key] = (user, payload.get("exp"))
+        return user
+
+    async def revoke(self, token: str):
+        """Rejects a logged-out token until it expires: at once in this process, and in every worker once saved."""
+        key = _token_key(token)
+        self._users.pop(key, None)
+        payload = _decode(token)
+        if payload is None:
+            return  # Invalid or expired tokens are rejected anyway
+        expires_at = payload.get("exp") or time.time() + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        self._revoked[key] = expires_at
+        async with async_session() as db:
+            await db.execute(
+                pg_insert(RevokedToken)
+                .values(token_hash=key, expires_at=datetime.utcfromtimestamp(expires_at))
+                .on_conflict_do_nothing(index_elements=[RevokedToken.token_hash])
+            )
+            # Logouts are rare, so expired revocations are cleaned up here rather than by a job
+            await db.execute(delete(RevokedToken).where(RevokedToken.expires_at < datetime.utcnow()))
+            await db.commit()
+
+    def invalidate_user(self, user_id):
+        """Drops every cached token of a user, so the next request reloads them."""
+        for key, (user, _) in list(self._users.items()):
+            if str(user.id) == str(user_id):
+                self._users.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._users),
+            "revoked": len(self._revoked),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+identity_cache = IdentityCache(settings.IDENTITY_CACHE_TTL, settings.IDENTITY_CACHE_SIZE)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_identity_writes(session, flush_context):
+    for instance in session.new | session.dirty | session.deleted:
+        if isinstance(instance, User):
+            session.info.setdefault("identity_changes", set()).add(instance.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    for user_id in session.info.pop("identity_changes", ()):
+        identity_cache.invalidate_user(user_id)
@@ -3,41 +3,26 @@ from fastapi import Depends, Request, HTTPException
 from fastapi.responses import RedirectResponse
 from fastapi_users.db import SQLAlchemyUserDatabase
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi_users.jwt import decode_jwt
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from app.database import get_async_session
 from app.models import User
 from app.config import settings
+from app.api.auth.identity import identity_cache
 
 
 
 async def get_current_user(request: Request, db: AsyncSession = Depends(get_async_session)) -> Optional[User]:
     """
     Authenticates user from JWT token stored in a cookie.
-    """
-    token = request.cookies.get("Authorization")
-    if token:
-        token = token.split(" ")[-1]  # No cookie, user is not authenticated
-    else:
-        print("No token found")
-        RedirectResponse(url="/static/access-denied.html") 
-        return None
-    try:
-        payload = decode_jwt(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM], audience="fastapi-users:auth")
-        user_id = payload.get("sub")  # Extract user ID from JWT payload
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token: Missing user ID")
-
-        user = await db.get(User, user_id)  # Fetch user from database
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid token: User not found")
 
-        return user
-
-    except Exception as e:
-        RedirectResponse(url="/static/access-denied.html") 
+    The user is resolved once per request through the identity cache and attached
+    to this request's session without another query.
+    """
+    user = await identity_cache.resolve(request)
+    if user is None:
         return None
+    return await db.merge(user, load=False)
         
 
 # Provide a session to user_db
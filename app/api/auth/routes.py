@@ -3,9 +3,6 @@ from fastapi import APIRouter, Request, Depends, HTTPException, status, Response
 from fastapi.responses import RedirectResponse, JSONResponse
 from fastapi_users import FastAPIUsers
 from fastapi_users.authentication import AuthenticationBackend, BearerTransport, JWTStrategy
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request as GoogleRequest
 from app.config import settings
 from .manager import get_user_manager
 from app.database import get_async_session
@@ -14,7 +11,6 @@ from fastapi_users.db import SQLAlchemyUserDatabase
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.dialects.postgresql import UUID
 from typing import Optional
-from app.database import connect_to_db, close_db_connection
 from traceback import print_exc
 from urllib.parse import parse_qs, urlencode
 import httpx
@@ -22,6 +18,8 @@ from sqlalchemy.sql import select
 from fastapi_users.jwt import generate_jwt, decode_jwt
 from datetime import datetime, timedelta
 from app.api.auth.manager import get_current_user
+from app.api.auth.identity import identity_cache, token_from_request
+from app.api.auth.google_oauth import get_google_flow, exchange_code, fetch_user_info
 from sqlalchemy.orm import joinedload
 import json
 
@@ -48,55 +46,6 @@ current_superuser = fastapi_users.current_user(superuser=True)
 
 router = APIRouter(tags=["Authentication"])
 
-@router.on_event("startup")
-async def startup():
-    await connect_to_db()
-
-@router.on_event("shutdown")
-async def shutdown():
-    await close_db_connection()
-
-def get_google_flow(redirect_uri: str) -> Flow:
-    return Flow.from_client_secrets_file(
-        'client_secret.json',
-        scopes= settings.SCOPES.split(","),
-        redirect_uri=redirect_uri
-    )
-
-
-async def refresh_google_token(user: User, db: AsyncSession):
-
-    google_credentials = user.google_credentials
-    if google_credentials and google_credentials.refresh_token:
-        credentials = Credentials(
-            token=None,
-            refresh_token=google_credentials.refresh_token,
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=settings.GOOGLE_CLIENT_ID,
-            client_secret=settings.GOOGLE_CLIENT_SECRET,
-        )
-        credentials.refresh(GoogleRequest())
-        
-        # Update the credentials in the database
-        google_credentials.access_token = credentials.token
-        google_credentials.expires_at = credentials.expiry
-        await db.commit()
-        return credentials.token
-    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unable to refresh token")
-
-async def check_and_refresh_token(request: Request, call_next):
-    user = await get_current_user(request)
-    if user:
-        db = await get_async_session()
-        google_credentials = user.google_credentials
-        if google_credentials and google_credentials.expires_at <= datetime.utcnow():
-            try:
-                await refresh_google_token(user, db)
-            except HTTPException as e:
-                return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
-    response = await call_next(request)
-    return response
-
 # --- Google Signup ---
 @router.get("/google/signup")
 async def google_signup(request: Request):
@@ -114,18 +63,9 @@ async def google_signup(request: Request):
 async def google_signup_callback(request: Request, db: AsyncSession = Depends(get_async_session)):
     """Callback for Google signup."""
     try:
-        redirect_uri = request.url_for("google_signup_callback")
-        flow = get_google_flow(redirect_uri)
-        flow.fetch_token(authorization_response=request.url._url)
-        credentials = flow.credentials
-
-
-        async with httpx.AsyncClient() as client:
-            user_info = await client.get(
-                "https://www.googleapis.com/oauth2/v3/userinfo",
-                headers={"Authorization": f"Bearer {credentials.token}"},
-            )
-            user_info = user_info.json()
+        redirect_uri = str(request.url_for("google_signup_callback"))
+        credentials = await exchange_code(request.query_params["code"], redirect_uri)
+        user_info = await fetch_user_info(credentials.token)
 
         # Check if user already exists (you might want to handle this differently)
         existing_user = await db.execute(select(User).where(User.google_id == user_info["sub"]))
@@ -182,18 +122,9 @@ async def google_login(request: Request):
 async def google_login_callback(request: Request, db: AsyncSession = Depends(get_async_session)):
     """Callback for Google login."""
     try:
-        redirect_uri = request.url_for("google_login_callback")
-        flow = get_google_flow(redirect_uri)
-        flow.fetch_token(authorization_response=request.url._url)
-        credentials = flow.credentials
-
-
-        async with httpx.AsyncClient() as client:
-            user_info = await client.get(
-                "https://www.googleapis.com/oauth2/v3/userinfo",
-                headers={"Authorization": f"Bearer {credentials.token}"},
-            )
-            user_info = user_info.json()
+        redirect_uri = str(request.url_for("google_login_callback"))
+        credentials = await exchange_code(request.query_params["code"], redirect_uri)
+        user_info = await fetch_user_info(credentials.token)
 
         # Find existing user
         result = await db.execute(
@@ -218,6 +149,9 @@ async def google_login_callback(request: Request, db: AsyncSession = Depends(get
                 user.google_credentials.refresh_token = credentials.refresh_token
                 user.google_credentials.access_token = credentials.token
                 user.google_credentials.expires_at = credentials.expiry
+                user.google_credentials.refresh_failures = 0
+                user.google_credentials.next_refresh_at = None
+                user.google_credentials.refresh_error = None
         await db.commit()
 
         # Generate JWT token and set cookie
@@ -230,6 +164,21 @@ async def google_login_callback(request: Request, db: AsyncSession = Depends(get
         print_exc()
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
+# --- Logout ---
+@router.post("/auth/logout")
+async def logout(request: Request):
+    """Logs out: the cookie's token is no longer accepted and the cookie is cleared.
+
+    The token is rejected at once by this worker; others that have it cached stop
+    accepting it within IDENTITY_CACHE_TTL seconds.
+    """
+    token = token_from_request(request)
+    if token:
+        await identity_cache.revoke(token)
+    response = JSONResponse(content={"detail": "Logged out"})
+    response.delete_cookie("Authorization")
+    return response
+
 # --- Refresh Token ---
 @router.post("/auth/jwt/refresh")
 async def refresh_jwt_token(response: Response, user: User = Depends(get_current_user)):
@@ -0,0 +1,268 @@
+# app/api/auth/token_refresh.py
+import asyncio
+import logging
+import random
+from datetime import datetime, timedelta
+import httpx
+from fastapi import HTTPException, status
+from sqlalchemy import Interval, bindparam, func, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.config import settings
+from app.database import async_session
+from app.models import GoogleCredentials
+from app.api.auth.google_oauth import get_http_client
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_TOKEN_URI = "https://oauth2.googleapis.com/token"
+# How long a claimed credential is left to the worker that claimed it
+REFRESH_CLAIM_LEASE = timedelta(minutes=5)
+# Tokens this close to expiry are refreshed in the request path if the scheduler has not got to them
+MIN_TOKEN_LIFETIME = timedelta(seconds=60)
+# Longest wait before retrying a refresh token that keeps failing
+MAX_REFRESH_BACKOFF_SECONDS = 3600
+
+
+class GoogleTokenRefreshError(Exception):
+    """Raised when Google refuses or fails to refresh an access token."""
+
+
+class GoogleTokenRevokedError(GoogleTokenRefreshError):
+    """Raised when Google rejects the refresh token itself (``invalid_grant``); retrying cannot help."""
+
+
+def _oauth_error(response: httpx.Response):
+    try:
+        return response.json().get("error")
+    except ValueError:
+        return None
+
+
+class GoogleTokenRefresher:
+    """Refreshes users' Google access tokens shortly before they expire.
+
+    Every GOOGLE_TOKEN_REFRESH_INTERVAL_SECONDS (plus jitter) each worker claims the
+    credentials expiring within the refresh lead that no other worker holds, refreshes
+    them concurrently over the shared Google HTTP client and saves the new tokens in one
+    batched UPDATE. Each credential gets a random extra lead so refreshes do not bunch up. Refreshes are
+    single-flight per user. Failing refresh tokens back off exponentially through
+    ``next_refresh_at``, shared by every worker, and revoked ones (``invalid_grant``)
+    are not retried until the user signs in again.
+    Request handlers only read tokens; ``ensure_fresh`` is a fallback for the rare
+    token the scheduler has not refreshed yet.
+    """
+
+    def __init__(self, lead_seconds: int, interval_seconds: int, jitter_seconds: int,
+                 concurrency: int, batch_size: int):
+        self.lead = lead_seconds
+        self.interval = interval_seconds
+        self.jitter = jitter_seconds
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self._task = None
+        self._inflight = {}  # user_id -> task exchanging that user's refresh token
+        self._listeners = []  # called with the user_id of every refreshed token
+        self.rounds = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.revoked = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def add_listener(self, callback):
+        """Registers ``callback(user_id)``, called after a user's new token is saved, e.g. to drop cached clients."""
+        self._listeners.append(callback)
+
+    def _notify(self, user_ids):
+        for user_id in user_ids:
+            for callback in self._listeners:
+                callback(user_id)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Google token refresh round failed")
+            await asyncio.sleep(self.interval + random.uniform(0, self.jitter))
+
+    async def run_once(self):
+        """Refreshes every credential that is due, claiming them first so no lock is held over HTTP.
+
+        Due rows are claimed in one short transaction by stamping ``refresh_claimed_at``;
+        rows claimed by another worker within REFRESH_CLAIM_LEASE, rows backing off until
+        ``next_refresh_at`` and revoked rows are skipped in the query itself. Once every
+        refresh has finished, the outcomes are saved in a second short transaction: new
+        tokens in one batched UPDATE, failures with their next attempt time.
+        """
+        self.rounds += 1
+        due = await self._claim_due()
+        if not due:
+            return
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh_row(row):
+            async with semaphore:
+                try:
+                    return row, await self.refresh(row.user_id, row.refresh_token), None
+                except GoogleTokenRefreshError as e:
+                    logger.warning("Could not refresh Google token for user %s: %s", row.user_id, e)
+                    return row, None, e
+
+        refreshed, retry, revoked = [], [], []
+        for row, token, error in await asyncio.gather(*(refresh_row(row) for row in due)):
+            if error is None:
+                access_token, expires_at = token
+                refreshed.append((row.user_id, {
+                    "id": row.id, "access_token": access_token, "expires_at": expires_at, "refresh_claimed_at": None,
+                    "refresh_failures": 0, "next_refresh_at": None,
+                }))
+            elif isinstance(error, GoogleTokenRevokedError):
+                revoked.append({"id": row.id, "refresh_error": str(error), "refresh_claimed_at": None})
+            else:
+                failures = row.refresh_failures + 1
+                retry.append({
+                    "credential_id": row.id,
+                    "failures": failures,
+                    "delay": timedelta(seconds=min(MAX_REFRESH_BACKOFF_SECONDS, self.interval * 2 ** failures)),
+                })
+
+        # No connection is held during the HTTP phase; the outcomes are saved together afterwards
+        async with async_session() as db:
+            if refreshed:
+                await db.execute(update(GoogleCredentials), [values for _, values in refreshed])
+            if revoked:
+                await db.execute(update(GoogleCredentials), revoked)
+            if retry:
+                await db.execute(
+                    update(GoogleCredentials)
+                    .where(GoogleCredentials.id == bindparam("credential_id"))
+                    .values(
+                        refresh_failures=bindparam("failures"),
+                        next_refresh_at=func.now() + bindparam("delay", type_=Interval()),
+                        refresh_claimed_at=None,
+                    )
+                    .execution_options(synchronize_session=False),
+                    retry
+                )
+            await db.commit()
+        self._notify(user_id for user_id, _ in refreshed)
+
+    async def _claim_due(self) -> list:
+        now = datetime.utcnow()
+        async with async_session() as db:
+            result = await db.execute(
+                select(GoogleCredentials.id, GoogleCredentials.user_id, GoogleCredentials.refresh_token,
+                       GoogleCredentials.expires_at, GoogleCredentials.refresh_failures)
+                .where(or_(
+                    GoogleCredentials.expires_at.is_(None),
+                    GoogleCredentials.expires_at <= now + timedelta(seconds=self.lead + self.jitter)
+                ))
+                .where(or_(
+                    GoogleCredentials.refresh_claimed_at.is_(None),
+                    GoogleCredentials.refresh_claimed_at <= func.now() - REFRESH_CLAIM_LEASE
+                ))
+                .where(or_(GoogleCredentials.next_refresh_at.is_(None), GoogleCredentials.next_refresh_at <= func.now()))
+                .where(GoogleCredentials.refresh_error.is_(None))
+                .order_by(GoogleCredentials.expires_at.asc().nulls_first())
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            due = [
+                row for row in result.all()
+                if row.expires_at is None or row.expires_at <= now + timedelta(seconds=self.lead + random.uniform(0, self.jitter))
+            ]
+            if due:
+                await db.execute(
+                    update(GoogleCredentials)
+                    .where(GoogleCredentials.id.in_([row.id for row in due]))
+                    .values(refresh_claimed_at=func.now())
+                )
+            await db.commit()
+        return due
+
+    async def refresh(self, user_id, refresh_token: str):
+        """Exchanges a refresh token for ``(access_token, expires_at)``; concurrent calls per user share one exchange."""
+        key = str(user_id)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._exchange(key, refresh_token))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _exchange(self, key: str, refresh_token: str):
+        try:
+            response = await get_http_client().post(GOOGLE_TOKEN_URI, data={
+                "grant_type": "refresh_token",
+                "refresh_token": refresh_token,
+                "client_id": settings.GOOGLE_CLIENT_ID,
+                "client_secret": settings.GOOGLE_CLIENT_SECRET,
+            })
+            if response.status_code == 400 and _oauth_error(response) == "invalid_grant":
+                self.revoked += 1
+                raise GoogleTokenRevokedError("invalid_grant")
+            response.raise_for_status()
+            payload = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            self.failed += 1
+            raise GoogleTokenRefreshError(str(e)) from e
+        self.refreshed += 1
+        return payload["access_token"], datetime.utcnow() + timedelta(seconds=int(payload.get("expires_in", 3600)))
+
+    async def ensure_fresh(self, db: AsyncSession, credentials: GoogleCredentials) -> str:
+        """Returns a usable access token, refreshing it now only if the scheduler has not."""
+        if credentials.access_token and credentials.expires_at and \
+                credentials.expires_at > datetime.utcnow() + MIN_TOKEN_LIFETIME:
+            return credentials.access_token
+        if credentials.refresh_error:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Google access was revoked; please sign in again")
+        try:
+            access_token, expires_at = await self.refresh(credentials.user_id, credentials.refresh_token)
+        except GoogleTokenRevokedError as e:
+            credentials.refresh_error = str(e)
+            await db.commit()
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Google access was revoked; please sign in again")
+        except GoogleTokenRefreshError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unable to refresh token")
+        credentials.access_token = access_token
+        credentials.expires_at = expires_at
+        credentials.refresh_failures = 0
+        credentials.next_refresh_at = None
+        await db.commit()
+        self._notify([credentials.user_id])
+        return access_token
+
+    def stats(self) -> dict:
+        return {
+            "rounds": self.rounds,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "revoked": self.revoked,
+            "in_flight": len(self._inflight),
+        }
+
+
+google_token_refresher = GoogleTokenRefresher(
+    lead_seconds=settings.GOOGLE_TOKEN_REFRESH_LEAD_SECONDS,
+    interval_seconds=settings.GOOGLE_TOKEN_REFRESH_INTERVAL_SECONDS,
+    jitter_seconds=settings.GOOGLE_TOKEN_REFRESH_JITTER_SECONDS,
+    concurrency=settings.GOOGLE_TOKEN_REFRESH_CONCURRENCY,
+    batch_size=settings.GOOGLE_TOKEN_REFRESH_BATCH_SIZE,
+)
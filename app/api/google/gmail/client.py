@@ -0,0 +1,103 @@
+# app/api/google/gmail/client.py
+import json
+from datetime import datetime
+from functools import lru_cache
+import httplib2
+from cachetools import LRUCache
+from fastapi import HTTPException, status
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.config import settings
+from app.models import GoogleCredentials
+from app.api.auth.token_refresh import google_token_refresher, MIN_TOKEN_LIFETIME
+
+
+@lru_cache(maxsize=1)
+def gmail_discovery_document() -> dict:
+    """The Gmail v1 discovery document bundled with google-api-python-client, parsed once per process."""
+    document = discovery_cache.get_static_doc("gmail", "v1")
+    if document is None:
+        raise RuntimeError("The Gmail discovery document is not bundled with google-api-python-client.")
+    return json.loads(document)
+
+
+def _request_builder(credentials: Credentials):
+    # httplib2 connections are not thread safe, so every request gets its own
+    def build_request(http, *args, **kwargs):
+        return HttpRequest(AuthorizedHttp(credentials, http=httplib2.Http()), *args, **kwargs)
+    return build_request
+
+
+class GmailServiceCache:
+    """Per-user Gmail service objects, built from the cached discovery document.
+
+    An entry is used until its access token comes within MIN_TOKEN_LIFETIME of
+    expiring, and is dropped as soon as this process refreshes the user's token.
+    Services can be shared between threads: each request they execute opens its
+    own HTTP connection.
+    """
+
+    def __init__(self, maxsize: int):
+        self._services = LRUCache(maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        entry = self._services.get(str(user_id))
+        if entry is not None:
+            service, expires_at = entry
+            if expires_at is not None and expires_at > datetime.utcnow() + MIN_TOKEN_LIFETIME:
+                self.hits += 1
+                return service
+        self.misses += 1
+        return None
+
+    def put(self, user_id, access_token: str, refresh_token: str, expires_at: datetime):
+        credentials = Credentials(
+            access_token,
+            refresh_token=refresh_token,
+            token_uri="https://oauth2.googleapis.com/token",
+            client_id=settings.GOOGLE_CLIENT_ID,
+            client_secret=settings.GOOGLE_CLIENT_SECRET,
+            scopes=settings.SCOPES.split(","),
+        )
+        credentials.expiry = expires_at
+        service = build_from_document(
+            gmail_discovery_document(), credentials=credentials, requestBuilder=_request_builder(credentials)
+        )
+        self._services[str(user_id)] = (service, expires_at)
+        return service
+
+    def invalidate(self, user_id):
+        self._services.pop(str(user_id), None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._services),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+gmail_services = GmailServiceCache(settings.GMAIL_SERVICE_CACHE_SIZE)
+google_token_refresher.add_listener(gmail_services.invalidate)
+
+
+async def gmail_service_for(db: AsyncSession, user_id):
+    """Returns a Gmail service for a user, building and caching one if needed."""
+    service = gmail_services.get(user_id)
+    if service is not None:
+        return service
+    credentials = await db.execute(select(GoogleCredentials).where(GoogleCredentials.user_id == user_id))
+    credentials = credentials.scalar_one_or_none()
+    if not credentials:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Google credentials not found for user.")
+
+    # Tokens are normally refreshed ahead of expiry by the background scheduler
+    access_token = await google_token_refresher.ensure_fresh(db, credentials)
+    return gmail_services.put(user_id, access_token, credentials.refresh_token, credentials.expires_at)
@@ -0,0 +1,291 @@
+# app/api/google/gmail/contacts.py
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from email.utils import getaddresses
+from typing import Optional
+from cachetools import LRUCache
+from googleapiclient.errors import HttpError
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CONTACT_HEADERS = ('From', 'To', 'Cc')
+# Contacts seen this many seconds ago weigh half as much as ones seen now
+RECENCY_HALF_LIFE = 30 * 24 * 3600
+
+
+def fetch_message_headers(service, message_ids: list, header_names=('From', 'To')) -> list:
+    """Fetches the headers and dates of several messages in one Gmail batch request.
+
+    Blocking; returns the messages as ``{"internalDate", "payload": {"headers"}}`` dicts.
+    """
+    messages = []
+
+    def collect(request_id, response, exception):
+        if exception is not None:
+            logger.warning("Could not fetch message headers: %s", exception)
+        else:
+            messages.append(response)
+
+    batch = service.new_batch_http_request(callback=collect)
+    for message_id in message_ids:
+        batch.add(service.users().messages().get(
+            userId='me', id=message_id, format='metadata', metadataHeaders=list(header_names),
+            fields='internalDate,payload/headers'
+        ))
+    batch.execute()
+    return messages
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Edit distance counting adjacent transpositions as one edit.
+
+    Gives up with ``limit + 1`` as soon as the distance must exceed ``limit``.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+@dataclass
+class Contact:
+    name: str
+    email: str
+    count: int
+    last_seen: float  # epoch seconds of the newest message with this contact
+    terms: tuple  # lower-cased name words, full name and email, matched against queries
+
+
+def _terms(name: str, email: str) -> tuple:
+    name = name.lower()
+    return tuple(dict.fromkeys(name.split() + [name, email.lower(), email.split('@')[0].lower()]))
+
+
+class ContactIndex:
+    """One user's correspondents, with how often and when they last appeared."""
+
+    def __init__(self):
+        self.own_email = ""
+        self.contacts = {}
+        self.history_id = None
+        self.synced_at = 0.0
+        self.ready = False
+        self.lock = asyncio.Lock()
+
+    def add_message(self, message: dict):
+        seen = int(message.get('internalDate', 0)) / 1000
+        headers = message.get('payload', {}).get('headers', [])
+        values = [header['value'] for header in headers if header['name'] in CONTACT_HEADERS]
+        for name, email in getaddresses(values):
+            email = email.strip().lower()
+            if not email or '@' not in email or email == self.own_email:
+                continue
+            contact = self.contacts.get(email)
+            if contact is None:
+                self.contacts[email] = Contact(name, email, 1, seen, _terms(name, email))
+                continue
+            contact.count += 1
+            if seen >= contact.last_seen:
+                contact.last_seen = seen
+                if name and name != contact.name:
+                    contact.name = name
+                    contact.terms = _terms(name, email)
+
+    def search(self, query: str, limit: int) -> list:
+        """Contacts matching ``query`` by prefix, then substring, then within a typo or two, best first."""
+        query = query.strip().lower()
+        if not query:
+            return []
+        now = time.time()
+        scored = []
+        for contact in self.contacts.values():
+            if any(term.startswith(query) for term in contact.terms):
+                weight = 1.0
+            elif any(query in term for term in contact.terms):
+                weight = 0.6
+            else:
+                continue
+            scored.append((weight * self._popularity(contact, now), contact))
+
+        if len(scored) < limit and len(query) >= 3:
+            # Typo-tolerant pass: compare the query with equally long prefixes of the terms
+            # sharing its first letter, which keeps the scan cheap
+            tolerance = 1 if len(query) < 6 else 2
+            matched = {id(contact) for _, contact in scored}
+            for contact in self.contacts.values():
+                if id(contact) in matched:
+                    continue
+                distance = min(
+                    (_edit_distance(query, term[:len(query)], tolerance) for term in contact.terms if term[:1] == query[0]),
+                    default=tolerance + 1
+                )
+                if distance <= tolerance:
+                    scored.append((0.3 / distance * self._popularity(contact, now), contact))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [{"name": contact.name, "email": contact.email} for _, contact in scored[:limit]]
+
+    @staticmethod
+    def _popularity(contact: Contact, now: float) -> float:
+        age = max(0.0, now - contact.last_seen)
+        return (1 + math.log1p(contact.count)) * 0.5 ** (age / RECENCY_HALF_LIFE)
+
+
+class ContactDirectory:
+    """Per-user contact indexes built from From/To/Cc headers, kept in an LRU.
+
+    A user's index is seeded once in the background from their most recent
+    GMAIL_CONTACT_INDEX_SEED_MESSAGES messages; until it is ready, lookups return
+    None and callers search the mailbox instead. Afterwards each lookup is served
+    from memory, and an index older than GMAIL_CONTACT_INDEX_SYNC_SECONDS is
+    brought up to date in the background from Gmail's history feed (re-seeding if
+    the history has expired).
+    """
+
+    def __init__(self, maxsize: int, seed_messages: int, sync_interval: int):
+        self.seed_messages = seed_messages
+        self.sync_interval = sync_interval
+        self._indexes = LRUCache(maxsize=maxsize)
+        self._tasks = set()
+        self.lookups = 0
+        self.misses = 0
+        self.seeds = 0
+        self.syncs = 0
+
+    async def lookup(self, service, user_id, query: str, limit: int) -> Optional[list]:
+        self.lookups += 1
+        key = str(user_id)
+        index = self._indexes.get(key)
+        if index is None or not index.ready:
+            self.misses += 1
+            if index is None:
+                self._indexes[key] = index = ContactIndex()
+                self._spawn(self._seed(service, key, index))
+            return None
+        if time.monotonic() - index.synced_at > self.sync_interval:
+            index.synced_at = time.monotonic()  # one sync at a time
+            self._spawn(self._sync(service, index))
+        return index.search(query, limit)
+
+    def invalidate(self, user_id):
+        self._indexes.pop(str(user_id), None)
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _seed(self, service, key: str, index: ContactIndex):
+        async with index.lock:
+            try:
+                await self._rebuild(service, index)
+            except Exception:
+                logger.exception("Could not build contact index")
+                # Dropped so the next lookup tries again
+                if self._indexes.get(key) is index:
+                    self._indexes.pop(key, None)
+                return
+            index.ready = True
+            self.seeds += 1
+
+    async def _rebuild(self, service, index: ContactIndex):
+        profile, messages = await asyncio.to_thread(self._seed_blocking, service)
+        # Applied on the event loop, so lookups never see a half-updated index
+        index.own_email = profile.get('emailAddress', '').lower()
+        index.history_id = profile['historyId']
+        index.contacts = {}
+        for message in messages:
+            index.add_message(message)
+        index.synced_at = time.monotonic()
+
+    def _seed_blocking(self, service):
+        # The history id is read first, so messages arriving during the seed are replayed by the next sync
+        profile = service.users().getProfile(userId='me').execute()
+        message_ids = []
+        page_token = None
+        while len(message_ids) < self.seed_messages:
+            response = service.users().messages().list(
+                userId='me', maxResults=min(500, self.seed_messages - len(message_ids)), pageToken=page_token,
+                fields='messages/id,nextPageToken'
+            ).execute()
+            message_ids.extend(message['id'] for message in response.get('messages', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        return profile, self._fetch_messages(service, message_ids)
+
+    async def _sync(self, service, index: ContactIndex):
+        async with index.lock:
+            try:
+                history_id, messages = await asyncio.to_thread(self._sync_blocking, service, index.history_id)
+                for message in messages:
+                    index.add_message(message)
+                index.history_id = history_id
+                index.synced_at = time.monotonic()
+            except HttpError as e:
+                if e.resp.status != 404:
+                    logger.exception("Could not sync contact index")
+                    return
+                # The stored history id has expired; start over
+                try:
+                    await self._rebuild(service, index)
+                except Exception:
+                    logger.exception("Could not rebuild contact index")
+                    return
+            except Exception:
+                logger.exception("Could not sync contact index")
+                return
+            self.syncs += 1
+
+    def _sync_blocking(self, service, history_id: str):
+        message_ids = []
+        page_token = None
+        while True:
+            response = service.users().history().list(
+                userId='me', startHistoryId=history_id, historyTypes='messageAdded', pageToken=page_token,
+                fields='history/messagesAdded/message/id,historyId,nextPageToken'
+            ).execute()
+            for record in response.get('history', []):
+                message_ids.extend(added['message']['id'] for added in record.get('messagesAdded', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return response.get('historyId', history_id), self._fetch_messages(service, list(dict.fromkeys(message_ids)))
+
+    @staticmethod
+    def _fetch_messages(service, message_ids: list) -> list:
+        messages = []
+        batch_size = settings.GMAIL_CONTACT_SEARCH_BATCH_SIZE
+        for offset in range(0, len(message_ids), batch_size):
+            messages.extend(fetch_message_headers(service, message_ids[offset:offset + batch_size], CONTACT_HEADERS))
+        return messages
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._indexes),
+            "contacts": sum(len(index.contacts) for index in self._indexes.values()),
+            "lookups": self.lookups,
+            "misses": self.misses,
+            "seeds": self.seeds,
+            "syncs": self.syncs,
+        }
+
+
+contact_directory = ContactDirectory(
+    maxsize=settings.GMAIL_CONTACT_INDEX_USERS,
+    seed_messages=settings.GMAIL_CONTACT_INDEX_SEED_MESSAGES,
+    sync_interval=settings.GMAIL_CONTACT_INDEX_SYNC_SECONDS,
+)
@@ -0,0 +1,169 @@
+# app/api/google/gmail/merge.py
+import asyncio
+import hashlib
+import json
+import logging
+import re
+from typing import Optional
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.config import settings
+from app.database import async_session
+from .models import OutboxEmail
+from .outbox import email_outbox, new_idempotency_key
+
+logger = logging.getLogger(__name__)
+
+# {{ name }} placeholders in a draft's subject and body
+PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+# Sent jobs recorded per transaction while a merge is running
+RECORD_BATCH_SIZE = 50
+
+
+class MissingVariable(Exception):
+    pass
+
+
+def render(template: str, variables: dict) -> str:
+    def substitute(match):
+        name = match.group(1)
+        if name not in variables:
+            raise MissingVariable(name)
+        return str(variables[name])
+    return PLACEHOLDER.sub(substitute, template)
+
+
+def recipient_key(merge_key: str, email: str, subject: str, body: str) -> str:
+    """Idempotency key of one rendered copy: the same copy within the same merge is one send."""
+    return hashlib.sha256(f"{merge_key}\0{email}\0{subject}\0{body}".encode()).hexdigest()
+
+
+def _line(record_type: str, row: dict) -> bytes:
+    return (json.dumps({"type": record_type, **row}, default=str, ensure_ascii=False) + "\n").encode()
+
+
+async def mail_merge(user_id, sender, draft, recipients: list, idempotency_key: Optional[str] = None):
+    """Sends one draft to many recipients and yields NDJSON progress lines tagged with a ``type``.
+
+    Each recipient's copy is rendered locally by filling the draft's ``{{ name }}``
+    placeholders from the recipient's variables plus ``email`` and ``name``. All
+    copies go into the outbox in one INSERT as "merging", so they survive a crash
+    and workers leave them alone while a heartbeat renews their lease. They are
+    then sent concurrently, up to GMAIL_MERGE_CONCURRENCY at a time, within the
+    user's outbox rate limit; each copy is moved to "sending" just before its send,
+    and skipped if a worker has taken it over. Sent copies are recorded in batches,
+    with their SentEmail rows. Failed copies stay in the outbox, where the workers
+    retry them. If the client disconnects, copies left unsent or unrecorded are
+    picked up by the workers once GMAIL_OUTBOX_SENDING_TIMEOUT_SECONDS passes; their
+    Message-ID check stops them from being sent twice.
+
+    Copies are deduplicated within the request. Across requests only when the
+    client repeats the merge with the same ``idempotency_key``; without one, every
+    merge sends its copies afresh.
+
+    Yields one ``recipient`` line per recipient, with status sent, queued (handed to
+    the workers), retrying, failed, invalid or duplicate, then a ``summary`` line.
+    """
+    counts = {"sent": 0, "queued": 0, "retrying": 0, "failed": 0, "invalid": 0, "duplicate": 0}
+    merge_key = idempotency_key or new_idempotency_key()
+    rows = []
+    keys = set()
+    for recipient in recipients:
+        variables = {**recipient.variables, "email": recipient.email, "name": recipient.name or ""}
+        try:
+            subject = render(draft.subject, variables)
+            body = render(draft.body, variables)
+        except MissingVariable as e:
+            counts["invalid"] += 1
+            yield _line("recipient", {"email": recipient.email, "status": "invalid", "error": f"Missing variable: {e}"})
+            continue
+        copy_key = recipient_key(merge_key, recipient.email, subject, body)
+        if copy_key in keys:
+            counts["duplicate"] += 1
+            yield _line("recipient", {"email": recipient.email, "status": "duplicate"})
+            continue
+        keys.add(copy_key)
+        rows.append({
+            "user_id": user_id,
+            "conversation_id": draft.conversation_id,
+            "email_draft_id": draft.id,
+            "idempotency_key": copy_key,
+            "sender": sender,
+            "recipient_email": recipient.email,
+            "subject": subject,
+            "body": body,
+            "status": "merging",
+        })
+
+    jobs = []
+    if rows:
+        async with async_session() as db:
+            result = await db.execute(
+                pg_insert(OutboxEmail)
+                .values(rows)
+                .on_conflict_do_nothing(constraint="uq_email_outbox_user_id_idempotency_key")
+                .returning(OutboxEmail.id, OutboxEmail.user_id, OutboxEmail.conversation_id,
+                           OutboxEmail.email_draft_id, OutboxEmail.idempotency_key, OutboxEmail.sender,
+                           OutboxEmail.recipient_email, OutboxEmail.subject, OutboxEmail.body)
+            )
+            jobs = result.all()
+            await db.commit()
+        email_outbox.enqueued += len(jobs)
+
+    # Copies already in the outbox from an earlier send, or repeated in this one, are not sent again
+    inserted = {job.idempotency_key for job in jobs}
+    for row in rows:
+        if row["idempotency_key"] not in inserted:
+            counts["duplicate"] += 1
+            yield _line("recipient", {"email": row["recipient_email"], "status": "duplicate"})
+
+    semaphore = asyncio.Semaphore(settings.GMAIL_MERGE_CONCURRENCY)
+    waiting = {job.id for job in jobs}  # copies still merging, whose lease the heartbeat renews
+
+    async def heartbeat():
+        while waiting:
+            await asyncio.sleep(email_outbox.sending_timeout.total_seconds() / 3)
+            try:
+                await email_outbox.renew_merging(list(waiting))
+            except Exception:
+                logger.exception("Could not renew the lease on merged outbox jobs")
+
+    async def deliver(job):
+        async with semaphore:
+            await email_outbox.rate_limiter.acquire(str(job.user_id))
+            try:
+                claimed = await email_outbox.claim_merged(job.id)
+                waiting.discard(job.id)
+                if not claimed:
+                    return job, None, None, False
+                return job, await email_outbox.send(job, attempt=1, throttle=False), None, True
+            except Exception as e:
+                waiting.discard(job.id)
+                return job, None, e, True
+
+    renewer = asyncio.create_task(heartbeat())
+    try:
+        pending = []
+        for done in asyncio.as_completed([deliver(job) for job in jobs]):
+            job, gmail_message_id, error, claimed = await done
+            if not claimed:
+                # The merge stalled long enough for a worker to take the copy over
+                counts["queued"] += 1
+                yield _line("recipient", {"email": job.recipient_email, "status": "queued", "job_id": job.id})
+            elif error is None:
+                pending.append((job, gmail_message_id))
+                counts["sent"] += 1
+                yield _line("recipient", {"email": job.recipient_email, "status": "sent", "job_id": job.id})
+                if len(pending) >= RECORD_BATCH_SIZE:
+                    await email_outbox.record_sent(pending)
+                    pending = []
+            else:
+                job_status = await email_outbox.record_failure(job, 1, error)
+                line_status = "retrying" if job_status == "queued" else "failed"
+                counts[line_status] += 1
+                yield _line("recipient", {"email": job.recipient_email, "status": line_status, "job_id": job.id,
+                                          "error": str(error)})
+        await email_outbox.record_sent(pending)
+    finally:
+        renewer.cancel()
+
+    yield _line("summary", {"total": len(recipients), **counts})
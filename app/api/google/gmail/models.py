@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime, Computed, Index, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import UUID, TSVECTOR
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -9,25 +9,68 @@ class EmailDraft(Base):
     __tablename__ = "email_drafts"
 
     id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(UUID, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
+    conversation_id = Column(UUID, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False, index=True)
     recipient_name = Column(String, nullable=False)
     user_prompt = Column(Text, nullable=False)
     subject = Column(String, nullable=False)
     body = Column(Text, nullable=False)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
+    # Maintained by Postgres for full-text search, with subject matches ranked above body matches
+    search_vector = Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('english', subject), 'A') || setweight(to_tsvector('english', body), 'B')",
+        persisted=True
+    ))
 
     conversation = relationship("Conversation", back_populates="email_drafts")
     sent_emails = relationship("SentEmail", back_populates="email_draft", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_email_drafts_search_vector", "search_vector", postgresql_using="gin"),
+    )
+    __mapper_args__ = {"exclude_properties": ["search_vector"]}
+
 class SentEmail(Base):
     __tablename__ = "sent_emails"
 
     id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(UUID, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
+    conversation_id = Column(UUID, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False, index=True)
     email_draft_id = Column(Integer, ForeignKey("email_drafts.id", ondelete="CASCADE"), nullable=False)
     recipient_email = Column(String, nullable=False)
     sent_at = Column(DateTime, nullable=False, server_default=func.now())
 
     conversation = relationship("Conversation", back_populates="sent_emails")
     email_draft = relationship("EmailDraft", back_populates="sent_emails")
-    
\ No newline at end of file
+
+class OutboxEmail(Base):
+    """An email waiting to be sent through Gmail, or the record of how sending it went.
+
+    ``status`` moves from queued to sending and then to sent or failed; sends that
+    fail transiently go back to queued until ``next_attempt_at``. Copies inserted by
+    a mail merge start as merging, which workers leave alone while the merge keeps
+    renewing ``updated_at``.
+    """
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(UUID, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    conversation_id = Column(UUID, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False)
+    email_draft_id = Column(Integer, ForeignKey("email_drafts.id", ondelete="CASCADE"), nullable=False)
+    idempotency_key = Column(String, nullable=False)
+    sender = Column(String, nullable=True)
+    recipient_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String, nullable=False, server_default="queued")
+    attempts = Column(Integer, nullable=False, server_default="0")
+    last_error = Column(Text, nullable=True)
+    gmail_message_id = Column(String, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=False, server_default=func.now())
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
+    sent_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "idempotency_key", name="uq_email_outbox_user_id_idempotency_key"),
+        # Only unfinished jobs are polled, so the index stays small
+        Index("ix_email_outbox_due", "next_attempt_at", postgresql_where=text("status IN ('queued', 'sending', 'merging')")),
+    )
@@ -0,0 +1,150 @@
+# app/api/google/gmail/ner.py
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Entity labels treated as possible recipients
+RECIPIENT_LABELS = {"PERSON", "ORG"}
+
+
+class NameExtractor:
+    """Extracts recipient names from prompts with spaCy's named-entity recognizer.
+
+    The model is loaded on first use, or ahead of time by ``warmup()``, with only
+    its NER component, so workers that never draft emails never import spaCy.
+    Prompts arriving within NER_BATCH_WAIT_MS of each other are processed together
+    with ``nlp.pipe`` on a dedicated thread, off the event loop. Results are cached
+    by a hash of the prompt, and concurrent requests for the same prompt share one
+    run.
+    """
+
+    def __init__(self, model: str, batch_size: int, batch_wait_ms: int, cache_size: int):
+        self.model = model
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self._nlp = None
+        self._load_lock = asyncio.Lock()
+        # spaCy pipelines are not safe to run from several threads at once
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ner")
+        self._cache = LRUCache(maxsize=cache_size)
+        self._pending = {}  # prompt hash -> future shared by everyone waiting on that prompt
+        self._queue = []  # (prompt hash, prompt) waiting for the next batch
+        self._flusher = None
+        self._warmup_task = None
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._nlp is not None
+
+    async def warmup(self):
+        """Loads the model now rather than on the first request."""
+        if self._nlp is not None:
+            return
+        async with self._load_lock:
+            if self._nlp is None:
+                self._nlp = await asyncio.get_running_loop().run_in_executor(self._executor, self._load)
+
+    def start_warmup(self):
+        """Loads the model in the background, so startup does not wait for it."""
+        if self._warmup_task is None:
+            self._warmup_task = asyncio.create_task(self._warmup_logged())
+
+    async def _warmup_logged(self):
+        try:
+            await self.warmup()
+        except Exception:
+            logger.exception("Could not load spaCy model %s", self.model)
+
+    def _load(self):
+        import spacy
+
+        nlp = spacy.load(self.model, enable=["ner"])
+        # enable= only disables the other components; remove them to free their memory
+        for name in list(nlp.disabled):
+            nlp.remove_pipe(name)
+        logger.info("Loaded spaCy model %s with pipes %s", self.model, nlp.pipe_names)
+        return nlp
+
+    async def extract(self, prompt: str) -> list:
+        """Returns the PERSON and ORG entities in ``prompt``."""
+        key = hashlib.sha256(prompt.encode()).hexdigest()
+        names = self._cache.get(key)
+        if names is not None:
+            self.hits += 1
+            return list(names)
+
+        self.misses += 1
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pending[key] = asyncio.get_running_loop().create_future()
+            self._queue.append((key, prompt))
+            if self._flusher is None or self._flusher.done():
+                self._flusher = asyncio.create_task(self._flush())
+        return list(await asyncio.shield(future))
+
+    async def _flush(self):
+        while self._queue:
+            try:
+                await self.warmup()
+                if len(self._queue) < self.batch_size:
+                    # Give concurrent requests a moment to join the batch
+                    await asyncio.sleep(self.batch_wait)
+            except Exception as e:
+                batch, self._queue = self._queue, []
+                self._fail(batch, e)
+                return
+            batch, self._queue = self._queue[:self.batch_size], self._queue[self.batch_size:]
+            self.batches += 1
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._run_batch, [prompt for _, prompt in batch]
+                )
+            except Exception as e:
+                self._fail(batch, e)
+                continue
+            for (key, _), names in zip(batch, results):
+                self._cache[key] = names
+                future = self._pending.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_result(names)
+
+    def _fail(self, batch: list, error: Exception):
+        for key, _ in batch:
+            future = self._pending.pop(key, None)
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+    def _run_batch(self, prompts: list) -> list:
+        return [
+            tuple(ent.text for ent in doc.ents if ent.label_ in RECIPIENT_LABELS)
+            for doc in self._nlp.pipe(prompts, batch_size=self.batch_size)
+        ]
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "cache_entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "batches": self.batches,
+            "queued": len(self._queue),
+        }
+
+
+name_extractor = NameExtractor(
+    model=settings.NER_MODEL,
+    batch_size=settings.NER_BATCH_SIZE,
+    batch_wait_ms=settings.NER_BATCH_WAIT_MS,
+    cache_size=settings.NER_CACHE_SIZE,
+)
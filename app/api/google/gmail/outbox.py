@@ -0,0 +1,344 @@
+# app/api/google/gmail/outbox.py
+import asyncio
+import base64
+import hashlib
+import logging
+import random
+import time
+import uuid
+from datetime import timedelta
+from email.mime.text import MIMEText
+from typing import Optional
+from cachetools import LRUCache
+from googleapiclient.errors import HttpError
+from sqlalchemy import and_, case, func, insert, or_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.config import settings
+from app.database import async_session
+from .client import gmail_service_for
+from .models import OutboxEmail, SentEmail
+
+logger = logging.getLogger(__name__)
+
+# Gmail rejects these outright, so retrying cannot help
+PERMANENT_HTTP_ERRORS = {400, 404}
+MAX_ERROR_LENGTH = 1000
+
+
+def new_idempotency_key() -> str:
+    """Key for a send the client did not ask to deduplicate; unique, so it never matches another send."""
+    return uuid.uuid4().hex
+
+
+def outbox_message_id(job) -> str:
+    """Returns the job's Message-ID, which a retry searches for to avoid sending twice.
+
+    Client idempotency keys are arbitrary text, so only a hash of the key goes into the header.
+    """
+    domain = job.sender.rsplit("@", 1)[-1] if job.sender and "@" in job.sender else "outbox.local"
+    key_hash = hashlib.sha256(job.idempotency_key.encode()).hexdigest()[:16]
+    return f"<outbox-{job.id}-{key_hash}@{domain}>"
+
+
+def build_raw_message(sender: Optional[str], to: str, subject: str, body: str, message_id: str) -> str:
+    message = MIMEText(body)
+    message['to'] = to
+    message['from'] = sender
+    message['subject'] = subject
+    message['Message-ID'] = message_id
+    # Encode the message as a base64url string
+    return base64.urlsafe_b64encode(message.as_bytes()).decode()
+
+
+class UserRateLimiter:
+    """Token bucket per user: ``rate`` sends per second with bursts of up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int, maxsize: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = LRUCache(maxsize=maxsize)  # user key -> (tokens, monotonic time)
+        self.throttled = 0
+
+    async def acquire(self, user_key: str):
+        while True:
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(user_key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[user_key] = (tokens - 1, now)
+                return
+            self._buckets[user_key] = (tokens, now)
+            self.throttled += 1
+            await asyncio.sleep((1 - tokens) / self.rate)
+
+
+class EmailOutbox:
+    """Durable queue of Gmail sends, drained by a pool of background workers.
+
+    ``enqueue`` stores the email in ``email_outbox`` and returns at once. Workers
+    claim due jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number of
+    processes can share the queue, and send them within each user's rate limit.
+    Transient failures are retried with jittered exponential backoff up to
+    GMAIL_OUTBOX_MAX_ATTEMPTS. A sent job writes its SentEmail row.
+
+    Each job carries a stable Message-ID. Before retrying, a worker checks the
+    mailbox for it, so a send that reached Gmail but was not recorded (a crash, a
+    lost response) is not sent twice. Jobs stuck in "sending" for
+    GMAIL_OUTBOX_SENDING_TIMEOUT_SECONDS are picked up again, as are "merging"
+    jobs whose mail merge stopped renewing them. Due and lease times are compared
+    with the database clock, which also fills the timestamp columns.
+    """
+
+    def __init__(self, workers: int, batch_size: int, poll_interval: float, max_attempts: int,
+                 backoff_base: float, backoff_max: float, sending_timeout: int, rate_limiter: UserRateLimiter):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sending_timeout = timedelta(seconds=sending_timeout)
+        self.rate_limiter = rate_limiter
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.deduplicated = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self):
+        if not self.running:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def enqueue(self, db: AsyncSession, user_id, conversation_id, email_draft_id: int, sender: Optional[str],
+                      to: str, subject: str, body: str, idempotency_key: Optional[str] = None):
+        """Queues an email and commits; returns ``(job_id, status)``.
+
+        Only when the client supplies an idempotency key is a job with the same key
+        for this user returned instead of queueing a second one.
+        """
+        idempotency_key = idempotency_key or new_idempotency_key()
+        result = await db.execute(
+            pg_insert(OutboxEmail)
+            .values(
+                user_id=user_id,
+                conversation_id=conversation_id,
+                email_draft_id=email_draft_id,
+                idempotency_key=idempotency_key,
+                sender=sender,
+                recipient_email=to,
+                subject=subject,
+                body=body,
+            )
+            .on_conflict_do_nothing(constraint="uq_email_outbox_user_id_idempotency_key")
+            .returning(OutboxEmail.id, OutboxEmail.status)
+        )
+        job = result.first()
+        if job is None:
+            result = await db.execute(
+                select(OutboxEmail.id, OutboxEmail.status)
+                .where(OutboxEmail.user_id == user_id, OutboxEmail.idempotency_key == idempotency_key)
+            )
+            job = result.one()
+        else:
+            self.enqueued += 1
+        await db.commit()
+        self._wakeup.set()
+        return job.id, job.status
+
+    async def _work(self):
+        while True:
+            try:
+                jobs = await self._claim()
+            except Exception:
+                logger.exception("Could not claim outbox jobs")
+                jobs = []
+            if not jobs:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            for job in jobs:
+                await self._deliver(job)
+
+    async def _claim(self) -> list:
+        now = func.now()
+        lease_expired = OutboxEmail.updated_at <= now - self.sending_timeout
+        async with async_session() as db:
+            result = await db.execute(
+                select(OutboxEmail.id, OutboxEmail.user_id, OutboxEmail.conversation_id, OutboxEmail.email_draft_id,
+                       OutboxEmail.idempotency_key, OutboxEmail.sender, OutboxEmail.recipient_email,
+                       OutboxEmail.subject, OutboxEmail.body, OutboxEmail.attempts)
+                .where(or_(
+                    and_(OutboxEmail.status == "queued", OutboxEmail.next_attempt_at <= now),
+                    and_(OutboxEmail.status.in_(("sending", "merging")), lease_expired),
+                ))
+                .order_by(OutboxEmail.next_attempt_at)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            jobs = result.all()
+            if jobs:
+                await db.execute(
+                    update(OutboxEmail)
+                    .where(OutboxEmail.id.in_([job.id for job in jobs]))
+                    .values(status="sending", attempts=OutboxEmail.attempts + 1, updated_at=func.now())
+                )
+            await db.commit()
+        return jobs
+
+    async def claim_merged(self, job_id: int) -> bool:
+        """Moves a mail merge's copy from merging to sending; False if a worker has taken it over."""
+        async with async_session() as db:
+            result = await db.execute(
+                update(OutboxEmail)
+                .where(OutboxEmail.id == job_id, OutboxEmail.status == "merging")
+                .values(status="sending", attempts=OutboxEmail.attempts + 1, updated_at=func.now())
+                .returning(OutboxEmail.id)
+            )
+            claimed = result.first() is not None
+            await db.commit()
+        return claimed
+
+    async def renew_merging(self, job_ids: list):
+        """Extends the lease on a mail merge's copies that are still waiting to be sent."""
+        if not job_ids:
+            return
+        async with async_session() as db:
+            await db.execute(
+                update(OutboxEmail)
+                .where(OutboxEmail.id.in_(job_ids), OutboxEmail.status == "merging")
+                .values(updated_at=func.now())
+            )
+            await db.commit()
+
+    async def _deliver(self, job):
+        attempt = job.attempts + 1
+        try:
+            gmail_message_id = await self.send(job, attempt)
+        except Exception as e:
+            await self.record_failure(job, attempt, e)
+            return
+        await self.record_sent([(job, gmail_message_id)])
+
+    async def send(self, job, attempt: int, throttle: bool = True) -> str:
+        """Sends a claimed job, within its user's rate limit unless the caller already waited for it.
+
+        Returns the Gmail message id.
+        """
+        message_id = outbox_message_id(job)
+        if throttle:
+            await self.rate_limiter.acquire(str(job.user_id))
+        async with async_session() as db:
+            service = await gmail_service_for(db, job.user_id)
+        if attempt > 1:
+            gmail_message_id = await asyncio.to_thread(self._find_sent, service, message_id)
+            if gmail_message_id is not None:
+                self.deduplicated += 1
+                return gmail_message_id
+        raw_message = build_raw_message(job.sender, job.recipient_email, job.subject, job.body, message_id)
+        sent = await asyncio.to_thread(
+            service.users().messages().send(userId='me', body={'raw': raw_message}).execute
+        )
+        return sent["id"]
+
+    @staticmethod
+    def _find_sent(service, message_id: str) -> Optional[str]:
+        response = service.users().messages().list(
+            userId='me', q=f"rfc822msgid:{message_id.strip('<>')}", maxResults=1, fields='messages/id'
+        ).execute()
+        messages = response.get('messages', [])
+        return messages[0]['id'] if messages else None
+
+    async def record_sent(self, sent: list):
+        """Marks ``(job, gmail_message_id)`` pairs sent and writes their SentEmail rows in one transaction."""
+        if not sent:
+            return
+        try:
+            async with async_session() as db:
+                await db.execute(
+                    update(OutboxEmail)
+                    .where(OutboxEmail.id.in_([job.id for job, _ in sent]))
+                    .values(
+                        status="sent",
+                        gmail_message_id=case(
+                            {job.id: gmail_message_id for job, gmail_message_id in sent}, value=OutboxEmail.id
+                        ),
+                        sent_at=func.now(),
+                        last_error=None,
+                    )
+                )
+                await db.execute(insert(SentEmail), [
+                    {"email_draft_id": job.email_draft_id, "recipient_email": job.recipient_email,
+                     "conversation_id": job.conversation_id}
+                    for job, _ in sent
+                ])
+                await db.commit()
+        except Exception:
+            # Left in "sending"; the retry finds the messages by their Message-ID and records them then
+            logger.exception("Outbox jobs %s were sent but could not be recorded", [job.id for job, _ in sent])
+            return
+        self.sent += len(sent)
+
+    async def record_failure(self, job, attempt: int, error: Exception) -> str:
+        """Schedules a retry of a failed send, or gives up on it; returns the job's new status."""
+        permanent = isinstance(error, HttpError) and error.resp.status in PERMANENT_HTTP_ERRORS
+        values = {"last_error": str(error)[:MAX_ERROR_LENGTH]}
+        if permanent or attempt >= self.max_attempts:
+            values["status"] = "failed"
+            self.failed += 1
+        else:
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+            values["status"] = "queued"
+            values["next_attempt_at"] = func.now() + timedelta(seconds=random.uniform(delay / 2, delay))
+            self.retried += 1
+        logger.warning("Outbox job %s attempt %s failed: %s", job.id, attempt, error)
+        try:
+            async with async_session() as db:
+                await db.execute(update(OutboxEmail).where(OutboxEmail.id == job.id).values(**values))
+                await db.commit()
+        except Exception:
+            logger.exception("Could not record outbox failure for job %s", job.id)
+        return values["status"]
+
+    def stats(self) -> dict:
+        return {
+            "workers": sum(1 for task in self._tasks if not task.done()),
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "deduplicated": self.deduplicated,
+            "throttled": self.rate_limiter.throttled,
+        }
+
+
+email_outbox = EmailOutbox(
+    workers=settings.GMAIL_OUTBOX_WORKERS,
+    batch_size=settings.GMAIL_OUTBOX_BATCH_SIZE,
+    poll_interval=settings.GMAIL_OUTBOX_POLL_SECONDS,
+    max_attempts=settings.GMAIL_OUTBOX_MAX_ATTEMPTS,
+    backoff_base=settings.GMAIL_OUTBOX_BACKOFF_BASE_SECONDS,
+    backoff_max=settings.GMAIL_OUTBOX_BACKOFF_MAX_SECONDS,
+    sending_timeout=settings.GMAIL_OUTBOX_SENDING_TIMEOUT_SECONDS,
+    rate_limiter=UserRateLimiter(settings.GMAIL_SEND_RATE_PER_USER, settings.GMAIL_SEND_BURST_PER_USER),
+)
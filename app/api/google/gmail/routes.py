@@ -1,22 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Header
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_async_session
 from app.models import User
+from app.config import settings
 from app.api.auth.manager import get_current_user
-from .schemas import DraftEmailRequest, SendEmailRequest, ContactSearchResponse, ContactSearchRequest
-from .services import draft_email, send_email, search_contacts
-import spacy
+from .schemas import DraftEmailRequest, SendEmailRequest, ContactSearchResponse, ContactSearchRequest, SendEmailResponse, SendStatusResponse, MailMergeRequest
+from .services import draft_email, send_email, search_contacts, get_send_status, get_owned_draft
+from .merge import mail_merge
+from .ner import name_extractor
 from uuid import UUID
+from typing import Optional
 
 router = APIRouter(tags=["Google Gmail"])
 
-# Load the spaCy model
-nlp = spacy.load("en_core_web_sm")
-
-def extract_names(prompt):
-    doc = nlp(prompt)
-    names = [ent.text for ent in doc.ents if ent.label_ in {"PERSON", "ORG"}]
-    return names
+async def extract_names(prompt):
+    return await name_extractor.extract(prompt)
 
 @router.post("/gmail/search_contacts", response_model=ContactSearchResponse)
 async def search_contacts_route(
@@ -36,7 +35,7 @@ async def draft_email_route(
 ):
     """Route for drafting an email."""
     # Extract recipient names from user prompt using spaCy NER
-    recipient_names = extract_names(draft_request.user_prompt)
+    recipient_names = await extract_names(draft_request.user_prompt)
 
     if not recipient_names:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Recipient name not found in prompt.")
@@ -49,15 +48,16 @@ async def draft_email_route(
         "recipient_names": recipient_names  # Include recipient names in the response
     }
 
-@router.post("/gmail/send")
+@router.post("/gmail/send", response_model=SendEmailResponse, status_code=status.HTTP_202_ACCEPTED)
 async def send_email_route(
     send_request: SendEmailRequest,
     email_draft_id: int,
     user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_async_session),
-    conversation_id: UUID = None
+    conversation_id: UUID = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
 ):
-    """Route for sending an email."""
+    """Route for sending an email. The email is queued; poll /gmail/send/{job_id} for delivery."""
     return await send_email(
         send_request.to,
         send_request.subject,
@@ -65,6 +65,49 @@ async def send_email_route(
         email_draft_id,
         user,
         db,
-        conversation_id
+        conversation_id,
+        idempotency_key
+    )
+
+@router.get("/gmail/send/{job_id}", response_model=SendStatusResponse)
+async def send_status_route(
+    job_id: int,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """Route for checking the delivery state of a queued email."""
+    job = await get_send_status(job_id, user, db)
+    return SendStatusResponse(
+        job_id=job.id,
+        status=job.status,
+        recipient_email=job.recipient_email,
+        attempts=job.attempts,
+        last_error=job.last_error,
+        gmail_message_id=job.gmail_message_id,
+        created_at=job.created_at,
+        sent_at=job.sent_at,
     )
 
+@router.post("/gmail/merge")
+async def mail_merge_route(
+    merge_request: MailMergeRequest,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
+):
+    """Route for sending one draft to a list of recipients, filling ``{{ placeholders }}`` per recipient.
+
+    Streams NDJSON progress: one line per recipient, then a summary line. Sends are
+    paced by GMAIL_SEND_RATE_PER_USER after a burst of GMAIL_SEND_BURST_PER_USER, so
+    with the defaults (2/s, burst 10) 200 recipients take about a minute and a half.
+    """
+    if len(merge_request.recipients) > settings.GMAIL_MERGE_MAX_RECIPIENTS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.GMAIL_MERGE_MAX_RECIPIENTS} recipients can be sent to at once."
+        )
+    draft = await get_owned_draft(merge_request.email_draft_id, user, db)
+    return StreamingResponse(
+        mail_merge(user.id, user.email, draft, merge_request.recipients, idempotency_key),
+        media_type="application/x-ndjson"
+    )
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import List
+from pydantic import BaseModel, EmailStr, Field
+from typing import Dict, List, Optional
+from datetime import datetime
 
 class DraftEmailRequest(BaseModel):
     """Request schema for drafting an email."""
@@ -22,4 +23,32 @@ class RecipientSchema(BaseModel):  # New schema for a recipient with name and em
 
 class ContactSearchResponse(BaseModel):
     """Response schema for contact search."""
-    suggested_recipients: List[RecipientSchema]
\ No newline at end of file
+    suggested_recipients: List[RecipientSchema]
+
+class SendEmailResponse(BaseModel):
+    """Response schema for a queued email."""
+    message: str
+    job_id: int
+    status: str
+
+class SendStatusResponse(BaseModel):
+    """Delivery state of a queued email."""
+    job_id: int
+    status: str
+    recipient_email: str
+    attempts: int
+    last_error: Optional[str] = None
+    gmail_message_id: Optional[str] = None
+    created_at: datetime
+    sent_at: Optional[datetime] = None
+
+class MailMergeRecipient(BaseModel):
+    """A mail-merge recipient and the values for the draft's placeholders."""
+    email: EmailStr
+    name: Optional[str] = None
+    variables: Dict[str, str] = {}
+
+class MailMergeRequest(BaseModel):
+    """Request schema for sending one email draft to many recipients."""
+    email_draft_id: int
+    recipients: List[MailMergeRecipient] = Field(..., min_length=1)
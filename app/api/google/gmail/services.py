@@ -1,51 +1,33 @@
-import base64
-import json
-from email.mime.text import MIMEText
-from googleapiclient.discovery import build
+import asyncio
 from googleapiclient.errors import HttpError
-from google.auth.transport.requests import Request as GoogleRequest
-from app.models import GoogleCredentials
-from google.oauth2.credentials import Credentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from fastapi import HTTPException, status, Depends
 from app.api.auth.manager import get_current_user
-from app.api.auth.routes import refresh_google_token
 from app.models import User
-from .models import SentEmail, EmailDraft
-from app.api.ai.openai_utils import client
+from .models import EmailDraft, OutboxEmail
+from .outbox import email_outbox
+from .contacts import contact_directory, fetch_message_headers
+from .client import gmail_service_for
+from app.api.ai.backends import get_backend, LLMBackendError
+from app.api.ai.limiter import limiter
+from app.api.ai.openai_utils import llm_http_error
+from app.api.ai.responses import responses, response_key
 from app.database import get_async_session
 from app.config import settings
-from app.api.persona.utils import get_persona_system_message
-from app.api.persona.models import Persona
+from app.api.persona.registry import persona_registry
 from app.api.ai.conversations.models import Conversation
 from uuid import UUID
 
 # If modifying these scopes, delete the file token.pickle.
 SCOPES = settings.SCOPES.split(",")
 
-async def get_gmail_service(user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_session), token: str = Depends(refresh_google_token)):
-    """Gets the Gmail API service for the authenticated user."""
+async def get_gmail_service(user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_session)):
+    """Gets the Gmail API service for the authenticated user, from the per-user cache when possible."""
     try:
-        credentials = await db.execute(select(GoogleCredentials).where(GoogleCredentials.user_id == user.id))
-        credentials = credentials.scalar_one_or_none()
-
-        if not credentials:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Google credentials not found for user.")
-
-        creds_info = {
-            "token": credentials.access_token,
-            "refresh_token": credentials.refresh_token,
-            "token_uri": "https://oauth2.googleapis.com/token",
-            "client_id": settings.GOOGLE_CLIENT_ID,
-            "client_secret": settings.GOOGLE_CLIENT_SECRET,
-            "scopes": SCOPES
-        }
-
-        creds = Credentials.from_authorized_user_info(creds_info)
-        service = build('gmail', 'v1', credentials=creds)
-
-        return service
+        return await gmail_service_for(db, user.id)
+    except HTTPException:
+        raise
     except Exception as e:
         from traceback import print_exc; print_exc()
         print(e)
@@ -54,12 +36,12 @@ async def draft_email(user_prompt: str, user: User = Depends(get_current_user),
     """Drafts an email using ChatGPT, including subject and body, based on user prompt."""
     try:
         # Fetch the persona details
-        persona = await db.get(Persona, user.selected_persona_id)
+        persona = await persona_registry.get(user.selected_persona_id)
         if not persona:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Persona not found.")
 
         # Define clear instructions for ChatGPT
-        system_message = get_persona_system_message(persona)
+        system_message = persona.system_prompt
         prompt = f"""
         You purpose is to helping a user draft an email.
         Please generate a professional and concise email, including the subject and body based on the user given prompt.
@@ -69,14 +51,17 @@ async def draft_email(user_prompt: str, user: User = Depends(get_current_user),
         mail_conversation.append({"role": "system", "content": system_message+"\n"+prompt})
         mail_conversation.append({"role": "user", "content": user_prompt})
 
-        response = client.chat.completions.create(
-            model="gpt-4-turbo-2024-04-09",
-            messages=mail_conversation,
-            max_tokens=250,
-            temperature=0
-        )
+        async def create():
+            return await limiter.run(str(user.id), lambda: get_backend().complete(
+                mail_conversation, "gpt-4-turbo-2024-04-09", 250, 0
+            ))
 
-        email_content = response.choices[0].message.content.strip()
+        # Drafting is deterministic (temperature 0), so identical prompts can reuse a recent draft
+        key = response_key(
+            persona.id, mail_conversation[:-1], user_prompt,
+            model="gpt-4-turbo-2024-04-09", max_tokens=250, temperature=0
+        )
+        email_content, _ = await responses.get(key, create, cacheable=True)
         subject, *body_lines = email_content.split("\n")
         body = "\n".join(body_lines)
 
@@ -112,46 +97,40 @@ async def draft_email(user_prompt: str, user: User = Depends(get_current_user),
             "email_draft_id": email_draft.id
         }
 
+    except LLMBackendError as e:
+        raise llm_http_error(e)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error drafting email: {e}")
 
 
+def _match_recipients(headers: list, needle: str, found: dict):
+    """Adds the From/To addresses whose display name contains ``needle`` to ``found``, keyed by email."""
+    for header in headers:
+        if header['name'] == 'From':
+            addresses = [header['value']]
+        elif header['name'] == 'To':
+            addresses = header['value'].split(',')
+        else:
+            continue
+        for address in addresses:
+            name, email = parse_email_header(address)
+            if needle in name.lower() and email not in found:
+                found[email] = {"name": name, "email": email}
+
+
 async def search_contacts(recipient_name: str, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_session)):
-    """Searches the user's Gmail mailbox for matching names and returns email addresses."""
+    """Searches the user's contacts for matching names and returns email addresses.
+
+    Served from the user's contact index; while it is being built, or when it has
+    no match, falls back to searching the mailbox.
+    """
     try:
         service = await get_gmail_service(user=user, db=db)
-
-        # Search for messages containing the recipient name
-        query = f"from:{recipient_name} OR to:{recipient_name}"
-        print("Service details", service)
-        results = service.users().messages().list(userId='me', q=query).execute()
-
-        messages = results.get('messages', [])
-        suggested_recipients = []
-        for message in messages:
-            msg = service.users().messages().get(userId='me', id=message['id']).execute()
-            headers = msg['payload']['headers']
-            for header in headers:
-                if header['name'] == 'From':
-                    from_name, from_email = parse_email_header(header['value'])
-                    if recipient_name.lower() in from_name.lower():
-                        suggested_recipients.append({"name": from_name, "email": from_email})
-                elif header['name'] == 'To':
-                    to_addresses = header['value'].split(',')
-                    for to_address in to_addresses:
-                        to_name, to_email = parse_email_header(to_address)
-                        if recipient_name.lower() in to_name.lower():
-                            suggested_recipients.append({"name": to_name, "email": to_email})
-
-        # Remove duplicates based on email address
-        seen_emails = set()
-        unique_recipients = []
-        for recipient in suggested_recipients:
-            if recipient["email"] not in seen_emails:
-                unique_recipients.append(recipient)
-                seen_emails.add(recipient["email"])
-
-        return {"suggested_recipients": unique_recipients}
+        limit = settings.GMAIL_CONTACT_SEARCH_MAX_RESULTS
+        suggested_recipients = await contact_directory.lookup(service, user.id, recipient_name, limit)
+        if not suggested_recipients:
+            suggested_recipients = await _search_mailbox(service, recipient_name, limit)
+        return {"suggested_recipients": suggested_recipients}
     except HttpError as error:
         print(f'An error occurred: {error}')
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error searching Gmail: {error}")
@@ -159,6 +138,32 @@ async def search_contacts(recipient_name: str, user: User = Depends(get_current_
         from traceback import print_exc; print_exc()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error searching contacts: {e}")
 
+
+async def _search_mailbox(service, recipient_name: str, limit: int) -> list:
+    """Live mailbox search.
+
+    Scans at most GMAIL_CONTACT_SEARCH_MAX_MESSAGES messages, fetching only their
+    From/To headers in batches, and stops once ``limit`` unique recipients are
+    found. Gmail calls run in a worker thread.
+    """
+    query = f"from:{recipient_name} OR to:{recipient_name}"
+    results = await asyncio.to_thread(
+        service.users().messages().list(
+            userId='me', q=query, maxResults=settings.GMAIL_CONTACT_SEARCH_MAX_MESSAGES, fields='messages/id'
+        ).execute
+    )
+    message_ids = [message['id'] for message in results.get('messages', [])]
+
+    needle = recipient_name.lower()
+    found = {}
+    batch_size = settings.GMAIL_CONTACT_SEARCH_BATCH_SIZE
+    for offset in range(0, len(message_ids), batch_size):
+        for message in await asyncio.to_thread(fetch_message_headers, service, message_ids[offset:offset + batch_size]):
+            _match_recipients(message.get('payload', {}).get('headers', []), needle, found)
+        if len(found) >= limit:
+            break
+    return list(found.values())[:limit]
+
 def parse_email_header(header_value: str):
     """Parses an email header value and extracts the name and email address."""
     name = ""
@@ -171,39 +176,48 @@ def parse_email_header(header_value: str):
         email = header_value.strip()
     return name, email
 
-async def send_email(to: str, subject: str, message_body: str, email_draft_id: int, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_session), conversation_id: UUID = None):
-    """Sends an email using the Gmail API."""
+async def get_owned_draft(email_draft_id: int, user: User, db: AsyncSession) -> EmailDraft:
+    """Fetches an email draft, which must belong to one of the user's conversations."""
+    result = await db.execute(
+        select(EmailDraft)
+        .join(Conversation, Conversation.id == EmailDraft.conversation_id)
+        .where(EmailDraft.id == email_draft_id, Conversation.user_id == user.id)
+    )
+    email_draft = result.scalar_one_or_none()
+    if email_draft is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Email draft not found")
+    return email_draft
+
+async def send_email(to: str, subject: str, message_body: str, email_draft_id: int, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_session), conversation_id: UUID = None, idempotency_key: str = None):
+    """Queues an email for sending through the Gmail API; the outbox workers deliver it."""
     try:
-        service = await get_gmail_service(user=user, db=db)
-
-        message = MIMEText(message_body)
-        message['to'] = to
-        message['from'] = user.email
-        message['subject'] = subject
-
-        # Encode the message as a base64url string
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-
-        # Send the email
-        send_message = (service.users().messages().send(userId='me', body={'raw': raw_message}).execute())
-
-        print(f'Message Id: {send_message["id"]}')
-
-        # Fetch the email draft to get the conversation ID
-        email_draft = await db.get(EmailDraft, email_draft_id)
-        if not email_draft:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Email draft not found")
-
-        # Create and save SentEmail object
-        sent_email = SentEmail(
+        email_draft = await get_owned_draft(email_draft_id, user, db)
+        # The send is recorded against the draft's own conversation, which get_owned_draft checked belongs to the user
+        if conversation_id is not None and conversation_id != email_draft.conversation_id:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="The draft does not belong to this conversation.")
+        job_id, job_status = await email_outbox.enqueue(
+            db,
+            user_id=user.id,
+            conversation_id=email_draft.conversation_id,
             email_draft_id=email_draft_id,
-            recipient_email=to,
-            conversation_id=conversation_id
+            sender=user.email,
+            to=to,
+            subject=subject,
+            body=message_body,
+            idempotency_key=idempotency_key,
         )
-        db.add(sent_email)
-        await db.commit()
-
-        return {"message": "Email sent successfully!"}
+        return {"message": "Email queued for sending.", "job_id": job_id, "status": job_status}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error sending email: {e}")
+
+
+async def get_send_status(job_id: int, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_session)):
+    """Returns the delivery state of one of the user's queued emails."""
+    result = await db.execute(select(OutboxEmail).where(OutboxEmail.id == job_id, OutboxEmail.user_id == user.id))
+    job = result.scalar_one_or_none()
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Send job not found")
+    return job
@@ -0,0 +1,121 @@
+# app/api/persona/registry.py
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import async_session
+from .models import Persona
+from .schemas import PersonaSchema
+from .utils import get_persona_system_message
+
+
+@dataclass(frozen=True)
+class PersonaEntry:
+    """A persona with its precompiled system prompt and voice settings."""
+    id: int
+    name: str
+    gender: str
+    country: str
+    language: str
+    role: str
+    characteristic: str
+    expertise: Optional[str]
+    system_prompt: str
+    language_code: str
+    tld: str
+
+
+def _compile(persona: Persona) -> PersonaEntry:
+    # Imported here because the voice module imports the AI module, which uses this registry
+    from .voices import get_language_code, get_tld
+
+    return PersonaEntry(
+        id=persona.id,
+        name=persona.name,
+        gender=persona.gender,
+        country=persona.country,
+        language=persona.language,
+        role=persona.role,
+        characteristic=persona.characteristic,
+        expertise=persona.expertise,
+        system_prompt=get_persona_system_message(persona),
+        language_code=get_language_code(persona.language),
+        tld=get_tld(persona.country),
+    )
+
+
+class PersonaRegistry:
+    """In-process catalog of personas, loaded once and refreshed when personas change.
+
+    The catalog is reloaded after any persona write committed by this process, and
+    every PERSONA_REGISTRY_TTL seconds to pick up writes made elsewhere.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._entries = {}
+        self._loaded_at = None
+        self._lock = asyncio.Lock()
+        self.body = b"[]"
+        self.etag = None
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def load(self):
+        """Reads every persona from the database and rebuilds the catalog."""
+        async with async_session() as db:
+            result = await db.execute(select(Persona).order_by(Persona.id))
+            entries = {persona.id: _compile(persona) for persona in result.scalars().all()}
+
+        listing = [
+            PersonaSchema.model_validate(entry, from_attributes=True).model_dump(mode="json")
+            for entry in entries.values()
+        ]
+        self.body = json.dumps(listing).encode()
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self._entries = entries
+        self._loaded_at = time.monotonic()
+
+    async def _ensure_loaded(self):
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if not self._is_fresh():
+                await self.load()
+
+    async def get(self, persona_id: int) -> Optional[PersonaEntry]:
+        """Returns a persona by id, or None if it does not exist."""
+        await self._ensure_loaded()
+        return self._entries.get(persona_id)
+
+    async def catalog(self):
+        """Returns the serialized persona listing and its ETag."""
+        await self._ensure_loaded()
+        return self.body, self.etag
+
+    def invalidate(self):
+        """Forces the next lookup to reload the catalog."""
+        self._loaded_at = None
+
+
+persona_registry = PersonaRegistry(settings.PERSONA_REGISTRY_TTL)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_persona_writes(session, flush_context):
+    changed = session.new | session.dirty | session.deleted
+    if any(isinstance(instance, Persona) for instance in changed):
+        session.info["personas_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    if session.info.pop("personas_changed", False):
+        persona_registry.invalidate()
@@ -1,23 +1,24 @@
 #app\api\persona\routes.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 from typing import List
 
 from app.database import get_async_session
 from app.models import User
-from app.api.persona.models import Persona
+from app.api.persona.registry import persona_registry
 from app.api.auth.manager import get_current_user 
 from app.api.persona.schemas import PersonaSchema, UserPersonaSchema # Import schemas
 
 router = APIRouter(tags=["AI Personas"])
 
 @router.get("/personas/", response_model=List[PersonaSchema])
-async def list_personas(db: AsyncSession = Depends(get_async_session), user: User = Depends(get_current_user),):
-    """Lists all available AI personas."""
-    result = await db.execute(select(Persona))
-    personas = result.scalars().all()
-    return personas
+async def list_personas(request: Request, user: User = Depends(get_current_user),):
+    """Lists all available AI personas, answering 304 when the client's copy is current."""
+    body, etag = await persona_registry.catalog()
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.post("/personas/select/{persona_id}", response_model=UserPersonaSchema)
 async def select_persona(
@@ -27,7 +28,7 @@ async def select_persona(
 ):
     print("Persona ID",persona_id)
     """Allows a user to select an AI persona."""
-    persona = await db.get(Persona, persona_id)
+    persona = await persona_registry.get(persona_id)
     if not persona:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Persona not found")
 
@@ -9,9 +9,9 @@ from fastapi import HTTPException, status, Depends, WebSocket
 import json
 
 # --- OpenAI Setup (You might need to adjust the path) ---
-from app.api.ai.openai_utils import get_ai_response, client
+from app.api.ai.openai_utils import get_ai_response
 from app.models import User
-from app.api.persona.models import Persona
+from app.api.persona.registry import persona_registry
 from app.database import get_async_session, AsyncSession
 from app.api.auth.manager import get_current_user  # Import for authentication
 from app.api.ai.conversations.models import Conversation, Message
@@ -71,7 +71,7 @@ async def handle_voice_interaction(websocket: WebSocket, user: User, db: AsyncSe
             token = message_data['token']
 
             # Get the selected persona from the database
-            persona = db.query(Persona).filter_by(id=persona_id).first()
+            persona = await persona_registry.get(persona_id)
 
             if not persona:
                 print(f"Persona with ID {persona_id} not found.")
@@ -107,9 +107,7 @@ async def handle_voice_interaction(websocket: WebSocket, user: User, db: AsyncSe
                         print(f"AI response: {ai_response}")
 
                         # Customize voice output based on persona
-                        language_code = get_language_code(persona.language)
-                        accent = get_tld(persona.country)
-                        tts = gTTS(text=ai_response, lang=language_code, tld=accent)
+                        tts = gTTS(text=ai_response, lang=persona.language_code, tld=persona.tld)
                         fp = BytesIO()
                         tts.write_to_fp(fp)
                         fp.seek(0)
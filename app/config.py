@@ -5,17 +5,98 @@ load_dotenv()
 
 class Settings:
     DATABASE_URL: str = os.getenv("DATABASE_URL")
+    DATABASE_REPLICA_URL: str = os.getenv("DATABASE_REPLICA_URL")  # Optional read replica for read-only GETs
+    DATABASE_ECHO: bool = os.getenv("DATABASE_ECHO") == "True"
+    DATABASE_POOL_SIZE: int = int(os.getenv("DATABASE_POOL_SIZE", "10"))
+    DATABASE_MAX_OVERFLOW: int = int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))
+    DATABASE_POOL_TIMEOUT: float = float(os.getenv("DATABASE_POOL_TIMEOUT", "10"))  # Seconds to wait for a connection
+    DATABASE_POOL_RECYCLE: int = int(os.getenv("DATABASE_POOL_RECYCLE", "1800"))
+    DATABASE_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DATABASE_STATEMENT_TIMEOUT_MS", "30000"))  # 0 disables
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY")
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
     REFRESH_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_MINUTES"))
+    IDENTITY_CACHE_TTL: int = int(os.getenv("IDENTITY_CACHE_TTL", "60"))  # Bounds staleness across workers
+    IDENTITY_CACHE_SIZE: int = int(os.getenv("IDENTITY_CACHE_SIZE", "10000"))
     GOOGLE_CLIENT_ID: str = os.getenv("GOOGLE_CLIENT_ID")
     GOOGLE_CLIENT_SECRET: str = os.getenv("GOOGLE_CLIENT_SECRET")
     GOOGLE_REDIRECT_URI: str = os.getenv("GOOGLE_REDIRECT_URI")
+    GMAIL_CONTACT_SEARCH_MAX_MESSAGES: int = int(os.getenv("GMAIL_CONTACT_SEARCH_MAX_MESSAGES", "100"))
+    GMAIL_CONTACT_SEARCH_MAX_RESULTS: int = int(os.getenv("GMAIL_CONTACT_SEARCH_MAX_RESULTS", "20"))
+    GMAIL_CONTACT_SEARCH_BATCH_SIZE: int = int(os.getenv("GMAIL_CONTACT_SEARCH_BATCH_SIZE", "25"))
+    GMAIL_SERVICE_CACHE_SIZE: int = int(os.getenv("GMAIL_SERVICE_CACHE_SIZE", "1000"))
+    GMAIL_CONTACT_INDEX_USERS: int = int(os.getenv("GMAIL_CONTACT_INDEX_USERS", "1000"))
+    GMAIL_CONTACT_INDEX_SEED_MESSAGES: int = int(os.getenv("GMAIL_CONTACT_INDEX_SEED_MESSAGES", "500"))
+    GMAIL_CONTACT_INDEX_SYNC_SECONDS: int = int(os.getenv("GMAIL_CONTACT_INDEX_SYNC_SECONDS", "60"))
+    GMAIL_OUTBOX_WORKERS: int = int(os.getenv("GMAIL_OUTBOX_WORKERS", "4"))
+    GMAIL_OUTBOX_BATCH_SIZE: int = int(os.getenv("GMAIL_OUTBOX_BATCH_SIZE", "10"))
+    GMAIL_OUTBOX_POLL_SECONDS: float = float(os.getenv("GMAIL_OUTBOX_POLL_SECONDS", "2"))
+    GMAIL_OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("GMAIL_OUTBOX_MAX_ATTEMPTS", "6"))
+    GMAIL_OUTBOX_BACKOFF_BASE_SECONDS: float = float(os.getenv("GMAIL_OUTBOX_BACKOFF_BASE_SECONDS", "10"))
+    GMAIL_OUTBOX_BACKOFF_MAX_SECONDS: float = float(os.getenv("GMAIL_OUTBOX_BACKOFF_MAX_SECONDS", "1800"))
+    GMAIL_OUTBOX_SENDING_TIMEOUT_SECONDS: int = int(os.getenv("GMAIL_OUTBOX_SENDING_TIMEOUT_SECONDS", "300"))
+    # Gmail allows 250 quota units per user per second and a send costs 100, i.e. 2.5 sends/s
+    GMAIL_SEND_RATE_PER_USER: float = float(os.getenv("GMAIL_SEND_RATE_PER_USER", "2"))
+    GMAIL_SEND_BURST_PER_USER: int = int(os.getenv("GMAIL_SEND_BURST_PER_USER", "10"))
+    GMAIL_MERGE_MAX_RECIPIENTS: int = int(os.getenv("GMAIL_MERGE_MAX_RECIPIENTS", "500"))
+    GMAIL_MERGE_CONCURRENCY: int = int(os.getenv("GMAIL_MERGE_CONCURRENCY", "10"))
+    NER_MODEL: str = os.getenv("NER_MODEL", "en_core_web_sm")
+    NER_PRELOAD: bool = os.getenv("NER_PRELOAD", "False") == "True"
+    NER_BATCH_SIZE: int = int(os.getenv("NER_BATCH_SIZE", "32"))
+    NER_BATCH_WAIT_MS: int = int(os.getenv("NER_BATCH_WAIT_MS", "5"))
+    NER_CACHE_SIZE: int = int(os.getenv("NER_CACHE_SIZE", "4096"))
+    GOOGLE_HTTP_TIMEOUT: float = float(os.getenv("GOOGLE_HTTP_TIMEOUT", "10"))
+    GOOGLE_HTTP_MAX_CONNECTIONS: int = int(os.getenv("GOOGLE_HTTP_MAX_CONNECTIONS", "100"))
+    GOOGLE_HTTP_MAX_KEEPALIVE: int = int(os.getenv("GOOGLE_HTTP_MAX_KEEPALIVE", "20"))
+    GOOGLE_HTTP_KEEPALIVE_SECONDS: float = float(os.getenv("GOOGLE_HTTP_KEEPALIVE_SECONDS", "60"))
+    GOOGLE_TOKEN_REFRESH_LEAD_SECONDS: int = int(os.getenv("GOOGLE_TOKEN_REFRESH_LEAD_SECONDS", "300"))
+    GOOGLE_TOKEN_REFRESH_INTERVAL_SECONDS: int = int(os.getenv("GOOGLE_TOKEN_REFRESH_INTERVAL_SECONDS", "60"))
+    GOOGLE_TOKEN_REFRESH_JITTER_SECONDS: int = int(os.getenv("GOOGLE_TOKEN_REFRESH_JITTER_SECONDS", "30"))
+    GOOGLE_TOKEN_REFRESH_CONCURRENCY: int = int(os.getenv("GOOGLE_TOKEN_REFRESH_CONCURRENCY", "10"))
+    GOOGLE_TOKEN_REFRESH_BATCH_SIZE: int = int(os.getenv("GOOGLE_TOKEN_REFRESH_BATCH_SIZE", "500"))
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")
+    LLM_BACKEND: str = os.getenv("LLM_BACKEND", "openai")  # "openai" or "stub"
+    STUB_LATENCY_MS: int = int(os.getenv("STUB_LATENCY_MS", "200"))
+    STUB_TOKENS_PER_SECOND: float = float(os.getenv("STUB_TOKENS_PER_SECOND", "50"))
+    STUB_FAILURE_RATE: float = float(os.getenv("STUB_FAILURE_RATE", "0"))
+    STUB_REPLY_TOKENS: int = int(os.getenv("STUB_REPLY_TOKENS", "60"))
+    STUB_RATE_LIMIT_RATE: float = float(os.getenv("STUB_RATE_LIMIT_RATE", "0"))
+    LLM_CONCURRENCY_INITIAL: int = int(os.getenv("LLM_CONCURRENCY_INITIAL", "8"))
+    LLM_CONCURRENCY_MIN: int = int(os.getenv("LLM_CONCURRENCY_MIN", "1"))
+    LLM_CONCURRENCY_MAX: int = int(os.getenv("LLM_CONCURRENCY_MAX", "64"))
+    LLM_TARGET_LATENCY_MS: int = int(os.getenv("LLM_TARGET_LATENCY_MS", "10000"))
+    LLM_MAX_QUEUE: int = int(os.getenv("LLM_MAX_QUEUE", "500"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    LLM_BACKOFF_BASE_MS: int = int(os.getenv("LLM_BACKOFF_BASE_MS", "500"))
+    LLM_BACKOFF_MAX_MS: int = int(os.getenv("LLM_BACKOFF_MAX_MS", "8000"))
     ALLOWED_ORIGINS: list = [origin.strip() for origin in os.getenv("ALLOWED_ORIGINS").split(",")]
     API_PREFIX: str = os.getenv("API_PREFIX")
     DEBUG: bool = os.getenv("DEBUG") == "True"
     SCOPES: list = os.getenv("SCOPES")
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+    # Per-model overrides, e.g. "gpt-4-turbo-2024-04-09=6000,gpt-3.5-turbo=2000"
+    CONTEXT_TOKEN_BUDGETS: dict = {
+        model.strip(): int(budget)
+        for model, budget in (item.split("=", 1) for item in os.getenv("CONTEXT_TOKEN_BUDGETS", "").split(",") if "=" in item)
+    }
+    CONTEXT_CACHE_SIZE: int = int(os.getenv("CONTEXT_CACHE_SIZE", "1024"))
+    AI_BATCH_MAX_ITEMS: int = int(os.getenv("AI_BATCH_MAX_ITEMS", "100"))
+    AI_BATCH_CONCURRENCY: int = int(os.getenv("AI_BATCH_CONCURRENCY", "8"))
+    RESPONSE_CACHE_TTL: int = int(os.getenv("RESPONSE_CACHE_TTL", "300"))  # 0 disables caching
+    RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+    PERSONA_REGISTRY_TTL: int = int(os.getenv("PERSONA_REGISTRY_TTL", "300"))
+    HISTORY_CACHE_MAX_BYTES: int = int(os.getenv("HISTORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    # Check cached histories against the database before use; only a single worker process can turn this off
+    HISTORY_CACHE_VERIFY: bool = os.getenv("HISTORY_CACHE_VERIFY", "True") == "True"
+    MESSAGE_WRITE_BEHIND: bool = os.getenv("MESSAGE_WRITE_BEHIND") == "True"
+    MESSAGE_WRITE_BATCH_SIZE: int = int(os.getenv("MESSAGE_WRITE_BATCH_SIZE", "200"))
+    MESSAGE_WRITE_FLUSH_MS: int = int(os.getenv("MESSAGE_WRITE_FLUSH_MS", "50"))
+    MESSAGE_IMPORT_CHUNK_SIZE: int = int(os.getenv("MESSAGE_IMPORT_CHUNK_SIZE", "1000"))
+    MESSAGE_IMPORT_MAX_ROWS: int = int(os.getenv("MESSAGE_IMPORT_MAX_ROWS", "100000"))
+    MESSAGE_PARTITION_MONTHS_AHEAD: int = int(os.getenv("MESSAGE_PARTITION_MONTHS_AHEAD", "3"))
+    MESSAGE_MAINTENANCE_INTERVAL_SECONDS: int = int(os.getenv("MESSAGE_MAINTENANCE_INTERVAL_SECONDS", "3600"))
+    MESSAGE_ARCHIVE_ENABLED: bool = os.getenv("MESSAGE_ARCHIVE_ENABLED") == "True"
+    MESSAGE_ARCHIVE_AFTER_DAYS: int = int(os.getenv("MESSAGE_ARCHIVE_AFTER_DAYS", "180"))
+    MESSAGE_ARCHIVE_BATCH_SIZE: int = int(os.getenv("MESSAGE_ARCHIVE_BATCH_SIZE", "200"))
 
 settings = Settings()
\ No newline at end of file
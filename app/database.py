@@ -1,24 +1,124 @@
+import os
+import time
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError, TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from .config import settings
 import asyncpg
-import databases
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
+ALEMBIC_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
 
-engine = create_async_engine(SQLALCHEMY_DATABASE_URL, echo=True)
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long checkouts wait for a free connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.checkouts, pool.timeouts = self.checkouts, self.timeouts
+        pool.wait_total, pool.wait_max = self.wait_total, self.wait_max
+        return pool
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "in_use": self.checkedout(),
+            "idle": self.checkedin(),
+            "overflow": max(0, self.overflow()),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(1000 * self.wait_total / self.checkouts, 3) if self.checkouts else 0,
+            "wait_max_ms": round(1000 * self.wait_max, 3),
+        }
+
+
+def create_engine(url: str):
+    """Creates an async engine with the pool settings from Settings."""
+    server_settings = {}
+    if settings.DATABASE_STATEMENT_TIMEOUT_MS:
+        server_settings["statement_timeout"] = str(settings.DATABASE_STATEMENT_TIMEOUT_MS)
+    return create_async_engine(
+        url,
+        echo=settings.DATABASE_ECHO,
+        poolclass=InstrumentedPool,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args={"server_settings": server_settings},
+    )
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL)
 async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
-Base = declarative_base()
+# Reads that tolerate replication lag go to the replica when one is configured
+replica_engine = create_engine(settings.DATABASE_REPLICA_URL) if settings.DATABASE_REPLICA_URL else None
+async_read_session = sessionmaker(replica_engine or engine, expire_on_commit=False, class_=AsyncSession)
 
-database = databases.Database(SQLALCHEMY_DATABASE_URL)
+Base = declarative_base()
 
 async def get_async_session() -> AsyncSession:
     async with async_session() as session:
         yield session
 
-async def connect_to_db():
-    await database.connect()
+async def get_read_session() -> AsyncSession:
+    """Session for read-only endpoints; uses the replica when DATABASE_REPLICA_URL is set."""
+    async with async_read_session() as session:
+        yield session
+
+def database_stats() -> dict:
+    """Reports connection pool usage for the primary and, if configured, the replica."""
+    stats = {"primary": engine.sync_engine.pool.stats()}
+    if replica_engine is not None:
+        stats["replica"] = replica_engine.sync_engine.pool.stats()
+    return stats
+
+async def dispose_engines():
+    await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+
+async def check_schema_version():
+    """Fails fast unless the database is at the latest migration.
+
+    The schema is managed with Alembic (``alembic upgrade head``); startup only
+    compares the stored revision with the newest migration script.
+    """
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
 
-async def close_db_connection():
-    await database.disconnect()
\ No newline at end of file
+    head = ScriptDirectory.from_config(Config(ALEMBIC_CONFIG)).get_current_head()
+    async with engine.connect() as conn:
+        try:
+            current = await conn.scalar(text("SELECT version_num FROM alembic_version"))
+        except ProgrammingError:
+            current = None
+    if current != head:
+        raise RuntimeError(
+            f"Database schema is at revision {current or 'none'} but the code expects {head}; "
+            "run `alembic upgrade head`."
+        )
@@ -13,15 +13,31 @@ from app.api.auth.manager import get_current_user
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from .config import settings
-from .database import engine, Base, get_async_session
-from app.api.auth.routes import current_active_user, fastapi_users, auth_backend, check_and_refresh_token
+from .database import get_async_session, check_schema_version, database_stats, dispose_engines
+from app.api.auth.routes import current_active_user, fastapi_users, auth_backend
+from app.api.auth.token_refresh import google_token_refresher
+from app.api.auth.google_oauth import close_http_client
+from app.api.google.gmail.contacts import contact_directory
+from app.api.google.gmail.client import gmail_services
+from app.api.google.gmail.outbox import email_outbox
+from app.api.google.gmail.ner import name_extractor
 from app.models import User
 from app.api.persona.voices import handle_voice_interaction # Import the function
+from app.api.ai.conversations.cache import history_cache
+from app.api.ai.responses import responses
+from app.api.ai.limiter import limiter
+from app.api.persona.registry import persona_registry
+from app.api.ai.conversations.writer import message_writer
+from app.api.ai.conversations.archive import message_archiver
+from app.api.auth.identity import identity_cache
 import logging
 
 logger = logging.getLogger(__name__)
 app = FastAPI(title="AI Assistant Backend")
 logging.basicConfig(level=logging.DEBUG)
+# The root logger is at DEBUG, which would log every SQL statement even with echo off
+logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO if settings.DATABASE_ECHO else logging.WARNING)
+logging.getLogger("sqlalchemy.pool").setLevel(logging.WARNING)
 # Define JWTAuthMiddleware
 class JWTAuthMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
@@ -38,10 +54,6 @@ app.include_router(fastapi_users.get_auth_router(auth_backend), prefix="/app/aut
 # Add middleware to the FastAPI instance
 app.add_middleware(JWTAuthMiddleware)
 
-@app.middleware("https")
-async def check_and_refresh_token_middleware(request: Request, call_next):
-    response = await check_and_refresh_token(request, call_next)
-    return response
 
 
 
@@ -58,13 +70,26 @@ app.mount("/static", StaticFiles(directory="app/templates"), name="static")
 
 @app.on_event("startup")
 async def startup():
-    # This will create all tables if they don't exist
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    # The schema is managed by migrations; refuse to start against an outdated one
+    await check_schema_version()
+    await persona_registry.load()
+    message_writer.start()
+    message_archiver.start()
+    google_token_refresher.start()
+    email_outbox.start()
+    if settings.NER_PRELOAD:
+        name_extractor.start_warmup()
 
 @app.on_event("shutdown")
 async def shutdown():
-    await engine.dispose()
+    # Write any queued messages before the pool goes away
+    await message_writer.stop()
+    await message_archiver.stop()
+    await email_outbox.stop()
+    await google_token_refresher.stop()
+    await close_http_client()
+    name_extractor.close()
+    await dispose_engines()
 
 # CORS Configuration
 if settings.ALLOWED_ORIGINS: 
@@ -84,6 +109,24 @@ def root(request: Request, user: User = Depends(get_current_user)):
     else:
         return templates.TemplateResponse("index.html", {"request": request})
 
+@app.get("/metrics")
+def metrics():
+    """Reports database pool, in-process cache, LLM limiter, message writer and archiver statistics."""
+    return {
+        "database": database_stats(),
+        "identity_cache": identity_cache.stats(),
+        "google_token_refresher": google_token_refresher.stats(),
+        "contact_index": contact_directory.stats(),
+        "gmail_services": gmail_services.stats(),
+        "email_outbox": email_outbox.stats(),
+        "ner": name_extractor.stats(),
+        "history_cache": history_cache.stats(),
+        "responses": responses.stats(),
+        "llm_limiter": limiter.stats(),
+        "message_writer": message_writer.stats(),
+        "message_archiver": message_archiver.stats(),
+    }
+
 # @app.websocket("/ws/voice")
 # async def websocket_endpoint(websocket: WebSocket, user: User = Depends(get_current_user)):
 #     """Handles WebSocket connections for voice interaction."""
@@ -34,9 +34,24 @@ class GoogleCredentials(Base):
     user_id = Column(UUID, ForeignKey("users.id", ondelete="CASCADE"), unique=True)
     refresh_token = Column(String, nullable=False)
     access_token = Column(String, nullable=True)  # Optional: Store the access token
-    expires_at = Column(DateTime, nullable=True)   # Optional: Store the access token expiry time
+    expires_at = Column(DateTime, nullable=True, index=True)   # Optional: Store the access token expiry time
+    # Set while a refresh scheduler worker is refreshing this token; stale claims expire
+    refresh_claimed_at = Column(DateTime, nullable=True)
+    # Consecutive failed refreshes and when the scheduler may try again
+    refresh_failures = Column(Integer, nullable=False, server_default="0", default=0)
+    next_refresh_at = Column(DateTime, nullable=True)
+    # Set when Google rejects the refresh token outright; cleared on the next sign-in
+    refresh_error = Column(String, nullable=True)
 
     user = relationship("User", back_populates="google_credentials")
+
+
+class RevokedToken(Base):
+    """A logged-out JWT, by the SHA-256 of the token, kept until the token would have expired anyway."""
+    __tablename__ = "revoked_tokens"
+
+    token_hash = Column(String(64), primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
     
 async def get_user_manager(user_db: SQLAlchemyUserDatabase):
     yield UserManager(user_db)
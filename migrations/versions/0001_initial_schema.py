@@ -0,0 +1,124 @@
+"""Initial schema, as previously created by Base.metadata.create_all
+
+Databases created by the old startup hook already have these tables; mark them
+with ``alembic stamp 0001`` and then run ``alembic upgrade head``.
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-07-01 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "personas",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("gender", sa.Enum("Male", "Female", "Other", name="gender_enum"), nullable=False),
+        sa.Column("country", sa.String(), nullable=False),
+        sa.Column("language", sa.String(), nullable=False),
+        sa.Column("role", sa.String(), nullable=False),
+        sa.Column("characteristic", sa.String(), nullable=False),
+        sa.Column("expertise", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+    op.create_index("ix_personas_id", "personas", ["id"])
+
+    op.create_table(
+        "users",
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("email", sa.String(), nullable=True),
+        sa.Column("hashed_password", sa.String(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("is_superuser", sa.Boolean(), nullable=True),
+        sa.Column("is_verified", sa.Boolean(), nullable=True),
+        sa.Column("google_id", sa.String(), nullable=True),
+        sa.Column("selected_persona_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["selected_persona_id"], ["personas.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+    op.create_index("ix_users_google_id", "users", ["google_id"], unique=True)
+
+    op.create_table(
+        "conversations",
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("user_id", postgresql.UUID(), nullable=False),
+        sa.Column("persona_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["persona_id"], ["personas.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    op.create_table(
+        "google_credentials",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", postgresql.UUID(), nullable=True),
+        sa.Column("refresh_token", sa.String(), nullable=False),
+        sa.Column("access_token", sa.String(), nullable=True),
+        sa.Column("expires_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user_id"),
+    )
+    op.create_index("ix_google_credentials_id", "google_credentials", ["id"])
+
+    op.create_table(
+        "email_drafts",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("conversation_id", postgresql.UUID(), nullable=False),
+        sa.Column("recipient_name", sa.String(), nullable=False),
+        sa.Column("user_prompt", sa.Text(), nullable=False),
+        sa.Column("subject", sa.String(), nullable=False),
+        sa.Column("body", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.ForeignKeyConstraint(["conversation_id"], ["conversations.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_email_drafts_id", "email_drafts", ["id"])
+
+    op.create_table(
+        "messages",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("conversation_id", postgresql.UUID(), nullable=False),
+        sa.Column("role", sa.String(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.ForeignKeyConstraint(["conversation_id"], ["conversations.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_messages_id", "messages", ["id"])
+
+    op.create_table(
+        "sent_emails",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("conversation_id", postgresql.UUID(), nullable=False),
+        sa.Column("email_draft_id", sa.Integer(), nullable=False),
+        sa.Column("recipient_email", sa.String(), nullable=False),
+        sa.Column("sent_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.ForeignKeyConstraint(["conversation_id"], ["conversations.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["email_draft_id"], ["email_drafts.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_sent_emails_id", "sent_emails", ["id"])
+
+
+def downgrade():
+    op.drop_table("sent_emails")
+    op.drop_table("messages")
+    op.drop_table("email_drafts")
+    op.drop_table("google_credentials")
+    op.drop_table("conversations")
+    op.drop_table("users")
+    op.drop_table("personas")
+    sa.Enum(name="gender_enum").drop(op.get_bind(), checkfirst=True)
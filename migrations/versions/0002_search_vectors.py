@@ -0,0 +1,37 @@
+"""Full-text search vectors on messages and email drafts
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-07-01 00:00:01
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("messages", sa.Column(
+        "search_vector", postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('english', content)", persisted=True)
+    ))
+    op.create_index("ix_messages_search_vector", "messages", ["search_vector"], postgresql_using="gin")
+    op.add_column("email_drafts", sa.Column(
+        "search_vector", postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('english', subject), 'A') || setweight(to_tsvector('english', body), 'B')",
+            persisted=True
+        )
+    ))
+    op.create_index("ix_email_drafts_search_vector", "email_drafts", ["search_vector"], postgresql_using="gin")
+
+
+def downgrade():
+    op.drop_index("ix_email_drafts_search_vector", table_name="email_drafts")
+    op.drop_column("email_drafts", "search_vector")
+    op.drop_index("ix_messages_search_vector", table_name="messages")
+    op.drop_column("messages", "search_vector")
@@ -0,0 +1,116 @@
+"""Partition messages by month and add the message archive
+
+Rebuilds messages as a table range-partitioned on created_at, copies the existing
+rows into monthly partitions and keeps the id sequence. The copy runs in the
+migration's transaction, so schedule it for a quiet period on large tables.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-07-01 00:00:02
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from app.config import settings
+from app.api.ai.conversations.partitions import DEFAULT_PARTITION
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+MESSAGE_COLUMNS = "id, conversation_id, role, content, created_at"
+
+
+def upgrade():
+    op.execute("ALTER TABLE messages RENAME TO messages_unpartitioned")
+    op.execute("ALTER TABLE messages_unpartitioned RENAME CONSTRAINT messages_pkey TO messages_unpartitioned_pkey")
+    op.execute("DROP INDEX ix_messages_id")
+    op.execute("DROP INDEX ix_messages_search_vector")
+    # Detach the sequence so dropping the old table keeps it
+    op.execute("ALTER TABLE messages_unpartitioned ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY NONE")
+
+    op.execute("""
+        CREATE TABLE messages (
+            id INTEGER NOT NULL DEFAULT nextval('messages_id_seq'),
+            conversation_id UUID NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+            role VARCHAR NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            search_vector TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', content)) STORED,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+
+    # Monthly partitions from the oldest message up to the months the app keeps ready ahead
+    op.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF messages DEFAULT")
+    op.execute(f"""
+        DO $$
+        DECLARE
+            month timestamp := date_trunc('month', coalesce((SELECT min(created_at) FROM messages_unpartitioned), now()));
+        BEGIN
+            WHILE month <= date_trunc('month', now()) + interval '{settings.MESSAGE_PARTITION_MONTHS_AHEAD} months' LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                    'messages_p' || to_char(month, 'YYYY_MM'), month, month + interval '1 month'
+                );
+                month := month + interval '1 month';
+            END LOOP;
+        END $$
+    """)
+
+    op.execute(f"INSERT INTO messages ({MESSAGE_COLUMNS}) SELECT {MESSAGE_COLUMNS} FROM messages_unpartitioned")
+    op.execute("DROP TABLE messages_unpartitioned")
+    op.create_index("ix_messages_conversation_id_created_at", "messages", ["conversation_id", "created_at"])
+    op.create_index("ix_messages_search_vector", "messages", ["search_vector"], postgresql_using="gin")
+
+    op.create_table(
+        "message_archives",
+        sa.Column("conversation_id", postgresql.UUID(), nullable=False),
+        sa.Column("message_count", sa.Integer(), nullable=False),
+        sa.Column("last_message_at", sa.DateTime(), nullable=False),
+        sa.Column("last_message_preview", sa.Text(), nullable=True),
+        sa.Column("payload", sa.LargeBinary(), nullable=False),
+        sa.Column("archived_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.ForeignKeyConstraint(["conversation_id"], ["conversations.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("conversation_id"),
+    )
+    op.execute("ANALYZE messages")
+
+
+def downgrade():
+    # Refuse to drop archived messages; restore them by reading the conversations first
+    op.execute("""
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM message_archives) THEN
+                RAISE EXCEPTION 'Archived conversations must be restored before downgrading.';
+            END IF;
+        END $$
+    """)
+    op.drop_table("message_archives")
+
+    op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+    op.execute("ALTER TABLE messages_partitioned RENAME CONSTRAINT messages_pkey TO messages_partitioned_pkey")
+    op.execute("DROP INDEX ix_messages_conversation_id_created_at")
+    op.execute("DROP INDEX ix_messages_search_vector")
+    op.execute("ALTER TABLE messages_partitioned ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY NONE")
+
+    op.execute("""
+        CREATE TABLE messages (
+            id INTEGER NOT NULL DEFAULT nextval('messages_id_seq') PRIMARY KEY,
+            conversation_id UUID NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+            role VARCHAR NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            search_vector TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', content)) STORED
+        )
+    """)
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    op.execute(f"INSERT INTO messages ({MESSAGE_COLUMNS}) SELECT {MESSAGE_COLUMNS} FROM messages_partitioned")
+    op.execute("DROP TABLE messages_partitioned")
+    op.create_index("ix_messages_id", "messages", ["id"])
+    op.create_index("ix_messages_search_vector", "messages", ["search_vector"], postgresql_using="gin")
@@ -0,0 +1,32 @@
+"""Indexes for the per-user conversation listing and per-conversation drafts and sent emails
+
+Built concurrently, so they can be applied without blocking writes.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-07-01 00:00:03
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ("ix_conversations_user_id_created_at", "conversations", ["user_id", "created_at", "id"]),
+    ("ix_email_drafts_conversation_id", "email_drafts", ["conversation_id"]),
+    ("ix_sent_emails_conversation_id", "sent_emails", ["conversation_id"]),
+)
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
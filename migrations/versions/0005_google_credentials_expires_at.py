@@ -0,0 +1,26 @@
+"""Index Google credentials by access token expiry for the refresh scheduler
+
+Built concurrently, so it can be applied without blocking logins.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-07-01 00:00:04
+"""
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index("ix_google_credentials_expires_at", "google_credentials", ["expires_at"],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_google_credentials_expires_at", table_name="google_credentials",
+                      postgresql_concurrently=True, if_exists=True)
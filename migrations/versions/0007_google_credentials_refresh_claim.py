@@ -0,0 +1,23 @@
+"""Lease column for the Google token refresh scheduler
+
+Nullable with no default, so adding it does not rewrite the table.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2024-07-01 00:00:06
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("google_credentials", sa.Column("refresh_claimed_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("google_credentials", "refresh_claimed_at")
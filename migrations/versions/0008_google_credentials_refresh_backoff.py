@@ -0,0 +1,28 @@
+"""Refresh backoff columns for the Google token refresh scheduler
+
+Keeps failure counts and the next attempt time in the database so every worker
+honours the same backoff, and marks refresh tokens Google has revoked.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2024-07-01 00:00:07
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("google_credentials", sa.Column("refresh_failures", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("google_credentials", sa.Column("next_refresh_at", sa.DateTime(), nullable=True))
+    op.add_column("google_credentials", sa.Column("refresh_error", sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("google_credentials", "refresh_error")
+    op.drop_column("google_credentials", "next_refresh_at")
+    op.drop_column("google_credentials", "refresh_failures")
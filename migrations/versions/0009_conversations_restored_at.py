@@ -0,0 +1,23 @@
+"""Restore time on conversations, so restored conversations are not archived straight back
+
+Nullable with no default, so adding it does not rewrite the table.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2024-07-01 00:00:08
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("conversations", sa.Column("restored_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("conversations", "restored_at")
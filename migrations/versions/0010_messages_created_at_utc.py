@@ -0,0 +1,24 @@
+"""Default messages.created_at to UTC
+
+The column is a naive timestamp and bulk ingest stores client timestamps converted
+to UTC, so the default must not depend on the session time zone. Existing rows are
+left as they are; on servers already running in UTC nothing changes.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2024-07-01 00:00:09
+"""
+from alembic import op
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE messages ALTER COLUMN created_at SET DEFAULT timezone('UTC', now())")
+
+
+def downgrade():
+    op.execute("ALTER TABLE messages ALTER COLUMN created_at SET DEFAULT now()")
@@ -0,0 +1,262 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from app.api.ai import context as context_module
+from app.api.ai.backends import LLMRateLimitError
+from app.api.ai.context import ConversationContext, load_context
+from app.api.ai.limiter import AdaptiveLimiter, LLMOverloadedError
+from app.api.ai.responses import ResponseLayer, response_key
+
+pytestmark = pytest.mark.anyio
+
+
+def make_limiter(**overrides):
+    options = dict(initial=4, min_limit=1, max_limit=8, target_latency_ms=1000, max_queue=10,
+                   max_retries=2, backoff_base_ms=0, backoff_max_ms=0)
+    options.update(overrides)
+    return AdaptiveLimiter(**options)
+
+
+async def test_limit_grows_additively_on_fast_calls():
+    limiter = make_limiter(initial=4)
+
+    async def fast():
+        return "ok"
+
+    for _ in range(4):
+        assert await limiter.run("user", fast) == "ok"
+    # About one slot per `limit` calls under the target latency
+    assert 4.9 < limiter.limit < 5
+    assert limiter.in_flight == 0
+
+
+async def test_limit_shrinks_on_slow_calls():
+    limiter = make_limiter(initial=4)
+    limiter._record_latency(limiter.target_latency * 2)
+    assert limiter.limit == pytest.approx(3.6)
+
+
+async def test_rate_limit_halves_the_limit_and_retries():
+    limiter = make_limiter(initial=8)
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise LLMRateLimitError("429")
+        return "ok"
+
+    assert await limiter.run("user", flaky) == "ok"
+    assert len(calls) == 2
+    assert limiter.rate_limited == 1
+    assert limiter.retries == 1
+    # Halved to 4 by the 429, then one slot's worth of growth from the fast retry
+    assert limiter.limit == pytest.approx(4 + 1 / 4)
+
+
+async def test_limit_never_drops_below_minimum():
+    limiter = make_limiter(initial=2, min_limit=1)
+    for _ in range(5):
+        limiter._record_rate_limited()
+    assert limiter.limit == 1
+
+
+async def test_rate_limit_is_raised_after_the_last_retry():
+    limiter = make_limiter(max_retries=1)
+
+    async def always_limited():
+        raise LLMRateLimitError("429")
+
+    with pytest.raises(LLMRateLimitError):
+        await limiter.run("user", always_limited)
+    assert limiter.in_flight == 0
+
+
+async def test_waiting_users_are_served_round_robin():
+    limiter = make_limiter(initial=1, max_limit=1)
+    release = asyncio.Event()
+    order = []
+
+    async def hold():
+        await release.wait()
+
+    def record(name):
+        async def call():
+            order.append(name)
+        return call
+
+    holder = asyncio.create_task(limiter.run("busy", hold))
+    await asyncio.sleep(0)
+    waiters = [
+        asyncio.create_task(limiter.run(user, record(name)))
+        for user, name in [("busy", "busy-1"), ("busy", "busy-2"), ("other", "other-1")]
+    ]
+    await asyncio.sleep(0)
+    assert limiter.queue_depth == 3
+    release.set()
+    await asyncio.gather(holder, *waiters)
+    assert order == ["busy-1", "other-1", "busy-2"]
+
+
+async def test_full_queue_rejects_new_calls():
+    limiter = make_limiter(initial=1, max_limit=1, max_queue=1)
+    release = asyncio.Event()
+
+    async def hold():
+        await release.wait()
+
+    holder = asyncio.create_task(limiter.run("a", hold))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(limiter.run("b", hold))
+    await asyncio.sleep(0)
+    with pytest.raises(LLMOverloadedError):
+        await limiter.run("c", hold)
+    assert limiter.rejected == 1
+    release.set()
+    await asyncio.gather(holder, waiter)
+
+
+async def test_concurrent_identical_calls_share_one_upstream_call():
+    layer = ResponseLayer(ttl=0, maxsize=10)
+    started = asyncio.Event()
+    release = asyncio.Event()
+    calls = []
+
+    async def create():
+        calls.append(1)
+        started.set()
+        await release.wait()
+        return "reply"
+
+    first = asyncio.create_task(layer.get("key", create))
+    await started.wait()
+    second = asyncio.create_task(layer.get("key", create))
+    await asyncio.sleep(0)
+    release.set()
+    assert await first == ("reply", False)
+    assert await second == ("reply", True)
+    assert len(calls) == 1
+    assert layer.coalesced == 1
+    assert layer.stats()["in_flight"] == 0
+
+
+async def test_coalesced_callers_see_the_upstream_error():
+    layer = ResponseLayer(ttl=0, maxsize=10)
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def create():
+        started.set()
+        await release.wait()
+        raise RuntimeError("upstream failed")
+
+    first = asyncio.create_task(layer.get("key", create))
+    await started.wait()
+    second = asyncio.create_task(layer.get("key", create))
+    await asyncio.sleep(0)
+    release.set()
+    for task in (first, second):
+        with pytest.raises(RuntimeError, match="upstream failed"):
+            await task
+
+
+async def test_waiter_takes_over_when_the_owner_is_cancelled():
+    layer = ResponseLayer(ttl=0, maxsize=10)
+    started = asyncio.Event()
+    calls = []
+
+    async def hang():
+        calls.append("hang")
+        started.set()
+        await asyncio.Event().wait()
+
+    async def create():
+        calls.append("create")
+        return "reply"
+
+    owner = asyncio.create_task(layer.get("key", hang))
+    await started.wait()
+    waiter = asyncio.create_task(layer.get("key", create))
+    await asyncio.sleep(0)
+    owner.cancel()
+    assert await waiter == ("reply", False)
+    assert calls == ["hang", "create"]
+
+
+async def test_only_cacheable_results_are_cached():
+    layer = ResponseLayer(ttl=60, maxsize=10)
+    calls = []
+
+    async def create():
+        calls.append(1)
+        return len(calls)
+
+    assert await layer.get("random", create) == (1, False)
+    assert await layer.get("random", create) == (2, False)
+    assert await layer.get("deterministic", create, cacheable=True) == (3, False)
+    assert await layer.get("deterministic", create, cacheable=True) == (3, True)
+    assert layer.cache_hits == 1
+
+
+def test_response_key_depends_on_context_prompt_and_parameters():
+    context = [{"role": "user", "content": "hi"}]
+    key = response_key(1, context, "hello", model="m", temperature=0)
+    assert key == response_key(1, list(context), "hello", temperature=0, model="m")
+    assert key != response_key(1, context, "hello!", model="m", temperature=0)
+    assert key != response_key(1, [], "hello", model="m", temperature=0)
+    assert key != response_key(1, context, "hello", model="m", temperature=0.5)
+
+
+@pytest.fixture
+def word_tokens(monkeypatch):
+    """Counts one token per word, so budgets do not depend on whether tiktoken is installed."""
+    monkeypatch.setattr(context_module, "count_tokens", lambda text, model: len(text.split()))
+
+
+def message(message_id: int, content: str, role: str = "user") -> dict:
+    return {"id": message_id, "role": role, "content": content}
+
+
+async def test_context_drops_the_oldest_turns_over_budget(word_tokens):
+    # Three words plus the per-message overhead; two messages fit in the budget
+    context = ConversationContext("model", budget=2 * (3 + context_module.MESSAGE_TOKEN_OVERHEAD))
+    for message_id, content in enumerate(["one two three", "four five six", "seven eight nine"], start=1):
+        context.append(message_id, "user", content)
+    assert [chat["content"] for chat in context.to_chat_messages()] == ["four five six", "seven eight nine"]
+    assert context.total_tokens == context.budget
+
+
+async def test_context_ignores_messages_it_has_already_seen(word_tokens):
+    context = ConversationContext("model", budget=100)
+    context.append(1, "user", "hello")
+    context.append(2, "Ada", "hi there")
+    context.append(2, "Ada", "hi there")
+    context.append(1, "user", "hello")
+    assert context.to_chat_messages() == [
+        {"role": "user", "content": "hello"},
+        {"role": "assistant", "content": "hi there"},
+    ]
+    assert context.total_tokens == 3 + 2 * context_module.MESSAGE_TOKEN_OVERHEAD
+
+
+async def test_context_is_extended_at_the_tail_and_rebuilt_on_other_changes(word_tokens, monkeypatch):
+    history = [message(1, "first"), message(2, "second")]
+
+    async def get_conversation_messages(db, conversation_id):
+        return list(history)
+
+    monkeypatch.setattr(context_module, "get_conversation_messages", get_conversation_messages)
+    conversation_id = uuid4()
+    context = await load_context(None, conversation_id, "model")
+
+    history.append(message(3, "third"))
+    assert await load_context(None, conversation_id, "model") is context
+    assert [chat["content"] for chat in context.to_chat_messages()] == ["first", "second", "third"]
+
+    # An older message appears in the middle, e.g. from an import; appending it would misorder the window
+    history.insert(1, message(4, "imported"))
+    rebuilt = await load_context(None, conversation_id, "model")
+    assert rebuilt is not context
+    assert [chat["content"] for chat in rebuilt.to_chat_messages()] == ["first", "imported", "second", "third"]
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi_users.jwt import generate_jwt
+
+from app.api.auth import identity as identity_module
+from app.api.auth.identity import JWT_AUDIENCE, IdentityCache, _token_key
+from app.config import settings
+
+pytestmark = pytest.mark.anyio
+
+
+def make_token(user_id: str = "6f1c0b9e-0000-4000-8000-000000000001") -> str:
+    return generate_jwt({"sub": user_id, "aud": JWT_AUDIENCE}, settings.JWT_SECRET_KEY, 3600,
+                        algorithm=settings.JWT_ALGORITHM)
+
+
+async def test_logout_saves_the_revocation_for_every_worker(fake_session):
+    session = fake_session(identity_module)
+    cache = IdentityCache(ttl=60, maxsize=100)
+    token = make_token()
+    await cache.revoke(token)
+
+    assert await cache._resolve_token(token) is None
+    saved, cleanup = session.committed
+    assert (saved.kind, saved.table) == ("insert", "revoked_tokens")
+    assert saved.values["token_hash"] == _token_key(token)
+    assert saved.values["expires_at"] > datetime.utcnow() + timedelta(minutes=59)
+    assert (cleanup.kind, cleanup.table) == ("delete", "revoked_tokens")
+
+
+async def test_a_token_revoked_by_another_worker_is_rejected(fake_session):
+    session = fake_session(identity_module, rows=[datetime.utcnow() + timedelta(hours=1)])
+    cache = IdentityCache(ttl=60, maxsize=100)
+    token = make_token()
+
+    assert await cache._resolve_token(token) is None
+    assert cache.stats()["revoked"] == 1
+    # Remembered, so the next request does not ask the database again
+    session.result = lambda statement, params: pytest.fail("queried the database again")
+    assert await cache._resolve_token(token) is None
+
+
+async def test_revoking_an_invalid_token_writes_nothing(fake_session):
+    session = fake_session(identity_module)
+    await IdentityCache(ttl=60, maxsize=100).revoke("not a token")
+    assert session.writes == []
@@ -0,0 +1,228 @@
+import asyncio
+import base64
+import json
+import sys
+from datetime import datetime
+from types import SimpleNamespace
+from uuid import UUID, uuid4
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.api.ai.conversations import service as service_module
+from app.api.ai.conversations import writer as writer_module
+from app.api.ai.conversations.cache import MESSAGE_OVERHEAD_BYTES, ConversationHistoryCache
+from app.api.ai.conversations.export import decode_export_cursor
+from app.api.ai.conversations.routes import export_conversation_archive
+from app.api.ai.conversations.service import decode_cursor, encode_cursor, get_conversation_messages
+from app.api.ai.conversations.writer import MessageWriter
+from tests.conftest import FakeSession
+
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def test_cursor_round_trip():
+    created_at, conversation_id = datetime(2024, 7, 1, 12, 30, 15, 123456), uuid4()
+    cursor = encode_cursor(created_at, conversation_id)
+    assert decode_cursor(cursor, datetime.fromisoformat, UUID) == (created_at, conversation_id)
+    assert decode_cursor(encode_cursor(42), int) == (42,)
+    assert decode_cursor(encode_cursor(0.5, "message", 7), float, str, int) == (0.5, "message", 7)
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+    base64.urlsafe_b64encode(b"not json").decode(),
+    raw_cursor({"created_at": "2024-07-01"}),
+    raw_cursor(["2024-07-01T00:00:00"]),
+    raw_cursor(["2024-07-01T00:00:00", str(uuid4()), "extra"]),
+    raw_cursor(["yesterday", str(uuid4())]),
+    raw_cursor(["2024-07-01T00:00:00", "not-a-uuid"]),
+    raw_cursor([None, str(uuid4())]),
+])
+def test_malformed_cursor_is_a_bad_request(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, datetime.fromisoformat, UUID)
+    assert error.value.status_code == 400
+
+
+def test_non_integer_message_cursor_is_a_bad_request():
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(raw_cursor(["12abc"]), int)
+    assert error.value.status_code == 400
+
+
+def test_export_cursor_round_trip():
+    created_at, conversation_id = datetime(2024, 7, 1), uuid4()
+    assert decode_export_cursor(encode_cursor(created_at, conversation_id)) == (created_at, conversation_id)
+
+
+@pytest.mark.anyio
+async def test_export_rejects_a_bad_cursor_before_streaming():
+    user = SimpleNamespace(id=uuid4())
+    with pytest.raises(HTTPException) as error:
+        await export_conversation_archive(cursor=raw_cursor(["2024-07-01T00:00:00", "nope"]), gzip=False, user=user)
+    assert error.value.status_code == 400
+
+
+@pytest.fixture
+def message_table(fake_session, monkeypatch):
+    """A FakeSession for the message writer that assigns ids and rejects rows with content ``reject``."""
+    def install(failures=(), reject=None):
+        ids = iter(range(1, 1000))
+
+        def insert_messages(statement, rows):
+            if any(row["content"] == reject for row in rows):
+                raise IntegrityError("INSERT INTO messages", {}, Exception("rejected"))
+            return [SimpleNamespace(id=next(ids), created_at=datetime(2024, 7, 1), **row) for row in rows]
+
+        monkeypatch.setattr(writer_module, "RETRY_BACKOFF_BASE", 0.001)
+        return fake_session(writer_module, failures=failures, result=insert_messages)
+    return install
+
+
+def contents(writes: list) -> list:
+    return [[row["content"] for row in write.rows] for write in writes]
+
+
+@pytest.mark.anyio
+async def test_writer_retries_a_failed_batch_until_it_commits(message_table):
+    database = message_table(failures=[OperationalError("INSERT", {}, Exception("down"))] * 2)
+    writer = MessageWriter(enabled=True, batch_size=10, flush_interval_ms=1)
+    writer.start()
+    conversation_id = uuid4()
+    futures = [writer.enqueue(conversation_id, "user", content) for content in ("one", "two")]
+    messages = await asyncio.wait_for(asyncio.gather(*futures), timeout=5)
+    await writer.stop()
+
+    assert [message.content for message in messages] == ["one", "two"]
+    assert contents(database.writes) == [["one", "two"]] * 3
+    assert contents(database.committed) == [["one", "two"]]
+    assert writer.retries == 2
+    assert writer.rows_written == 2
+    assert writer.rows_failed == 0
+
+
+@pytest.mark.anyio
+async def test_writer_fails_only_the_rejected_rows(message_table):
+    database = message_table(reject="bad")
+    writer = MessageWriter(enabled=True, batch_size=10, flush_interval_ms=1)
+    writer.start()
+    conversation_id = uuid4()
+    futures = [writer.enqueue(conversation_id, "user", content) for content in ("one", "bad", "three")]
+    results = await asyncio.wait_for(asyncio.gather(*futures, return_exceptions=True), timeout=5)
+    await writer.stop()
+
+    assert results[0].content == "one"
+    assert isinstance(results[1], IntegrityError)
+    assert results[2].content == "three"
+    # The batch, then its rows one at a time, in order
+    assert contents(database.writes) == [["one", "bad", "three"], ["one"], ["bad"], ["three"]]
+    assert contents(database.committed) == [["one"], ["three"]]
+    assert writer.rows_failed == 1
+
+
+@pytest.mark.anyio
+async def test_writer_gives_up_at_shutdown_when_the_database_stays_down(message_table):
+    database = message_table(failures=[OperationalError("INSERT", {}, Exception("down"))] * 100)
+    writer = MessageWriter(enabled=True, batch_size=10, flush_interval_ms=1000)
+    writer.start()
+    future = writer.enqueue(uuid4(), "user", "lost")
+    await asyncio.wait_for(writer.stop(), timeout=5)
+
+    assert future.done()
+    with pytest.raises(RuntimeError):
+        future.result()
+    assert database.committed == []
+    assert writer.rows_failed == 1
+
+
+def make_message(message_id: int, content: str = "hi", conversation_id="conversation") -> SimpleNamespace:
+    return SimpleNamespace(id=message_id, conversation_id=conversation_id, role="user", content=content,
+                           created_at=datetime(2024, 7, 1, 0, 0, message_id))
+
+
+def history_bytes(*contents) -> int:
+    return sum(MESSAGE_OVERHEAD_BYTES + sys.getsizeof(content) for content in contents)
+
+
+def test_history_cache_evicts_the_least_recently_used_conversation_over_its_byte_budget():
+    cache = ConversationHistoryCache(max_bytes=history_bytes("hi") * 2)
+    cache.set("a", [make_message(1)])
+    cache.set("b", [make_message(2)])
+    assert cache.get("a") is not None
+    cache.set("c", [make_message(3)])
+
+    assert cache.get("b") is None
+    assert [message["id"] for message in cache.get("a")] == [1]
+    assert [message["id"] for message in cache.get("c")] == [3]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_history_cache_append_skips_messages_it_already_has():
+    cache = ConversationHistoryCache(max_bytes=10_000)
+    cache.set("a", [make_message(1), make_message(2)])
+    cache.append("a", [make_message(2), make_message(3)])
+    cache.append("uncached", [make_message(4)])
+
+    assert [message["id"] for message in cache.get("a")] == [1, 2, 3]
+    assert cache.get("a").size == history_bytes("hi", "hi", "hi")
+    assert cache.get("uncached") is None
+
+
+def test_history_cache_drops_a_conversation_that_grows_past_the_budget():
+    cache = ConversationHistoryCache(max_bytes=history_bytes("hi") * 3)
+    cache.set("a", [make_message(1)])
+    cache.append("a", [make_message(2, content="x" * 10_000)])
+
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_history_cache_stats():
+    cache = ConversationHistoryCache(max_bytes=10_000)
+    cache.set("a", [make_message(1), make_message(2)])
+    cache.get("a")
+    cache.get("a")
+    cache.get("b")
+
+    assert cache.stats() == {
+        "hits": 2,
+        "misses": 1,
+        "hit_ratio": 2 / 3,
+        "evictions": 0,
+        "conversations": 1,
+        "bytes": history_bytes("hi", "hi"),
+        "max_bytes": 10_000,
+    }
+
+
+@pytest.mark.anyio
+async def test_a_cached_history_that_no_longer_matches_the_database_is_reloaded(monkeypatch):
+    cache = ConversationHistoryCache(max_bytes=10_000)
+    monkeypatch.setattr(service_module, "history_cache", cache)
+
+    async def restore(db, conversation_ids):
+        return 0
+
+    monkeypatch.setattr(service_module.message_archiver, "restore", restore)
+    cache.set("a", [make_message(1)])
+    # Another worker has written message 2
+    database = [make_message(1, conversation_id="a"), make_message(2, conversation_id="a")]
+
+    def result(statement, params):
+        if statement.column_descriptions[0]["name"] == "Message":
+            return database
+        return [("a", len(database), database[-1].created_at)]
+
+    messages = await get_conversation_messages(FakeSession(result=result), "a")
+    assert [message["id"] for message in messages] == [1, 2]
+    assert cache.fingerprint("a") == (2, database[-1].created_at)
+
+    # Matching fingerprints are served from the cache
+    database.append(make_message(3, conversation_id="a"))
+    cached = cache.set("a", database)
+    assert await get_conversation_messages(FakeSession(result=result), "a") is cached
@@ -0,0 +1,302 @@
+import asyncio
+import hashlib
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from app.api.google.gmail import outbox as outbox_module
+from app.api.google.gmail.contacts import RECENCY_HALF_LIFE, ContactIndex, _edit_distance
+from app.api.google.gmail.ner import NameExtractor
+from app.api.google.gmail.outbox import EmailOutbox, UserRateLimiter, new_idempotency_key, outbox_message_id
+
+pytestmark = pytest.mark.anyio
+
+
+def make_outbox(**overrides):
+    options = dict(workers=1, batch_size=10, poll_interval=0.01, max_attempts=3, backoff_base=1,
+                   backoff_max=60, sending_timeout=300, rate_limiter=UserRateLimiter(rate=1000, burst=1000))
+    options.update(overrides)
+    return EmailOutbox(**options)
+
+
+def make_job(**overrides):
+    job = dict(id=1, user_id="user", conversation_id="conversation", email_draft_id=2,
+               idempotency_key=new_idempotency_key(), sender="me@example.com", recipient_email="you@example.com",
+               subject="Hello", body="Hi", attempts=0)
+    job.update(overrides)
+    return SimpleNamespace(**job)
+
+
+def http_error(status: int) -> HttpError:
+    return HttpError(httplib2.Response({"status": status}), b"error")
+
+
+@pytest.fixture
+def session(fake_session):
+    return lambda **options: fake_session(outbox_module, **options)
+
+
+async def test_claim_marks_the_claimed_jobs_sending(session):
+    fake = session(rows=[make_job(id=1), make_job(id=2)])
+    jobs = await make_outbox()._claim()
+    assert [job.id for job in jobs] == [1, 2]
+
+    [claim] = fake.committed
+    assert (claim.kind, claim.table, claim.where) == ("update", "email_outbox", {"id": [1, 2]})
+    assert claim.values["status"] == "sending"
+    assert {"attempts", "updated_at"} <= claim.values.keys()
+    # Stamped by the database, not the application's clock
+    assert not isinstance(claim.values["updated_at"], datetime)
+
+
+async def test_claim_with_nothing_due_changes_nothing(session):
+    fake = session(rows=[])
+    assert await make_outbox()._claim() == []
+    assert fake.writes == []
+    assert fake.commits == 1
+
+
+async def test_transient_failure_is_requeued_with_backoff(session):
+    fake = session()
+    outbox = make_outbox()
+    status = await outbox.record_failure(make_job(id=5), attempt=1, error=http_error(503))
+    assert status == "queued"
+    assert outbox.retried == 1
+
+    [failure] = fake.committed
+    assert failure.where == {"id": 5}
+    assert failure.values["status"] == "queued"
+    assert "503" in failure.values["last_error"]
+    assert not isinstance(failure.values["next_attempt_at"], datetime)
+
+
+async def test_permanent_failure_is_not_retried(session):
+    fake = session()
+    outbox = make_outbox()
+    assert await outbox.record_failure(make_job(id=5), attempt=1, error=http_error(400)) == "failed"
+    assert outbox.failed == 1
+
+    [failure] = fake.committed
+    assert failure.values["status"] == "failed"
+    assert "next_attempt_at" not in failure.values
+
+
+async def test_sent_jobs_and_their_sent_emails_are_saved_together(session):
+    fake = session()
+    outbox = make_outbox()
+    await outbox.record_sent([(make_job(id=1, email_draft_id=10), "gmail-1"), (make_job(id=2, email_draft_id=20), "gmail-2")])
+    assert outbox.sent == 2
+
+    mark, sent_emails = fake.committed
+    assert (mark.table, mark.where, mark.values["status"]) == ("email_outbox", {"id": [1, 2]}, "sent")
+    assert (sent_emails.kind, sent_emails.table) == ("insert", "sent_emails")
+    assert [row["email_draft_id"] for row in sent_emails.rows] == [10, 20]
+    assert fake.commits == 1
+
+
+async def test_failure_on_the_last_attempt_gives_up(session):
+    session()
+    outbox = make_outbox(max_attempts=3)
+    assert await outbox.record_failure(make_job(), attempt=3, error=http_error(503)) == "failed"
+    assert outbox.failed == 1 and outbox.retried == 0
+
+
+async def test_deliver_records_the_outcome_of_the_next_attempt(monkeypatch):
+    outbox = make_outbox()
+    recorded = []
+
+    async def send(job, attempt):
+        if job.id == 2:
+            raise http_error(503)
+        return f"gmail-{job.id}"
+
+    async def record_sent(sent):
+        recorded.extend(("sent", job.id, gmail_message_id) for job, gmail_message_id in sent)
+
+    async def record_failure(job, attempt, error):
+        recorded.append(("failed", job.id, attempt))
+        return "queued"
+
+    monkeypatch.setattr(outbox, "send", send)
+    monkeypatch.setattr(outbox, "record_sent", record_sent)
+    monkeypatch.setattr(outbox, "record_failure", record_failure)
+    await outbox._deliver(make_job(id=1, attempts=1))
+    await outbox._deliver(make_job(id=2, attempts=2))
+    assert recorded == [("sent", 1, "gmail-1"), ("failed", 2, 3)]
+
+
+async def test_retry_finds_an_earlier_send_by_message_id(session, monkeypatch):
+    session()
+    outbox = make_outbox()
+    service = object()
+    lookups = []
+
+    async def gmail_service_for(db, user_id):
+        return service
+
+    def find_sent(found_service, message_id):
+        lookups.append(message_id)
+        return "already-sent"
+
+    monkeypatch.setattr(outbox_module, "gmail_service_for", gmail_service_for)
+    monkeypatch.setattr(outbox, "_find_sent", find_sent)
+    job = make_job(id=7)
+    assert await outbox.send(job, attempt=2) == "already-sent"
+    assert outbox.deduplicated == 1
+    assert lookups == [outbox_message_id(job)]
+
+
+def test_message_id_is_built_from_a_hash_of_the_idempotency_key():
+    job = make_job(id=7, idempotency_key="merge <42> for bob@example.com")
+    message_id = outbox_message_id(job)
+    assert message_id == f"<outbox-7-{hashlib.sha256(job.idempotency_key.encode()).hexdigest()[:16]}@example.com>"
+    assert " " not in message_id and message_id.count("@") == 1
+    assert "<" not in message_id[1:-1] and ">" not in message_id[1:-1]
+    assert outbox_message_id(make_job(id=7, idempotency_key="merge <43> for bob@example.com")) != message_id
+
+
+async def test_merge_claim_fails_once_a_worker_has_the_job(session):
+    session(rows=[])
+    assert await make_outbox().claim_merged(1) is False
+    fake = session(rows=[SimpleNamespace(id=1)])
+    assert await make_outbox().claim_merged(1) is True
+
+    [claim] = fake.committed
+    assert claim.where == {"id": 1, "status": "merging"}
+    assert claim.values["status"] == "sending"
+
+
+async def test_rate_limiter_throttles_after_the_burst():
+    limiter = UserRateLimiter(rate=1000, burst=2)
+    for _ in range(3):
+        await asyncio.wait_for(limiter.acquire("user"), timeout=1)
+    assert limiter.throttled == 1
+    await limiter.acquire("other")
+    assert limiter.throttled == 1
+
+
+def test_default_idempotency_keys_never_repeat():
+    assert new_idempotency_key() != new_idempotency_key()
+
+
+def contact_index(*messages, own_email="me@example.com") -> ContactIndex:
+    """Builds an index from ``(From header, seconds ago)`` pairs."""
+    index = ContactIndex()
+    index.own_email = own_email
+    for sender, age in messages:
+        index.add_message({
+            "internalDate": str(int((time.time() - age) * 1000)),
+            "payload": {"headers": [{"name": "From", "value": sender}, {"name": "To", "value": own_email}]},
+        })
+    return index
+
+
+def emails(results: list) -> list:
+    return [result["email"] for result in results]
+
+
+def test_edit_distance_counts_an_adjacent_transposition_as_one_edit():
+    assert _edit_distance("jhon", "john", 2) == 1
+    assert _edit_distance("abcd", "acbd", 2) == 1
+    assert _edit_distance("john", "jon", 2) == 1
+    assert _edit_distance("john", "john", 2) == 0
+
+
+def test_edit_distance_gives_up_past_the_limit():
+    assert _edit_distance("abcdef", "uvwxyz", 2) == 3
+    assert _edit_distance("ab", "abcdef", 2) == 3
+
+
+def test_contact_search_ranks_prefix_then_substring_then_typo_matches():
+    index = contact_index(("Anmol Rao <anmol@example.com>", 0), ("Joann Smith <joann@example.com>", 0),
+                          ("Annabel Lee <annabel@example.com>", 0))
+    assert emails(index.search("ann", 10)) == ["annabel@example.com", "joann@example.com", "anmol@example.com"]
+
+
+def test_contact_search_prefers_frequent_then_recent_contacts():
+    index = contact_index(("Sam Once <sam.once@example.com>", 0),
+                          *[("Sam Often <sam.often@example.com>", 0)] * 5)
+    assert emails(index.search("sam", 10)) == ["sam.often@example.com", "sam.once@example.com"]
+
+    index = contact_index(("Sam Old <sam.old@example.com>", 2 * RECENCY_HALF_LIFE),
+                          ("Sam New <sam.new@example.com>", 0))
+    assert emails(index.search("sam", 10)) == ["sam.new@example.com", "sam.old@example.com"]
+
+
+def test_contact_search_never_returns_the_users_own_address():
+    index = contact_index(("Me Myself <me@example.com>", 0), ("Mei <mei@example.com>", 0))
+    assert emails(index.search("me", 10)) == ["mei@example.com"]
+
+
+def test_contact_search_only_tolerates_typos_in_queries_of_three_letters_or_more():
+    index = contact_index(("Bob Stone <bob@example.com>", 0))
+    assert index.search("bp", 10) == []
+    assert emails(index.search("bpb", 10)) == ["bob@example.com"]
+
+
+class FakeNLP:
+    """Stands in for a spaCy pipeline: capitalised words are PERSON entities. Records each ``pipe`` call."""
+
+    def __init__(self):
+        self.batches = []
+
+    def pipe(self, prompts, batch_size):
+        self.batches.append(list(prompts))
+        for prompt in prompts:
+            yield SimpleNamespace(ents=[
+                SimpleNamespace(text=word, label_="PERSON") for word in prompt.split() if word[:1].isupper()
+            ])
+
+
+def make_extractor(nlp=None, **overrides) -> NameExtractor:
+    options = dict(model="fake", batch_size=8, batch_wait_ms=10, cache_size=100)
+    options.update(overrides)
+    extractor = NameExtractor(**options)
+    extractor._nlp = nlp
+    return extractor
+
+
+async def test_concurrent_identical_prompts_share_one_run():
+    nlp = FakeNLP()
+    extractor = make_extractor(nlp)
+    results = await asyncio.gather(*(extractor.extract("email Alice about lunch") for _ in range(3)))
+    assert results == [["Alice"]] * 3
+    assert nlp.batches == [["email Alice about lunch"]]
+
+    assert await extractor.extract("email Alice about lunch") == ["Alice"]
+    assert len(nlp.batches) == 1
+    assert (extractor.hits, extractor.misses) == (1, 3)
+    extractor.close()
+
+
+async def test_concurrent_prompts_are_processed_in_batches():
+    nlp = FakeNLP()
+    extractor = make_extractor(nlp, batch_size=2)
+    results = await asyncio.gather(extractor.extract("to Alice"), extractor.extract("to Bob"),
+                                   extractor.extract("to Carol"))
+    assert results == [["Alice"], ["Bob"], ["Carol"]]
+    assert nlp.batches == [["to Alice", "to Bob"], ["to Carol"]]
+    assert extractor.batches == 2
+    extractor.close()
+
+
+async def test_a_model_that_fails_to_load_fails_every_waiter(monkeypatch):
+    extractor = make_extractor()
+
+    def load():
+        raise OSError("model not installed")
+
+    monkeypatch.setattr(extractor, "_load", load)
+    results = await asyncio.wait_for(
+        asyncio.gather(extractor.extract("to Alice"), extractor.extract("to Alice"), extractor.extract("to Bob"),
+                       return_exceptions=True),
+        timeout=5
+    )
+    assert all(isinstance(result, OSError) for result in results)
+    assert extractor.stats()["queued"] == 0
+    assert not extractor._pending
+    extractor.close()